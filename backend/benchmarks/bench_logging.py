@@ -0,0 +1,145 @@
+"""
+Per-request logging overhead, before and after the queued logging subsystem.
+
+    python benchmarks/bench_logging.py --requests 2000 --concurrency 50
+
+Each simulated request logs what a chat request logs: the incoming message,
+a DEBUG context dump (disabled at INFO), the LLM response (a large JSON
+payload) and a couple of short status lines. "before" is the old setup:
+`basicConfig` with a synchronous FileHandler and f-string messages. "after"
+uses `configure_logging()` with lazy %-style messages. Reported are the time
+spent inside logging calls per request and the worst event loop stall seen
+by a ticker task while the requests run. `--write-latency-ms` adds a sleep
+to every file write to stand in for a slow or contended disk.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.logging_config import _state, configure_logging, shutdown_logging  # noqa: E402
+
+PAYLOAD = json.dumps({'best_flights': [{'price': 100 + i, 'airline': 'Example Air', 'legs': ['LHR', 'CDG'] * 20}
+                                       for i in range(200)]})
+CONTEXT = {'location': 'London', 'history': ['previous turn'] * 50}
+
+
+class SlowStream:
+    """File wrapper whose writes take `latency` seconds."""
+
+    def __init__(self, stream, latency: float):
+        self._stream = stream
+        self._latency = latency
+
+    def write(self, data):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def slow_down(handler: logging.StreamHandler, latency: float) -> None:
+    handler.stream = SlowStream(handler.stream, latency)
+
+
+def log_request_before(logger: logging.Logger, i: int) -> None:
+    logger.info(f"Received chat message: flights from London to Paris #{i}")
+    logger.debug(f"Chat context: {CONTEXT}")
+    logger.info(f"[process_message] Calling agent with prompt. Location: {CONTEXT['location']}")
+    logger.info(f"[process_message] LLM response: {PAYLOAD}")
+    logger.info("Successfully generated response")
+
+
+def log_request_after(logger: logging.Logger, i: int) -> None:
+    logger.info("Received chat message: flights from London to Paris #%d", i)
+    logger.debug("Chat context: %s", CONTEXT)
+    logger.info("[process_message] Calling agent with prompt. Location: %s", CONTEXT['location'])
+    logger.info("[process_message] LLM response (%d chars)", len(PAYLOAD))
+    logger.debug("[process_message] LLM response: %s", PAYLOAD)
+    logger.info("Successfully generated response")
+
+
+async def run(log_request, requests: int, concurrency: int):
+    logger = logging.getLogger('bench')
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    max_stall = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal max_stall
+        interval = 0.001
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            max_stall = max(max_stall, time.perf_counter() - started - interval)
+
+    async def request(i):
+        async with semaphore:
+            await asyncio.sleep(0)  # simulated upstream wait
+            started = time.perf_counter()
+            log_request(logger, i)
+            samples.append(time.perf_counter() - started)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    done.set()
+    await tick
+    return samples, wall, max_stall
+
+
+def report(name, samples, wall, max_stall, log_path):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    size = sum(os.path.getsize(os.path.join(os.path.dirname(log_path), f))
+               for f in os.listdir(os.path.dirname(log_path)))
+    print(f"{name:<7} mean {statistics.mean(samples) * 1e6:8.1f}us  p99 {p99 * 1e6:8.1f}us  "
+          f"wall {wall:6.2f}s  max loop stall {max_stall * 1e3:7.2f}ms  log {size / 1e6:6.1f}MB")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--write-latency-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    # Console output would dominate both runs; compare the file handlers only
+    os.environ['LOG_CONSOLE'] = '0'
+    root = logging.getLogger()
+    latency = args.write_latency_ms / 1000
+
+    with tempfile.TemporaryDirectory() as before_dir, tempfile.TemporaryDirectory() as after_dir:
+        before_path = os.path.join(before_dir, 'backend.log')
+        handler = logging.FileHandler(before_path)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        slow_down(handler, latency)
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        result = asyncio.run(run(log_request_before, args.requests, args.concurrency))
+        root.removeHandler(handler)
+        handler.close()
+        report("before", *result, before_path)
+
+        after_path = os.path.join(after_dir, 'backend.log')
+        configure_logging(level='INFO', log_path=after_path, force=True)
+        for queued in _state.handlers:
+            slow_down(queued, latency)
+        result = asyncio.run(run(log_request_after, args.requests, args.concurrency))
+        shutdown_logging()
+        report("after", *result, after_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
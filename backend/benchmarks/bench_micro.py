@@ -0,0 +1,201 @@
+"""
+Micro-benchmarks for RAG search and flight ranking at growing corpus sizes.
+
+    python benchmarks/bench_micro.py --scales 10,100,1000
+
+RAG: the shipped flights/hotels/vacations data is replicated `scale` times
+(with ids and cities varied so the index does not collapse onto a few
+terms) and `RAGService.search_data` is timed in each search mode, together
+with building the indexes (`RAGService.preload`).
+
+Ranking: one fake SerpApi response (15 itineraries) is replicated `scale`
+times and `rank_flights` is timed on the merged result.
+
+Flight store: `scale` × 1000 synthetic schedule legs are built into a
+`FlightStore`, saved, memory-mapped back, and route/date and airline
+queries are timed against it.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import random
+import datetime
+import tempfile
+import statistics
+from typing import Any, Callable, Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_upstreams import make_flight_results  # noqa: E402
+from services.flight_ranking import rank_flights  # noqa: E402
+from services.flight_store import FlightStore  # noqa: E402
+from services.rag_service import SEARCH_MODES, RAGService  # noqa: E402
+
+DATA_TYPES = ('flights', 'hotels', 'vacations')
+QUERIES = ('London Heathrow', 'hotel in Paris with spa', 'beach vacation Miami', 'flights to Tokyo', 'Rome')
+
+
+def _cities() -> List[str]:
+    with open(os.path.join(BACKEND_DIR, 'data', 'airports.json'), encoding='utf-8') as f:
+        return sorted({a['city'] for a in json.load(f)['airports']})
+
+
+def _vary(value: Any, copy_index: int, cities: List[str]) -> Any:
+    if isinstance(value, dict):
+        varied = {}
+        for key, item in value.items():
+            if key == 'city' and isinstance(item, str):
+                varied[key] = cities[copy_index % len(cities)]
+            elif key == 'id' and isinstance(item, str):
+                varied[key] = f"{item}-{copy_index}"
+            else:
+                varied[key] = _vary(item, copy_index, cities)
+        return varied
+    if isinstance(value, list):
+        return [_vary(item, copy_index, cities) for item in value]
+    return value
+
+
+def write_corpus(directory: str, scale: int) -> Tuple[Dict[str, str], int]:
+    """Write every data type replicated `scale` times; return the data file paths and item count."""
+    cities = _cities()
+    paths, count = {}, 0
+    for data_type in DATA_TYPES:
+        with open(os.path.join(BACKEND_DIR, 'data', f'{data_type}.json'), encoding='utf-8') as f:
+            items = json.load(f).get(data_type, [])
+        scaled = [_vary(copy.deepcopy(item), k, cities) for k in range(scale) for item in items]
+        count += len(scaled)
+        paths[data_type] = os.path.join(directory, f'{data_type}.json')
+        with open(paths[data_type], 'w', encoding='utf-8') as f:
+            json.dump({data_type: scaled}, f)
+    return paths, count
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {'mean_ms': statistics.mean(samples) * 1000, 'p95_ms': samples[int(len(samples) * 0.95) - 1] * 1000}
+
+
+def bench_rag(scale: int, mode: str, repeat: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        service = RAGService(reload_interval=3600, mode=mode)
+        service.data_files, items = write_corpus(directory, scale)
+        service.vector_dir = os.path.join(directory, 'index')
+        started = time.perf_counter()
+        service.preload()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        def search():
+            for query in QUERIES:
+                for data_type in DATA_TYPES:
+                    service.search_data(query, data_type)
+
+        stats = timed(search, repeat)
+        searches = len(QUERIES) * len(DATA_TYPES)
+        return {'items': items, 'build_ms': build_ms,
+                'search_mean_ms': stats['mean_ms'] / searches, 'search_p95_ms': stats['p95_ms'] / searches}
+
+
+def bench_ranking(scale: int, repeat: int) -> Dict[str, Any]:
+    day = (datetime.date.today() + datetime.timedelta(days=30)).isoformat()
+    merged: Dict[str, List[Dict[str, Any]]] = {'best_flights': [], 'other_flights': []}
+    for k in range(scale):
+        results = make_flight_results({'departure_id': 'LHR', 'arrival_id': 'JFK', 'outbound_date': day, 'type': str(k)})
+        merged['best_flights'] += results['best_flights']
+        merged['other_flights'] += results['other_flights']
+    flights = len(merged['best_flights']) + len(merged['other_flights'])
+    stats = timed(lambda: rank_flights(merged, top_k=3), repeat)
+    return {'flights': flights, 'rank_mean_ms': stats['mean_ms'], 'rank_p95_ms': stats['p95_ms']}
+
+
+def schedule_legs(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Synthetic legs in the data/flights.json schema over the shipped airports and a year of dates."""
+    rng = random.Random(seed)
+    with open(os.path.join(BACKEND_DIR, 'data', 'airports.json'), encoding='utf-8') as f:
+        airports = [a['iata'] for a in json.load(f)['airports']]
+    start = datetime.datetime(2026, 1, 1)
+    legs = []
+    for i in range(count):
+        origin, destination = rng.sample(airports, 2)
+        departs = start + datetime.timedelta(minutes=rng.randrange(365 * 24 * 60))
+        economy = rng.randint(50, 900)
+        legs.append({
+            'id': f"FL{i}", 'airline': f"Airline {chr(65 + i % 20)}", 'flightNumber': f"XX{i % 9000}",
+            'departure': {'airport': origin, 'date': departs.isoformat()},
+            'arrival': {'airport': destination, 'date': (departs + datetime.timedelta(hours=3)).isoformat()},
+            'duration': '3h 00m', 'status': 'On Time',
+            'price': {'economy': economy, 'business': economy * 3, 'first': economy * 7},
+            'availableSeats': {'economy': rng.randint(0, 150), 'business': rng.randint(0, 30), 'first': rng.randint(0, 8)},
+        })
+    return legs
+
+
+def bench_flight_store(scale: int, repeat: int) -> Dict[str, Any]:
+    legs = schedule_legs(scale * 1000)
+    routes = [(leg['departure']['airport'], leg['arrival']['airport'], leg['departure']['date'][:10]) for leg in legs[:20]]
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        FlightStore.build(legs).save(directory)
+        build_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        store = FlightStore.load(directory)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        def route_queries():
+            for origin, destination, day in routes:
+                store.query(origin, destination, day, cabin='business', max_price=2000)
+
+        route = timed(route_queries, repeat)
+        airline = timed(lambda: store.query(airline='Airline C', min_seats=5, max_price=300), repeat)
+        return {'flights': len(store), 'build_ms': build_ms, 'load_ms': load_ms,
+                'route_query_ms': route['mean_ms'] / len(routes), 'airline_query_ms': airline['mean_ms']}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="RAG search and flight ranking micro-benchmarks")
+    parser.add_argument("--scales", default="10,100,1000", help="Comma-separated corpus multipliers")
+    parser.add_argument("--modes", default=",".join(SEARCH_MODES), help="RAG search modes to time")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    scales = [int(s) for s in args.scales.split(',')]
+    results: Dict[str, Any] = {'rag': [], 'ranking': [], 'flight_store': []}
+
+    print(f"{'mode':<9}{'scale':>7}{'items':>8}{'build ms':>11}{'search mean ms':>16}{'p95 ms':>9}")
+    for mode in args.modes.split(','):
+        for scale in scales:
+            row = {'mode': mode, 'scale': scale, **bench_rag(scale, mode, args.repeat)}
+            results['rag'].append(row)
+            print(f"{mode:<9}{scale:>7}{row['items']:>8}{row['build_ms']:>11.1f}"
+                  f"{row['search_mean_ms']:>16.3f}{row['search_p95_ms']:>9.3f}")
+
+    print(f"\n{'scale':>7}{'flights':>9}{'rank mean ms':>14}{'p95 ms':>9}")
+    for scale in scales:
+        row = {'scale': scale, **bench_ranking(scale, args.repeat)}
+        results['ranking'].append(row)
+        print(f"{scale:>7}{row['flights']:>9}{row['rank_mean_ms']:>14.3f}{row['rank_p95_ms']:>9.3f}")
+
+    print(f"\n{'scale':>7}{'flights':>9}{'build ms':>11}{'load ms':>9}{'route query ms':>16}{'airline query ms':>18}")
+    for scale in scales:
+        row = {'scale': scale, **bench_flight_store(scale, args.repeat)}
+        results['flight_store'].append(row)
+        print(f"{scale:>7}{row['flights']:>9}{row['build_ms']:>11.1f}{row['load_ms']:>9.2f}"
+              f"{row['route_query_ms']:>16.3f}{row['airline_query_ms']:>18.3f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
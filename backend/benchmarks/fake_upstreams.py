@@ -0,0 +1,316 @@
+"""
+Local stand-ins for SerpApi, OpenWeather and an OpenAI-compatible LLM.
+
+    python benchmarks/fake_upstreams.py --port 9100 --serpapi 400,0.4,0.01 --llm 800,0.3
+
+One server answers all three APIs, so point the backend at it with
+
+    SERPAPI_BASE_URL=http://127.0.0.1:9100/search
+    OPENWEATHER_BASE_URL=http://127.0.0.1:9100
+    API_BASE=http://127.0.0.1:9100/v1
+
+Each upstream has its own fault profile, ``median_ms[,sigma[,error_rate]]``:
+latency is log-normal around the median with the given sigma, and the given
+fraction of requests fails with a 429, 500 or 503. Responses are generated
+deterministically from the request, so repeated queries return identical
+bodies (as caches expect). ``GET /_stats`` returns request counts per
+upstream.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import datetime
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+AIRLINES = ('Example Air', 'Blue Sky', 'Northwind', 'Transit One', 'Coastal Jet', 'Meridian')
+HUBS = ('AMS', 'FRA', 'MAD', 'IST', 'DUB', 'ZRH')
+CITIES = {
+    'london': (51.5074, -0.1278, 'GB'), 'paris': (48.8566, 2.3522, 'FR'), 'new york': (40.7128, -74.006, 'US'),
+    'tokyo': (35.6762, 139.6503, 'JP'), 'rome': (41.9028, 12.4964, 'IT'), 'madrid': (40.4168, -3.7038, 'ES'),
+}
+
+
+@dataclass
+class FaultProfile:
+    """Latency and error distribution of one fake upstream."""
+    median_ms: float = 0.0
+    sigma: float = 0.0
+    error_rate: float = 0.0
+    error_statuses: Tuple[int, ...] = (429, 500, 503)
+
+    @classmethod
+    def parse(cls, spec: str) -> "FaultProfile":
+        """Parse ``median_ms[,sigma[,error_rate]]``."""
+        parts = [float(p) for p in spec.split(',') if p.strip()]
+        return cls(*parts[:3])
+
+    def latency(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms / 1000 * math.exp(rng.gauss(0, self.sigma)) if self.sigma else self.median_ms / 1000
+
+    async def apply(self, rng: random.Random) -> Optional[JSONResponse]:
+        """Sleep for a sampled latency; return an error response for the failing fraction."""
+        delay = self.latency(rng)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and rng.random() < self.error_rate:
+            status = rng.choice(self.error_statuses)
+            return JSONResponse({'error': f'Injected upstream failure ({status})'}, status_code=status)
+        return None
+
+
+def _seeded(*parts: Any) -> random.Random:
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).digest()
+    return random.Random(int.from_bytes(digest[:8], 'big'))
+
+
+def _clock(day: str, minutes: int) -> str:
+    moment = datetime.datetime.fromisoformat(day) + datetime.timedelta(minutes=minutes)
+    return moment.strftime('%Y-%m-%d %H:%M')
+
+
+def make_flight(rng: random.Random, origin: str, destination: str, day: str) -> Dict[str, Any]:
+    """One itinerary in the google_flights result shape."""
+    airline = rng.choice(AIRLINES)
+    departure = rng.randrange(5 * 60, 22 * 60, 5)
+    stops = rng.choice((0, 0, 1, 1, 2))
+    airports = [origin] + rng.sample(HUBS, stops) + [destination]
+    legs, layovers, clock = [], [], departure
+    for i in range(len(airports) - 1):
+        duration = rng.randrange(60, 600, 5)
+        legs.append({
+            'departure_airport': {'name': f"{airports[i]} International", 'id': airports[i], 'time': _clock(day, clock)},
+            'arrival_airport': {'name': f"{airports[i + 1]} International", 'id': airports[i + 1],
+                                'time': _clock(day, clock + duration)},
+            'duration': duration,
+            'airplane': rng.choice(('Airbus A320', 'Boeing 737', 'Boeing 787', 'Airbus A350')),
+            'airline': airline,
+            'travel_class': 'Economy',
+            'flight_number': f"{airline[:2].upper()} {rng.randrange(100, 9999)}",
+            'legroom': '30 in',
+            'extensions': ['Average legroom (30 in)', 'In-seat USB outlet'],
+        })
+        clock += duration
+        if i < len(airports) - 2:
+            wait = rng.randrange(45, 300, 5)
+            layovers.append({'duration': wait, 'name': f"{airports[i + 1]} International", 'id': airports[i + 1]})
+            clock += wait
+    return {
+        'flights': legs,
+        'layovers': layovers or None,
+        'total_duration': clock - departure,
+        'carbon_emissions': {'this_flight': rng.randrange(60000, 400000), 'typical_for_this_route': 150000},
+        'price': rng.randrange(60, 1500),
+        'type': 'One way',
+        'booking_token': hashlib.sha1(f"{origin}{destination}{day}{departure}{airline}".encode()).hexdigest(),
+    }
+
+
+def make_flight_results(params: Dict[str, str], count: int = 15) -> Dict[str, Any]:
+    """Deterministic google_flights response for the given search parameters."""
+    origin = params.get('departure_id', 'LHR').split(',')[0]
+    destination = params.get('arrival_id', 'CDG').split(',')[0]
+    day = params.get('outbound_date') or datetime.date.today().isoformat()
+    rng = _seeded('flights', origin, destination, day, params.get('return_date'), params.get('type'))
+    flights = [make_flight(rng, origin, destination, day) for _ in range(count)]
+    flights.sort(key=lambda f: f['price'] + f['total_duration'])
+    prices = sorted(f['price'] for f in flights)
+    return {
+        'search_metadata': {'status': 'Success', 'created_at': datetime.datetime.utcnow().isoformat()},
+        'search_parameters': {k: v for k, v in params.items() if k != 'api_key'},
+        'best_flights': flights[:3],
+        'other_flights': flights[3:],
+        'price_insights': {'lowest_price': prices[0], 'typical_price_range': [prices[len(prices) // 4], prices[-len(prices) // 4]]},
+    }
+
+
+def _geocode(query: str) -> List[Dict[str, Any]]:
+    city = query.split(',')[0].strip().lower()
+    if not city:
+        return []
+    lat, lon, country = CITIES.get(city) or (
+        round(_seeded('geo', city).uniform(-60, 60), 4), round(_seeded('lon', city).uniform(-180, 180), 4), 'XX')
+    return [{'name': city.title(), 'lat': lat, 'lon': lon, 'country': country}]
+
+
+def _onecall(lat: float, lon: float) -> Dict[str, Any]:
+    rng = _seeded('weather', round(lat, 2), round(lon, 2), int(time.time() // 600))
+    now = int(time.time())
+    return {
+        'lat': lat, 'lon': lon, 'timezone': 'UTC', 'timezone_offset': 0,
+        'current': {
+            'dt': now, 'temp': round(rng.uniform(-5, 35), 1), 'feels_like': round(rng.uniform(-8, 38), 1),
+            'humidity': rng.randrange(20, 100), 'wind_speed': round(rng.uniform(0, 15), 1),
+            'weather': [rng.choice(({'main': 'Clear', 'description': 'clear sky'},
+                                    {'main': 'Clouds', 'description': 'scattered clouds'},
+                                    {'main': 'Rain', 'description': 'light rain'}))],
+        },
+        'daily': [{'dt': now + i * 86400, 'temp': {'min': round(rng.uniform(-5, 20), 1), 'max': round(rng.uniform(15, 35), 1)},
+                   'weather': [{'main': 'Clear', 'description': 'clear sky'}]} for i in range(7)],
+    }
+
+
+_CODE_RE = re.compile(r'\b[A-Z]{3}\b')
+_DATE_RE = re.compile(r'\b\d{4}-\d{2}-\d{2}\b')
+
+
+def _user_text(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get('role') == 'user':
+            content = message.get('content')
+            return content if isinstance(content, str) else json.dumps(content)
+    return ''
+
+
+def _plan_reply(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Decide the assistant message: call the flight tool once for flight
+    questions, then answer in text from the tool result.
+    """
+    messages = body.get('messages') or []
+    functions = body.get('functions') or [t.get('function', {}) for t in body.get('tools') or []]
+    names = [f.get('name') for f in functions]
+    # The backend sends "...User: <question>\n\nToday's date: ..." as one message
+    question = _user_text(messages).split('User:')[-1].split("Today's date")[0]
+    tool_result = next((m.get('content') for m in reversed(messages) if m.get('role') in ('function', 'tool')), None)
+    if tool_result is None and 'search_flights' in names and re.search(r'\b(fl(y|ights?)|fares?)\b', question, re.I):
+        codes = [c for c in _CODE_RE.findall(question) if c not in ('USD', 'EUR', 'GBP')]
+        dates = _DATE_RE.findall(question)
+        departure = dates[-1] if dates else (datetime.date.today() + datetime.timedelta(days=30)).isoformat()
+        arguments = {'departure_id': codes[0] if codes else 'LHR',
+                     'arrival_id': codes[1] if len(codes) > 1 else 'CDG',
+                     'departure_date': departure, 'type': 2}
+        return {'role': 'assistant', 'content': None,
+                'function_call': {'name': 'search_flights', 'arguments': json.dumps(arguments)}}
+    if tool_result is not None:
+        prices = [int(p) for p in re.findall(r'"price":\s*(\d+)', tool_result)]
+        content = (f"I found {len(prices)} options; the cheapest is ${min(prices)}." if prices
+                   else "I could not find flights for that search.")
+    else:
+        content = ("Here are a few suggestions for your trip: book early, check visa requirements, "
+                   "and compare nearby airports for better fares.")
+    return {'role': 'assistant', 'content': content}
+
+
+def _completion(body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, Any]:
+    prompt_tokens = sum(len(str(m.get('content') or '')) for m in body.get('messages') or []) // 4
+    completion_tokens = max(1, len(message.get('content') or json.dumps(message.get('function_call'))) // 4)
+    if 'function_call' in message and body.get('tools'):
+        call = message.pop('function_call')
+        message['tool_calls'] = [{'id': 'call_0', 'type': 'function', 'function': call}]
+    return {
+        'id': f"chatcmpl-{random.getrandbits(48):x}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'fake'),
+        'choices': [{'index': 0, 'message': message,
+                     'finish_reason': 'tool_calls' if 'tool_calls' in message else
+                     'function_call' if 'function_call' in message else 'stop'}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                  'total_tokens': prompt_tokens + completion_tokens},
+    }
+
+
+async def _stream_completion(completion: Dict[str, Any], token_delay: float):
+    """Re-emit a completion as chat.completion.chunk server-sent events."""
+    choice = completion['choices'][0]
+    message = choice['message']
+    base = {k: completion[k] for k in ('id', 'created', 'model')}
+    base['object'] = 'chat.completion.chunk'
+
+    def chunk(delta, finish=None):
+        return "data: " + json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}]}) + "\n\n"
+
+    yield chunk({'role': 'assistant', 'content': ''})
+    if message.get('content'):
+        for word in re.findall(r'\S+\s*', message['content']):
+            if token_delay:
+                await asyncio.sleep(token_delay)
+            yield chunk({'content': word})
+    elif 'function_call' in message:
+        yield chunk({'function_call': message['function_call']})
+    elif 'tool_calls' in message:
+        yield chunk({'tool_calls': [{**message['tool_calls'][0], 'index': 0}]})
+    yield chunk({}, choice['finish_reason'])
+    yield "data: [DONE]\n\n"
+
+
+def create_app(serpapi: FaultProfile, weather: FaultProfile, llm: FaultProfile,
+               flights_per_search: int = 15, token_delay: float = 0.0, seed: Optional[int] = None) -> FastAPI:
+    """Build the fake upstream app with one fault profile per upstream."""
+    app = FastAPI(title="Fake upstreams")
+    rng = random.Random(seed)
+    counts = {'serpapi': 0, 'geocode': 0, 'onecall': 0, 'llm': 0}
+
+    @app.get("/search")
+    async def serpapi_search(request: Request):
+        counts['serpapi'] += 1
+        failure = await serpapi.apply(rng)
+        if failure is not None:
+            return failure
+        params = dict(request.query_params)
+        if params.get('engine') != 'google_flights':
+            return JSONResponse({'error': 'Unsupported engine'}, status_code=400)
+        return make_flight_results(params, flights_per_search)
+
+    @app.get("/geo/1.0/direct")
+    async def geocode(q: str = ''):
+        counts['geocode'] += 1
+        return await weather.apply(rng) or _geocode(q)
+
+    @app.get("/data/3.0/onecall")
+    async def onecall(lat: float, lon: float):
+        counts['onecall'] += 1
+        return await weather.apply(rng) or _onecall(lat, lon)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        counts['llm'] += 1
+        failure = await llm.apply(rng)
+        if failure is not None:
+            return failure
+        body = await request.json()
+        completion = _completion(body, _plan_reply(body))
+        if body.get('stream'):
+            return StreamingResponse(_stream_completion(completion, token_delay), media_type='text/event-stream')
+        return completion
+
+    @app.get("/_stats")
+    async def stats():
+        return counts
+
+    return app
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve fake SerpApi, OpenWeather and OpenAI endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--serpapi", default="300,0.4,0", help="median_ms[,sigma[,error_rate]]")
+    parser.add_argument("--weather", default="80,0.3,0", help="median_ms[,sigma[,error_rate]]")
+    parser.add_argument("--llm", default="700,0.3,0", help="median_ms[,sigma[,error_rate]]")
+    parser.add_argument("--flights-per-search", type=int, default=15)
+    parser.add_argument("--token-delay-ms", type=float, default=5.0, help="Delay between streamed tokens")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    app = create_app(FaultProfile.parse(args.serpapi), FaultProfile.parse(args.weather), FaultProfile.parse(args.llm),
+                     args.flights_per_search, args.token_delay_ms / 1000, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level=os.getenv("FAKE_LOG_LEVEL", "warning"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+Load test for `/api/chat` against local fake upstreams.
+
+    python benchmarks/load_test.py --concurrency 32 --requests 500 --workers 2
+
+Without `--url` this starts `fake_upstreams.py` and the backend (`serve.py`)
+on free local ports, with SerpApi, OpenWeather and the LLM pointed at the
+fakes and a private cache, waits for `/api/ready`, and drives the chat
+endpoint. With `--url` it drives an already running backend instead.
+
+Requests mix fast-path flight searches, agent (LLM + tool) flight questions
+and general questions over a few routes and dates, so caches see a
+realistic hit rate. Reported: latency p50/p95/p99, throughput, errors, the
+per-stage breakdown from each response's `Server-Timing` header, and how
+many calls reached each fake upstream.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import datetime
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = (('London', 'Paris'), ('LHR', 'JFK'), ('Madrid', 'Rome'), ('NYC', 'Tokyo'), ('CDG', 'FCO'), ('MAD', 'AMS'))
+GENERAL = (
+    "What should I pack for a week in Rome in spring?",
+    "Do I need a visa to visit Japan as a UK citizen?",
+    "Which neighbourhood is best to stay in Paris?",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_messages(count: int, days: int, general_share: float, agent_share: float, seed: int) -> List[str]:
+    """Chat messages over a handful of routes and `days` distinct dates."""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < general_share:
+            messages.append(rng.choice(GENERAL))
+            continue
+        origin, destination = rng.choice(ROUTES)
+        day = (today + datetime.timedelta(days=14 + rng.randrange(days))).isoformat()
+        if roll < general_share + agent_share:
+            # Phrasing the intent parser does not handle, so it goes through the agent
+            messages.append(f"Could you look up fares for me, I need to fly {origin} to {destination} around {day}")
+        else:
+            messages.append(f"Flights from {origin} to {destination} on {day}")
+    return messages
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for part in header.split(','):
+        name, _, rest = part.strip().partition(';dur=')
+        if name and rest:
+            stages[name] = float(rest)
+    return stages
+
+
+async def drive(url: str, messages: List[str], concurrency: int, timeout: float, sessions: bool):
+    """Send every message with at most `concurrency` in flight; return per-request results."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def user(client: httpx.AsyncClient, index: int):
+        session_id = f"load-{index}" if sessions else None
+        while not queue.empty():
+            message = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/api/chat", json={'message': message, 'session_id': session_id})
+                status, timing = response.status_code, parse_server_timing(response.headers.get('server-timing', ''))
+            except httpx.HTTPError as e:
+                status, timing = type(e).__name__, {}
+            results.append({'latency': time.perf_counter() - started, 'status': status, 'stages': timing})
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client, i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+    return results, wall
+
+
+def report(results: List[Dict], wall: float, upstream_calls: Optional[Dict[str, int]]) -> Dict:
+    latencies = sorted(r['latency'] for r in results)
+    errors = sum(1 for r in results if r['status'] != 200)
+    stage_samples: Dict[str, List[float]] = {}
+    for r in results:
+        for name, ms in r['stages'].items():
+            stage_samples.setdefault(name, []).append(ms)
+    summary = {
+        'requests': len(results),
+        'errors': errors,
+        'wall_seconds': round(wall, 3),
+        'rps': round(len(results) / wall, 2) if wall else 0.0,
+        'latency_ms': {q: round(percentile(latencies, p) * 1000, 1)
+                       for q, p in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        'stages_ms': {name: {'count': len(v), 'p50': round(percentile(sorted(v), 0.5), 1),
+                             'p95': round(percentile(sorted(v), 0.95), 1)}
+                      for name, v in sorted(stage_samples.items())},
+        'upstream_calls': upstream_calls,
+    }
+    print(f"requests {summary['requests']}  errors {errors}  wall {wall:.2f}s  rps {summary['rps']:.1f}")
+    print("latency  " + "  ".join(f"{q} {v:.1f}ms" for q, v in summary['latency_ms'].items()))
+    if summary['stages_ms']:
+        print(f"{'stage':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, s in summary['stages_ms'].items():
+            print(f"{name:<16}{s['count']:>7}{s['p50']:>10.1f}{s['p95']:>10.1f}")
+    if upstream_calls:
+        print("upstream calls  " + "  ".join(f"{k} {v}" for k, v in upstream_calls.items()))
+    return summary
+
+
+def wait_for(url: str, timeout: float, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with status {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def start_stack(args, workdir: str):
+    """Start the fake upstreams and the backend; return (backend url, fakes url, processes)."""
+    fake_port, app_port = free_port(), free_port()
+    fakes_url = f"http://127.0.0.1:{fake_port}"
+    fakes = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'benchmarks', 'fake_upstreams.py'),
+                              '--port', str(fake_port), '--serpapi', args.serpapi, '--weather', args.weather,
+                              '--llm', args.llm, '--seed', str(args.seed)])
+    env = {
+        **os.environ,
+        'API_KEY': 'fake', 'API_BASE': f"{fakes_url}/v1", 'MODEL_NAME': os.getenv('MODEL_NAME', 'gpt-4o-mini'),
+        'SERPAPI_KEY': 'fake', 'SERPAPI_BASE_URL': f"{fakes_url}/search",
+        'OPENWEATHER_API_KEY': 'fake', 'OPENWEATHER_BASE_URL': fakes_url,
+        'CACHE_SQLITE_PATH': os.path.join(workdir, 'cache.sqlite'),
+        'GEOCODE_CACHE_URL': f"sqlite:///{os.path.join(workdir, 'geocode.sqlite')}",
+        'LOG_PATH': os.path.join(workdir, 'backend.log'), 'LOG_CONSOLE': '0',
+    }
+    backend = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(app_port),
+                                '--workers', str(args.workers), '--log-level', 'warning'], cwd=BACKEND_DIR, env=env,
+                               # The agent prints its chain to stdout
+                               stdout=subprocess.DEVNULL)
+    app_url = f"http://127.0.0.1:{app_port}"
+    try:
+        wait_for(f"{fakes_url}/_stats", 30, fakes)
+        wait_for(f"{app_url}/api/ready", 120, backend)
+    except Exception:
+        stop([backend, fakes])
+        raise
+    return app_url, fakes_url, [backend, fakes]
+
+
+def stop(processes) -> None:
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test /api/chat against fake upstreams")
+    parser.add_argument("--url", help="Drive an already running backend instead of starting one")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="Backend worker processes (when starting one)")
+    parser.add_argument("--days", type=int, default=20, help="Distinct travel dates (fewer means more cache hits)")
+    parser.add_argument("--general-share", type=float, default=0.2, help="Fraction of non-flight questions")
+    parser.add_argument("--agent-share", type=float, default=0.2, help="Fraction of flight questions sent via the agent")
+    parser.add_argument("--sessions", action="store_true", help="Give each virtual user its own session")
+    parser.add_argument("--serpapi", default="300,0.4,0", help="Fake SerpApi profile median_ms[,sigma[,error_rate]]")
+    parser.add_argument("--weather", default="80,0.3,0", help="Fake OpenWeather profile")
+    parser.add_argument("--llm", default="700,0.3,0", help="Fake LLM profile")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args(argv)
+
+    messages = make_messages(args.requests, args.days, args.general_share, args.agent_share, args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        processes, fakes_url = [], None
+        url = args.url
+        if url is None:
+            url, fakes_url, processes = start_stack(args, workdir)
+        try:
+            results, wall = asyncio.run(drive(url.rstrip('/'), messages, args.concurrency, args.timeout, args.sessions))
+            upstream_calls = httpx.get(f"{fakes_url}/_stats").json() if fakes_url else None
+        finally:
+            stop(processes)
+    summary = report(results, wall, upstream_calls)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,116 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
 import logging
 import traceback
+import uuid
+import json
 import os
 
-LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
-LOG_PATH = os.path.join(LOG_DIR, 'backend.log')
-os.makedirs(LOG_DIR, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_PATH),
-        logging.StreamHandler()
-    ]
-)
+from services.logging_config import configure_logging
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Import the chat service
-from services.chat_service import chat_service
+# The chat service (LangChain, OpenAI client, agent) is imported and built by warm_up()
+from services.http_client import http_client
+from services.airport_resolver import airport_resolver
+from services.chat_events import format_sse
+from services.startup import startup_report
+from services.tracing import TracingMiddleware, get_trace_id, metrics
+from services.upstream import upstream_stats
+from services.rate_limiter import get_serpapi_scheduler
+from services.flight_store import get_flight_store
+from services.admission import AdmissionMiddleware, get_admission_controller
+
+startup_report.record('import:main', time.perf_counter() - _import_started)
+
+
+def load_chat_service():
+    """Import and build the chat service (blocking; first call pays the LangChain import cost)."""
+    from services.chat_service import get_chat_service
+    return get_chat_service()
+
+
+def warm_up() -> None:
+    """
+    Build every heavy component, timing each for the startup report.
+
+    Runs in a worker thread from the lifespan, or in the parent process
+    before forking when started by serve.py (then workers start ready).
+    """
+    if startup_report.ready:
+        return
+    with startup_report.phase('airport_index'):
+        airport_resolver.load()
+    with startup_report.phase('import:chat_service'):
+        import services.chat_service  # noqa: F401
+    with startup_report.phase('chat_service'):
+        service = load_chat_service()
+    with startup_report.phase('agent'):
+        service.agent
+    with startup_report.phase('rag_index'):
+        service.rag_service.preload()
+    with startup_report.phase('flight_store'):
+        get_flight_store()
+    startup_report.mark_ready()
+
+
+async def ready_chat_service():
+    """Return the chat service, waiting off the event loop if warm-up has not finished."""
+    if startup_report.ready:
+        return load_chat_service()
+    return await asyncio.to_thread(load_chat_service)
+
+
+async def _background_warm_up(app: FastAPI) -> None:
+    try:
+        await asyncio.to_thread(warm_up)
+    except Exception as e:
+        logger.exception("Warm-up failed: %s", e)
+        return
+    if os.getenv("CACHE_WARMER_ENABLED", "true").lower() == "true":
+        app.state.cache_warmer = load_chat_service().cache_warmer
+        app.state.cache_warmer.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared upstream HTTP pool and start the background warm-up; drain the pool on shutdown."""
+    await http_client.start()
+    # Serve liveness immediately; readiness flips once warm-up completes
+    app.state.warm_up = asyncio.create_task(_background_warm_up(app))
+    try:
+        yield
+    finally:
+        if getattr(app.state, 'cache_warmer', None) is not None:
+            await app.state.cache_warmer.stop()
+        await http_client.aclose()
 
 # Initialize FastAPI app
-app = FastAPI(title="Travel Assistant API")
+app = FastAPI(title="Travel Assistant API", lifespan=lifespan)
+
+def batch_concurrency(requested: Optional[int]) -> int:
+    """Items a batch processes at once: the requested number, capped at BATCH_MAX_CONCURRENCY."""
+    max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    return min(max(1, requested or max_concurrency), max_concurrency)
+
+
+def batch_weight(body: bytes) -> int:
+    """Admission slots a batch request takes: one per item processed at once (never more than it has)."""
+    batch = json.loads(body)
+    return max(1, min(batch_concurrency(batch.get('concurrency')), len(batch.get('messages') or ())))
+
+
+# Bounded concurrency and load shedding for the chat routes (inside CORS so 503s carry CORS headers)
+if os.getenv("ADMISSION_ENABLED", "true").lower() == "true":
+    app.add_middleware(AdmissionMiddleware, weights={'/api/chat/batch': batch_weight})
 
 # Configure CORS
 app.add_middleware(
@@ -33,16 +119,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Server-Timing", "Retry-After"],
 )
+# Per-request trace id, span timings and latency histograms
+app.add_middleware(TracingMiddleware)
 
 # Chat Models
 class ChatMessage(BaseModel):
     message: str
     context: Optional[Dict[str, Any]] = None
+    # Echo the session_id from the previous response to continue a conversation
+    session_id: Optional[str] = None
+
+class ChatBatchRequest(BaseModel):
+    messages: List[ChatMessage]
+    # Items processed at once (capped at BATCH_MAX_CONCURRENCY)
+    concurrency: Optional[int] = None
 
 class ChatResponse(BaseModel):
     response: str
     context: Optional[Dict[str, Any]] = None
+    session_id: Optional[str] = None
 
 # Health check endpoint
 @app.get("/api/health")
@@ -50,10 +147,50 @@ async def health_check():
     """Health check endpoint to verify the API is running."""
     return {"status": "ok", "message": "Travel Assistant API is running"}
 
+# Prometheus metrics endpoint (plain def: gauges may read the shared quota counter)
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Latency histograms (requests, spans) and counters (upstream status codes, cache hits, LLM tokens)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Upstream resilience state
+@app.get("/api/upstreams")
+async def upstreams_endpoint():
+    """Circuit breaker state, latency percentiles and current timeouts per upstream API."""
+    return upstream_stats()
+
+# Plain def: reading the quota counter may wait on the shared cache, so it runs in the threadpool
+@app.get("/api/quota")
+def quota_endpoint():
+    """SerpApi rate limiter tokens, quota usage and scheduler queue depth."""
+    return get_serpapi_scheduler().stats()
+
+@app.get("/api/admission")
+async def admission_endpoint():
+    """Chat admission control: in-flight requests, queue depth by priority and shed counts."""
+    return get_admission_controller().stats()
+
+@app.get("/api/cache/warm")
+async def cache_warmer_endpoint():
+    """Popular searches kept warm, their freshness, and refresh and refresh-hit counters."""
+    if not startup_report.ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return load_chat_service().cache_warmer.stats()
+
+# Readiness endpoint
+@app.get("/api/ready")
+async def readiness_check():
+    """Readiness check: 200 once the chat service and indexes are built, else 503. Includes startup timings."""
+    report = startup_report.report()
+    if report['ready']:
+        return {"status": "ready", "startup": report}
+    status = "failed" if report['error'] else "starting"
+    return JSONResponse(status_code=503, content={"status": status, "startup": report})
+
 # Exception handler for the chat endpoint
 @app.exception_handler(Exception)
 async def chat_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled exception in chat endpoint: {str(exc)}\n{traceback.format_exc()}")
+    logger.error("Unhandled exception in chat endpoint (trace %s): %s\n%s", get_trace_id(), exc, traceback.format_exc())
     return JSONResponse(
         status_code=500,
         content={"response": "Sorry, an error occurred while processing your request.", "context": None}
@@ -67,26 +204,99 @@ async def chat_endpoint(chat_message: ChatMessage):
     This is the main endpoint for all chat interactions.
     """
     try:
-        logger.info(f"Received chat message: {chat_message.message}")
-        logger.debug(f"Chat context: {chat_message.context}")
+        logger.info("Received chat message: %s", chat_message.message)
+        logger.debug("Chat context: %s", chat_message.context)
+        session_id = chat_message.session_id or uuid.uuid4().hex
+        chat_service = await ready_chat_service()
         # Process the message using our chat service
         response = await chat_service.process_message(
             user_message=chat_message.message,
-            context=chat_message.context or {}
+            context=chat_message.context or {},
+            session_id=session_id
         )
         logger.info("Successfully generated response")
-        logger.debug(f"Response content: {response}")
+        logger.debug("Response content: %s", response)
         return ChatResponse(
             response=response,
-            context=chat_message.context or {}
+            context=chat_message.context or {},
+            session_id=session_id
         )
     except Exception as e:
-        logger.error(f"Error processing chat message: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error processing chat message: %s", e)
         raise HTTPException(
             status_code=500,
             detail={"response": "Sorry, I encountered an error processing your request.", "context": None}
         )
 
+# Streaming chat endpoint
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(chat_message: ChatMessage, request: Request):
+    """
+    Handle a chat message and stream the reply as Server-Sent Events.
+    Emits 'token', 'tool_start', 'tool_end' and 'progress' events while the
+    agent works and a final 'done' event carrying the full response.
+    """
+    logger.info("Received streaming chat message: %s", chat_message.message)
+    chat_service = await ready_chat_service()
+    events = chat_service.stream_message(
+        user_message=chat_message.message,
+        context=chat_message.context or {},
+        session_id=chat_message.session_id or uuid.uuid4().hex
+    )
+
+    async def event_source():
+        try:
+            async for event, data in events:
+                if await request.is_disconnected():
+                    logger.info("Client disconnected from chat stream")
+                    break
+                yield format_sse(event, data)
+        finally:
+            # Cancels the agent run and in-flight upstream calls
+            await events.aclose()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Batch chat endpoint
+@app.post("/api/chat/batch")
+async def chat_batch_endpoint(batch: ChatBatchRequest, request: Request):
+    """
+    Answer many chat messages concurrently, streaming one NDJSON line per
+    message as it completes (with its `index` in the request) and a final
+    summary line. Duplicate flight searches across messages share one call.
+    """
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    if len(batch.messages) > max_items:
+        raise HTTPException(status_code=413, detail=f"At most {max_items} messages per batch")
+    concurrency = batch_concurrency(batch.concurrency)
+    logger.info("Received chat batch: %d messages, concurrency %d", len(batch.messages), concurrency)
+    chat_service = await ready_chat_service()
+    items = [{'message': m.message, 'context': m.context or {}, 'session_id': m.session_id or uuid.uuid4().hex}
+             for m in batch.messages]
+    results = chat_service.process_batch(items, concurrency)
+
+    async def lines():
+        started, errors, count = time.perf_counter(), 0, 0
+        try:
+            async for result in results:
+                if await request.is_disconnected():
+                    logger.info("Client disconnected from chat batch after %d of %d items", count, len(items))
+                    return
+                count += 1
+                errors += 'error' in result
+                yield json.dumps(result) + "\n"
+            yield json.dumps({'done': True, 'count': count, 'errors': errors,
+                              'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}) + "\n"
+        finally:
+            # Cancels unfinished items and their upstream calls
+            await results.aclose()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, port=8000)
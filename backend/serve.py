@@ -0,0 +1,130 @@
+"""
+Production server: preload shared read-only data once, then fork uvicorn workers.
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+The app, the chat service and agent, and the RAG and airport indexes are
+built in the parent before forking, so workers start ready and share those
+pages copy-on-write instead of each building their own copy. Every worker serves the same pre-bound socket and
+opens its own upstream connection pool in the app lifespan. Flight and LLM
+results are shared between workers through the cache backend selected with
+CACHE_BACKEND (see services/cache_backend.py).
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+
+import uvicorn
+
+from services.logging_config import shutdown_logging
+
+logger = logging.getLogger("serve")
+
+
+def preload():
+    """Import the app and build every immutable index the workers will read."""
+    started = time.perf_counter()
+    from main import app, warm_up
+    warm_up()
+    logger.info("Preloaded app and indexes in %.2fs", time.perf_counter() - started)
+    return app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args) -> None:
+    # Drop the parent's handlers; uvicorn installs its own for graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the Travel Assistant API with pre-forked workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--keep-alive", type=int, default=5, help="HTTP keep-alive timeout in seconds")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    # Per-process budgets (e.g. the SerpApi rate limit) are split between the workers
+    os.environ["WEB_CONCURRENCY"] = str(args.workers if hasattr(os, "fork") else 1)
+
+    app = preload()
+    sock = bind_socket(args.host, args.port)
+    logger.info("Listening on %s:%s with %s worker(s)", args.host, args.port, args.workers)
+
+    if args.workers <= 1 or not hasattr(os, "fork"):
+        run_worker(app, sock, args)
+        return 0
+
+    # Move preloaded objects out of the collector's reach so GC passes in the
+    # workers do not write to (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    stopping = False
+
+    def spawn(slot: int) -> None:
+        # Names the worker's own log file (logs/backend.<slot>.log)
+        os.environ["LOG_WORKER_ID"] = str(slot)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, args)
+            finally:
+                # os._exit skips atexit; flush the queued log records first
+                shutdown_logging()
+                os._exit(0)
+        workers[pid] = slot
+        logger.info("Started worker %s (pid %s)", slot, pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(args.workers):
+        spawn(slot)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = workers.pop(pid, None)
+        if slot is None:
+            continue
+        if not stopping:
+            logger.warning("Worker %s (pid %s) exited with status %s, restarting", slot, pid, status)
+            time.sleep(1)
+            spawn(slot)
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,368 @@
+"""
+Admission control and load shedding for the chat endpoints.
+
+Every chat request holds an LLM call and possibly a slow flight search, so
+accepting all of them under a spike only makes everyone time out. The
+`AdmissionController` bounds the work per worker process:
+
+- at most `max_in_flight` slots are in use at once; a request takes one,
+  a batch takes one per item it processes concurrently;
+- up to `max_queue` more wait, ordered by priority class (premium before
+  standard) and arrival, each for at most `queue_timeout` seconds;
+- a request is shed immediately with a `Retry-After` estimate when the
+  queue is full or its expected wait already exceeds the deadline, and
+  a queued premium request displaces the newest standard waiter rather
+  than being turned away;
+- health, readiness and metrics requests are in the critical class and
+  are never queued or shed.
+
+`AdmissionMiddleware` applies the controller to the chat routes and
+answers shed requests with 503 before any work is done.
+"""
+import os
+import hmac
+import math
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from .tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CRITICAL = 0
+PRIORITY_PREMIUM = 1
+PRIORITY_STANDARD = 2
+
+PRIORITY_NAMES = {PRIORITY_CRITICAL: 'critical', PRIORITY_PREMIUM: 'premium', PRIORITY_STANDARD: 'standard'}
+
+metrics.describe('admission_requests_total', "Requests seen by admission control by priority and outcome")
+metrics.describe('admission_shed_total', "Requests rejected by admission control by priority and reason")
+metrics.describe('admission_queue_wait_seconds', "Time admitted requests spent in the admission queue")
+metrics.describe('admission_in_flight', "Admission slots currently in use")
+metrics.describe('admission_queue_depth', "Requests waiting for an admission slot")
+
+
+class AdmissionRejected(Exception):
+    """The request was shed; `retry_after` is the suggested back-off in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"{reason}; retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    future: asyncio.Future = field(compare=False)
+    enqueued: float = field(compare=False)
+    weight: int = field(default=1, compare=False)
+    active: bool = field(default=True, compare=False)
+
+
+class AdmissionController:
+    """Bounded concurrency with a priority wait queue and queue-time deadlines (see module docstring)."""
+
+    def __init__(self, max_in_flight: Optional[int] = None, max_queue: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, name: str = 'chat'):
+        """
+        Args:
+            max_in_flight: Requests served at once (ADMISSION_MAX_IN_FLIGHT, default 32)
+            max_queue: Requests allowed to wait for a slot (ADMISSION_MAX_QUEUE, default 64)
+            queue_timeout: Longest a request may wait before it is shed (ADMISSION_QUEUE_TIMEOUT, default 5)
+            name: Label used in metrics
+        """
+        self.max_in_flight = max_in_flight if max_in_flight is not None else int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+        self.name = name
+        self.in_flight = 0
+        self.queue_depth = 0
+        self._heap: List[_Waiter] = []
+        self._seq = 0
+        # Moving average of slot hold time, for wait estimates and Retry-After
+        self._service_time: Optional[float] = None
+        self.counters = {'admitted': 0, 'queued': 0, 'shed': 0, 'timed_out': 0, 'displaced': 0}
+
+    def _count(self, priority: int, outcome: str) -> None:
+        metrics.inc('admission_requests_total', controller=self.name, priority=PRIORITY_NAMES[priority], outcome=outcome)
+
+    def _shed(self, priority: int, reason: str, retry_after: float) -> AdmissionRejected:
+        self.counters['shed'] += 1
+        metrics.inc('admission_shed_total', controller=self.name, priority=PRIORITY_NAMES[priority], reason=reason)
+        return AdmissionRejected(f"{self.name} {reason}", retry_after)
+
+    def estimate_wait(self, priority: int, weight: int = 1) -> Optional[float]:
+        """Seconds a new request at `priority` would queue, or None before any request has completed."""
+        if self._service_time is None:
+            return None
+        ahead = sum(w.weight for w in self._heap if w.active and w.priority <= priority)
+        return self._service_time * (ahead + weight) / self.max_in_flight
+
+    def retry_after(self) -> int:
+        """Suggested client back-off: time for the current queue to drain, at least one second."""
+        estimate = self.estimate_wait(PRIORITY_STANDARD)
+        return max(1, math.ceil(estimate if estimate is not None else self.queue_timeout))
+
+    def _victim(self, priority: int) -> Optional[_Waiter]:
+        """The newest waiter of a lower priority class than `priority`, if any."""
+        victims = [w for w in self._heap if w.active and w.priority > priority]
+        return max(victims) if victims else None
+
+    def _displace(self, victim: _Waiter) -> None:
+        """Shed `victim` to make room in the queue."""
+        self._leave(victim)
+        self.counters['displaced'] += 1
+        victim.future.set_exception(self._shed(victim.priority, 'displaced', self.retry_after()))
+        self._grant()
+
+    def _leave(self, waiter: _Waiter) -> None:
+        waiter.active = False
+        self.queue_depth -= 1
+        if len(self._heap) > 2 * (self.queue_depth + 1):
+            self._heap = [w for w in self._heap if w.active]
+            heapq.heapify(self._heap)
+
+    def _expire(self, waiter: _Waiter) -> None:
+        if not waiter.active:
+            return
+        self._leave(waiter)
+        self.counters['timed_out'] += 1
+        waiter.future.set_exception(self._shed(waiter.priority, 'timeout', self.retry_after()))
+        self._grant()
+
+    async def acquire(self, priority: int = PRIORITY_STANDARD, weight: int = 1) -> bool:
+        """
+        Wait for `weight` slots; returns True if they were taken and must be `release`d.
+
+        Critical requests are admitted at once without a slot. Weights are
+        capped at `max_in_flight`.
+
+        Raises:
+            AdmissionRejected: The queue is full, the expected wait exceeds
+                the queue timeout, or the deadline passed while queued
+        """
+        if priority <= PRIORITY_CRITICAL:
+            self._count(priority, 'admitted')
+            return False
+        weight = min(max(1, weight), self.max_in_flight)
+        if self.in_flight + weight <= self.max_in_flight and not self.queue_depth:
+            self.in_flight += weight
+            self.counters['admitted'] += 1
+            self._count(priority, 'admitted')
+            return True
+        victim = None
+        if self.queue_depth >= self.max_queue:
+            victim = self._victim(priority)
+            if victim is None:
+                raise self._shed(priority, 'queue_full', self.retry_after())
+        # Checked before displacing anyone, so a request that is shed anyway costs no other request
+        wait = self.estimate_wait(priority, weight)
+        if wait is not None and wait > self.queue_timeout:
+            raise self._shed(priority, 'overloaded', max(1, math.ceil(wait)))
+        if victim is not None:
+            self._displace(victim)
+
+        loop = asyncio.get_running_loop()
+        self._seq += 1
+        waiter = _Waiter(priority, self._seq, loop.create_future(), time.monotonic(), weight)
+        heapq.heappush(self._heap, waiter)
+        self.queue_depth += 1
+        self.counters['queued'] += 1
+        self._count(priority, 'queued')
+        timer = loop.call_later(self.queue_timeout, self._expire, waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # Client went away: give back a slot handed over meanwhile, or leave the queue
+            if waiter.active:
+                self._leave(waiter)
+                self._grant()
+            elif not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release(weight=weight)
+            raise
+        finally:
+            timer.cancel()
+        waited = time.monotonic() - waiter.enqueued
+        metrics.observe('admission_queue_wait_seconds', waited, controller=self.name,
+                        priority=PRIORITY_NAMES[priority])
+        self.counters['admitted'] += 1
+        self._count(priority, 'admitted')
+        return True
+
+    def release(self, held: Optional[float] = None, weight: int = 1) -> None:
+        """Give back `weight` slots and hand them to waiters; `held` is how long they were used, in seconds."""
+        # Only single requests feed the service time; batches would skew it
+        if held is not None and weight == 1:
+            self._service_time = held if self._service_time is None else 0.8 * self._service_time + 0.2 * held
+        self.in_flight -= min(max(1, weight), self.max_in_flight)
+        self._grant()
+
+    def _grant(self) -> None:
+        """Admit waiters in priority order while their slots fit; a large head waiter is not overtaken."""
+        while self._heap:
+            waiter = self._heap[0]
+            if not waiter.active:
+                heapq.heappop(self._heap)
+                continue
+            if self.in_flight + waiter.weight > self.max_in_flight:
+                return
+            heapq.heappop(self._heap)
+            self._leave(waiter)
+            self.in_flight += waiter.weight
+            waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        waiting: Dict[str, int] = {}
+        for w in self._heap:
+            if w.active:
+                waiting[PRIORITY_NAMES[w.priority]] = waiting.get(PRIORITY_NAMES[w.priority], 0) + 1
+        return {
+            'max_in_flight': self.max_in_flight,
+            'max_queue': self.max_queue,
+            'queue_timeout_seconds': self.queue_timeout,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'queued_by_priority': waiting,
+            'avg_service_seconds': round(self._service_time, 3) if self._service_time is not None else None,
+            'retry_after_seconds': self.retry_after(),
+            **self.counters,
+        }
+
+
+def _premium_keys() -> FrozenSet[str]:
+    return frozenset(k.strip() for k in os.getenv("PREMIUM_API_KEYS", "").split(',') if k.strip())
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying an `AdmissionController` to the chat routes.
+
+    Requests under `paths` take a slot for their whole lifetime (streamed
+    responses included). Paths in `weights` take as many slots as their
+    weight function returns for the request body (e.g. a batch's
+    concurrency). A bearer token or ``X-API-Key`` listed in
+    PREMIUM_API_KEYS puts the request in the premium class; requests under
+    `critical_paths` are admitted unconditionally. Shed requests get a 503
+    with a ``Retry-After`` header.
+    """
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None,
+                 paths: Tuple[str, ...] = ('/api/chat',),
+                 critical_paths: Tuple[str, ...] = ('/api/health', '/api/ready', '/metrics'),
+                 premium_keys: Optional[Iterable[str]] = None,
+                 weights: Optional[Dict[str, Callable[[bytes], int]]] = None):
+        self.app = app
+        self.weights = weights or {}
+        self.controller = controller or get_admission_controller()
+        self.paths = tuple(paths)
+        self.critical_paths = tuple(critical_paths)
+        self.premium_keys = frozenset(premium_keys) if premium_keys is not None else _premium_keys()
+
+    def _is_premium(self, scope) -> bool:
+        if not self.premium_keys:
+            return False
+        for name, value in scope.get('headers', ()):
+            if name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                if scheme.lower() != 'bearer':
+                    continue
+            elif name == b'x-api-key':
+                token = value.decode('latin-1')
+            else:
+                continue
+            token = token.strip()
+            if any(hmac.compare_digest(token, key) for key in self.premium_keys):
+                return True
+        return False
+
+    def classify(self, scope) -> Optional[int]:
+        """Priority class of a request, or None if it is not subject to admission control."""
+        path = scope.get('path', '')
+        if path.startswith(self.critical_paths):
+            return PRIORITY_CRITICAL
+        if not path.startswith(self.paths):
+            return None
+        return PRIORITY_PREMIUM if self._is_premium(scope) else PRIORITY_STANDARD
+
+    async def __call__(self, scope, receive, send):
+        priority = self.classify(scope) if scope['type'] == 'http' else None
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        weight = 1
+        weigh = self.weights.get(scope.get('path'))
+        if weigh is not None and priority > PRIORITY_CRITICAL:
+            body, receive = await _buffer_body(receive)
+            try:
+                weight = int(weigh(body))
+            except Exception:
+                # The endpoint rejects malformed bodies itself
+                weight = 1
+        try:
+            held = await self.controller.acquire(priority, weight)
+        except AdmissionRejected as e:
+            retry_after = max(1, math.ceil(e.retry_after))
+            logger.warning("Shedding %s %s: %s", PRIORITY_NAMES[priority], scope.get('path'), e.reason)
+            response = JSONResponse(
+                status_code=503,
+                content={"response": "The assistant is busy right now. Please try again shortly.",
+                         "context": None, "retry_after": retry_after},
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if held:
+                self.controller.release(time.monotonic() - started, weight)
+
+
+async def _buffer_body(receive):
+    """Read the whole request body; returns it and a `receive` that replays it to the app."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    body = b''.join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+
+    return body, replay
+
+
+_admission_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Process-wide admission controller for the chat endpoints, configured from the environment."""
+    global _admission_controller
+    if _admission_controller is None:
+        with _controller_lock:
+            if _admission_controller is None:
+                controller = AdmissionController()
+                metrics.gauge('admission_in_flight', lambda: controller.in_flight, controller=controller.name)
+                metrics.gauge('admission_queue_depth', lambda: controller.queue_depth, controller=controller.name)
+                _admission_controller = controller
+    return _admission_controller
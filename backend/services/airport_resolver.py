@@ -0,0 +1,206 @@
+"""
+Offline airport and city resolution backed by the bundled data/airports.json.
+"""
+import os
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Set
+from .text_utils import normalize
+
+logger = logging.getLogger(__name__)
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ('children', 'codes')
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.codes: List[str] = []
+
+
+class AirportResolver:
+    """
+    Resolve IATA codes, metro codes, city and airport names to airport codes.
+
+    All indexes (exact IATA, normalized names, prefix trie, trigram index) are
+    built once from the dataset so lookups are dictionary or short trie walks.
+    """
+
+    # Minimum trigram similarity for a fuzzy (typo tolerant) match
+    FUZZY_THRESHOLD = 0.6
+    # Shortest input that may be resolved by prefix
+    MIN_PREFIX = 4
+
+    def __init__(self, data_path: Optional[str] = None):
+        """
+        Args:
+            data_path: Airport dataset path (defaults to backend/data/airports.json)
+        """
+        self.data_path = data_path or os.path.join(os.path.dirname(__file__), '../data/airports.json')
+        self.airports: Dict[str, Dict] = {}
+        self.metros: Dict[str, List[str]] = {}
+        self.metro_names: Dict[str, str] = {}
+        self._names: Dict[str, List[str]] = {}
+        self._trie = _TrieNode()
+        self._trigram_index: Dict[str, Set[str]] = {}
+        self._trigram_counts: Dict[str, int] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> "AirportResolver":
+        """Load the dataset and build the indexes (idempotent)."""
+        if self._loaded:
+            return self
+        with self._lock:
+            if self._loaded:
+                return self
+            with open(self.data_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for airport in data.get('airports', []):
+                code = airport['iata']
+                self.airports[code] = airport
+                if airport.get('metro'):
+                    self.metros.setdefault(airport['metro'], []).append(code)
+                self._add_name(airport['city'], code)
+                self._add_name(airport['name'], code)
+                # "London Heathrow Airport" is also findable as "london heathrow"
+                short_name = normalize(airport['name']).replace(' international', '').replace(' airport', '')
+                self._add_name(short_name, code)
+            self.metro_names = data.get('metros', {})
+            for metro, city in self.metro_names.items():
+                primary = self.metros.get(metro, [])
+                if primary:
+                    # Dataset order puts the primary airport first
+                    self._names[normalize(city)] = list(dict.fromkeys(primary + self._names.get(normalize(city), [])))
+            for alias, code in data.get('aliases', {}).items():
+                self._add_name(alias, code, front=True)
+            for name, codes in self._names.items():
+                node = self._trie
+                for ch in name:
+                    node = node.children.setdefault(ch, _TrieNode())
+                    for code in codes:
+                        if code not in node.codes:
+                            node.codes.append(code)
+                if name.endswith(' airport'):
+                    # Full airport names are covered by their short form; keeping them
+                    # out of the trigram index keeps common grams ("air", "por") cheap
+                    continue
+                grams = _trigrams(name)
+                self._trigram_counts[name] = len(grams)
+                for gram in grams:
+                    self._trigram_index.setdefault(gram, set()).add(name)
+            self._loaded = True
+            logger.info("Airport resolver loaded %d airports, %d metro areas", len(self.airports), len(self.metros))
+        return self
+
+    def _add_name(self, name: str, code: str, front: bool = False) -> None:
+        key = normalize(name).strip()
+        codes = self._names.setdefault(key, [])
+        if code in codes:
+            return
+        if front:
+            codes.insert(0, code)
+        else:
+            codes.append(code)
+
+    def _fuzzy(self, key: str) -> Optional[str]:
+        grams = _trigrams(key)
+        counts: Dict[str, int] = {}
+        for gram in grams:
+            for name in self._trigram_index.get(gram, ()):
+                counts[name] = counts.get(name, 0) + 1
+        best, best_score = None, 0.0
+        for name, shared in counts.items():
+            # Dice coefficient over trigram sets
+            score = 2 * shared / (len(grams) + self._trigram_counts[name])
+            if score > best_score:
+                best, best_score = name, score
+        if best is not None and best_score >= self.FUZZY_THRESHOLD:
+            return best
+        return None
+
+    def resolve(self, query: str, fuzzy: bool = True) -> Optional[str]:
+        """
+        Resolve a code or place name to a single airport code.
+
+        Order: airport IATA code, metro code (primary airport), exact
+        city/airport name or alias, unique prefix, then fuzzy match.
+
+        Args:
+            query: e.g. 'LHR', 'LON', 'london', 'heathrow', 'londn'
+            fuzzy: Allow typo-tolerant trigram matching
+
+        Returns:
+            IATA airport code, or None if nothing matches confidently
+        """
+        self.load()
+        if not query or not query.strip():
+            return None
+        raw = query.strip()
+        if len(raw) == 3 and raw.isalpha():
+            code = raw.upper()
+            if code in self.airports:
+                return code
+            if code in self.metros:
+                return self.metros[code][0]
+        key = normalize(raw)
+        codes = self._names.get(key)
+        if codes:
+            return codes[0]
+        if len(key) >= self.MIN_PREFIX:
+            node = self._trie
+            for ch in key:
+                node = node.children.get(ch)
+                if node is None:
+                    break
+            else:
+                cities = {self.airports[c]['city'] for c in node.codes}
+                if len(cities) == 1:
+                    return node.codes[0]
+        if fuzzy and len(key) >= self.MIN_PREFIX:
+            name = self._fuzzy(key)
+            if name is not None:
+                return self._names[name][0]
+        return None
+
+    def expand(self, query: str) -> List[str]:
+        """
+        All airports serving a metro code or its city, e.g. 'LON' -> LHR, LGW, STN, ...
+
+        Falls back to `[resolve(query)]` for single-airport places.
+        """
+        self.load()
+        raw = (query or '').strip()
+        code = raw.upper()
+        if len(raw) == 3 and code in self.metros and code not in self.airports:
+            return list(self.metros[code])
+        code = self.resolve(raw)
+        if code is None:
+            return []
+        airport = self.airports.get(code, {})
+        metro = airport.get('metro')
+        if metro and normalize(raw) == normalize(self.metro_names.get(metro, airport['city'])):
+            # The metro's city name means any of its airports; an airport code, name or
+            # alias (including a satellite city such as 'newark') means just that one
+            return list(self.metros[metro])
+        return [code]
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Airports whose city or name starts with `prefix` (for autocomplete)."""
+        self.load()
+        node = self._trie
+        for ch in normalize(prefix):
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return [self.airports[c] for c in node.codes[:limit] if c in self.airports]
+
+
+# Singleton instance (indexes are built on first use or at startup via load())
+airport_resolver = AirportResolver()
@@ -0,0 +1,107 @@
+"""
+Incrementally updatable in-memory BM25 index used for ranked lexical retrieval.
+"""
+import heapq
+import math
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+# Words that carry no retrieval signal in travel chat messages
+STOPWORDS = frozenset("""
+a an and are as at be by can do for from get give i in is it me my need next of on or please
+show some than that the this to want week what when where which with would you
+""".split())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over tokenized documents.
+
+    Term frequencies are kept in per-term postings and corpus statistics
+    (document frequency, lengths) are maintained on every add/remove, so a
+    changed document can be swapped without rebuilding the index.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {doc_id: term frequency}
+        self.postings: Dict[str, Dict[Hashable, int]] = {}
+        self.doc_lengths: Dict[Hashable, int] = {}
+        self._doc_terms: Dict[Hashable, Tuple[str, ...]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self.doc_lengths
+
+    def copy(self) -> "BM25Index":
+        """Independent copy, so updating it leaves this index untouched for concurrent readers."""
+        clone = BM25Index(self.k1, self.b)
+        clone.postings = {term: dict(docs) for term, docs in self.postings.items()}
+        clone.doc_lengths = dict(self.doc_lengths)
+        clone._doc_terms = dict(self._doc_terms)
+        clone._total_length = self._total_length
+        return clone
+
+    @staticmethod
+    def terms(tokens: Iterable[str]) -> List[str]:
+        """Drop stopwords from a token sequence."""
+        return [t for t in tokens if t not in STOPWORDS]
+
+    def add(self, doc_id: Hashable, tokens: Iterable[str]) -> None:
+        """Index a document, replacing any previous version with the same id."""
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(self.terms(tokens))
+        length = sum(counts.values())
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_lengths[doc_id] = length
+        self._doc_terms[doc_id] = tuple(counts)
+        self._total_length += length
+
+    def remove(self, doc_id: Hashable) -> None:
+        """Remove a document from the index if present."""
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._doc_terms.pop(doc_id):
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency (always positive)."""
+        n = len(self.doc_lengths)
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, tokens: Iterable[str], k: int) -> List[Tuple[Hashable, float]]:
+        """
+        Score documents sharing at least one term with the query.
+
+        Args:
+            tokens: Query tokens
+            k: Number of results to return
+
+        Returns:
+            Up to `k` (doc_id, score) pairs, best first
+        """
+        if not self.doc_lengths or k <= 0:
+            return []
+        avg_length = self._total_length / len(self.doc_lengths) or 1.0
+        scores: Dict[Hashable, float] = {}
+        for term in set(self.terms(tokens)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
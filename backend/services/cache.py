@@ -0,0 +1,201 @@
+"""
+In-process TTL + LRU cache with size bounds, hit/miss counters and single-flight loads.
+"""
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+def json_size(value: Any) -> int:
+    """Approximate the memory cost of a JSON-like value by its serialized length."""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class TTLCache:
+    """
+    Least-recently-used cache whose entries also expire after a fixed TTL.
+
+    Bounded both by entry count and by the approximate total size of the
+    stored values. Sync operations are guarded by a lock so the cache can be
+    shared between the event loop and worker threads; `get_or_fetch` adds
+    single-flight deduplication for concurrent async misses on the same key.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024, max_bytes: Optional[int] = None,
+                 sizer: Callable[[Any], int] = json_size, stale_ttl: float = 0.0):
+        """
+        Args:
+            ttl: Seconds an entry stays fresh
+            max_entries: Maximum number of entries before LRU eviction
+            max_bytes: Optional bound on the summed `sizer` cost of all values
+            sizer: Function estimating the size of a value in bytes
+            stale_ttl: Seconds an expired entry is kept for `get_stale`
+                (served when the upstream is unavailable)
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        # key -> (expires_at, size, value)
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the fresh value for `key` (marking it recently used) or `default`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            now = time.monotonic()
+            if entry[0] <= now:
+                # Expired entries stay around for `get_stale` until the stale window ends
+                if entry[0] + self.stale_ttl <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for `key` even if expired, as long as it is within `stale_ttl`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + self.stale_ttl <= time.monotonic():
+                return default
+            self.stale_hits += 1
+            return entry[2]
+
+    def expires_in(self, key: Hashable) -> Optional[float]:
+        """Seconds until `key` expires (negative once expired), or None if absent; counters and LRU order are untouched."""
+        entry = self._entries.get(key)
+        return entry[0] - time.monotonic() if entry is not None else None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store `value` under `key`, evicting least recently used entries as needed."""
+        size = self.sizer(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Drop `key` if present."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Remove all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]],
+                           should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Return the cached value for `key` or load it with `fetch`.
+
+        Concurrent callers missing on the same key share a single `fetch`
+        call; errors are propagated to every waiter and never cached. If the
+        caller running `fetch` is cancelled, a waiting caller takes over.
+
+        Args:
+            key: Cache key
+            fetch: Zero-argument coroutine function producing the value
+            should_cache: Predicate deciding whether a fetched value is stored
+
+        Returns:
+            The cached or freshly fetched value
+        """
+        sentinel = object()
+        while True:
+            value = self.get(key, sentinel)
+            if value is not sentinel:
+                return value
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            # Unlike awaiting the future, wait() raises only on our own cancellation
+            # and leaves the shared future alone
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                return pending.result()
+            # The leader was cancelled: retry and possibly become the new leader
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Mark retrieved so an unawaited failure is not logged as lost
+                future.exception()
+            raise
+        else:
+            if should_cache(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters and occupancy for metrics/debug endpoints."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'coalesced': self.coalesced,
+            'stale_hits': self.stale_hits,
+            'inflight': len(self._inflight),
+        }
@@ -0,0 +1,406 @@
+"""
+Cache backends shared by all worker processes (L2 behind the in-process TTL caches).
+
+Select with CACHE_BACKEND:
+
+- ``sqlite`` (default): a SQLite database in shared memory (/dev/shm when
+  available), safe for concurrent use by forked workers on one host
+- ``redis``: any Redis-compatible server at CACHE_REDIS_URL (needs the
+  optional ``redis`` package)
+- ``memory``: per-process only, for tests and single-worker runs
+- ``none``: disable the shared layer
+"""
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def _default_sqlite_path() -> str:
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, 'travel-assistant-cache.sqlite')
+
+
+class CacheBackend:
+    """
+    String key/value store with per-entry TTL.
+
+    Values are strings; callers serialize (JSON for flight results, LangChain
+    `dumps` for LLM generations). Async methods default to the sync ones,
+    which is appropriate for in-process stores whose operations take
+    microseconds; backends doing I/O override them so the event loop never
+    waits on a socket or file lock.
+    """
+    name = 'base'
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return the value at `key` with its remaining lifetime in seconds, or None."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        """
+        Atomically add `amount` to the counter at `key` and return the new total.
+
+        A missing or expired counter starts from zero and lives for `ttl`
+        seconds from its first increment. Returns None if the backend
+        cannot count (callers then fall back to a per-process count).
+        """
+        return None
+
+    async def aget(self, key: str) -> Optional[str]:
+        return self.get(key)
+
+    async def aget_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        return self.get_with_ttl(key)
+
+    async def aset(self, key: str, value: str, ttl: float) -> None:
+        self.set(key, value, ttl)
+
+    async def aincr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        return self.incr(key, amount, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name}
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process backend (not shared between workers)."""
+    name = 'memory'
+
+    def __init__(self, max_entries: int = 4096):
+        self._cache = TTLCache(ttl=3600, max_entries=max_entries)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        value = self._cache.get(key)
+        expires_in = self._cache.expires_in(key)
+        return (value, expires_in) if value is not None and expires_in is not None else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._cache.set(key, value, ttl=ttl)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        with self._lock:
+            total = int(self._cache.get(key) or 0) + amount
+            expires_in = self._cache.expires_in(key)
+            self._cache.set(key, str(total), ttl=expires_in if expires_in is not None and expires_in > 0 else ttl)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, **self._cache.stats()}
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite file shared by all processes on the host.
+
+    Uses WAL so readers never block on the writer, and one connection per
+    thread and process (connections are reopened after fork). Expired rows
+    are purged and the row count is bounded every `purge_every` writes.
+    Async methods run in the default thread pool, since a write may wait
+    up to the busy timeout for another process's lock.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None, purge_every: int = 256):
+        """
+        Args:
+            path: Database file (CACHE_SQLITE_PATH, default /dev/shm/travel-assistant-cache.sqlite)
+            max_entries: Row bound (CACHE_MAX_ENTRIES, default 20000)
+            purge_every: Writes between purges of expired and excess rows
+        """
+        self.path = path or os.getenv("CACHE_SQLITE_PATH") or _default_sqlite_path()
+        self.max_entries = max_entries or int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        return (row[0], row[1] - now) if row is not None else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def _purge(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        # Beyond the bound, drop the entries closest to expiry
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "value = CASE WHEN expires_at > ? THEN CAST(value AS INTEGER) + ? ELSE ? END, "
+                "expires_at = CASE WHEN expires_at > ? THEN expires_at ELSE excluded.expires_at END "
+                "RETURNING value",
+                (key, amount, now + ttl, now, amount, amount, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared counter update failed: {e}")
+            return None
+        return int(row[0])
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aget_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        return await asyncio.to_thread(self.get_with_ttl, key)
+
+    async def aset(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    async def aincr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        return await asyncio.to_thread(self.incr, key, amount, ttl)
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.name,
+            'path': self.path,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class RedisBackend(CacheBackend):
+    """Redis (or any Redis-compatible server) backend; shares hits across hosts too."""
+    name = 'redis'
+
+    def __init__(self, url: Optional[str] = None, prefix: str = 'travel:'):
+        """
+        Args:
+            url: Server URL (CACHE_REDIS_URL, default redis://localhost:6379/0)
+            prefix: Namespace prepended to every key
+        """
+        try:
+            import redis
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise ImportError("CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.url = url or os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        self.prefix = prefix
+        self._sync = redis.Redis.from_url(self.url, decode_responses=True, socket_timeout=1)
+        self._aioredis = aioredis
+        # One async client per event loop (each worker runs its own loop)
+        self._async: Dict[int, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _client(self):
+        loop_id = id(asyncio.get_running_loop())
+        client = self._async.get(loop_id)
+        if client is None:
+            client = self._async[loop_id] = self._aioredis.Redis.from_url(
+                self.url, decode_responses=True, socket_timeout=1
+            )
+        return client
+
+    def _count(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self._count(self._sync.get(self.prefix + key))
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            value, ttl_ms = self._sync.pipeline(transaction=False).get(self.prefix + key).pttl(self.prefix + key).execute()
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        return (value, ttl_ms / 1000) if value is not None and ttl_ms > 0 else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        try:
+            self._sync.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    async def aget(self, key: str) -> Optional[str]:
+        try:
+            return self._count(await self._client().get(self.prefix + key))
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+
+    async def aget_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            async with self._client().pipeline(transaction=False) as pipe:
+                value, ttl_ms = await pipe.get(self.prefix + key).pttl(self.prefix + key).execute()
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        return (value, ttl_ms / 1000) if value is not None and ttl_ms > 0 else None
+
+    async def aset(self, key: str, value: str, ttl: float) -> None:
+        try:
+            await self._client().set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        try:
+            total = self._sync.incrby(self.prefix + key, amount)
+            if total == amount:
+                self._sync.pexpire(self.prefix + key, max(1, int(ttl * 1000)))
+            return int(total)
+        except Exception as e:
+            logger.warning(f"Shared counter update failed: {e}")
+            return None
+
+    async def aincr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        try:
+            client = self._client()
+            total = await client.incrby(self.prefix + key, amount)
+            if total == amount:
+                await client.pexpire(self.prefix + key, max(1, int(ttl * 1000)))
+            return int(total)
+        except Exception as e:
+            logger.warning(f"Shared counter update failed: {e}")
+            return None
+
+    def delete(self, key: str) -> None:
+        self._sync.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        keys = list(self._sync.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self._sync.delete(*keys)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_UNSET = object()
+_shared_cache: Any = _UNSET
+_shared_cache_lock = threading.Lock()
+
+
+def create_cache_backend(kind: Optional[str] = None) -> Optional[CacheBackend]:
+    """Build the backend named by `kind` (CACHE_BACKEND), or None when disabled."""
+    kind = (kind or os.getenv("CACHE_BACKEND", "sqlite")).lower()
+    if kind in ('none', 'off', ''):
+        return None
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'redis':
+        try:
+            return RedisBackend()
+        except ImportError as e:
+            logger.warning(f"{e}; falling back to the SQLite shared cache")
+    elif kind != 'sqlite':
+        logger.warning(f"Unknown CACHE_BACKEND '{kind}', using sqlite")
+    return SQLiteBackend()
+
+
+def get_shared_cache() -> Optional[CacheBackend]:
+    """Process-wide shared cache backend (None when disabled), created on first use."""
+    global _shared_cache
+    if _shared_cache is _UNSET:
+        with _shared_cache_lock:
+            if _shared_cache is _UNSET:
+                _shared_cache = create_cache_backend()
+    return _shared_cache
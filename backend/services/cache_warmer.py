@@ -0,0 +1,261 @@
+"""
+Background refresh of popular flight searches before their cache entries expire.
+
+Every flight search is recorded in a Space-Saving heavy-hitter sketch, so
+the most requested route/date searches are known in bounded memory. A
+periodic task re-fetches the top ones that are missing from the local
+result cache or about to expire, so the next user finds them warm.
+
+Refreshes spend only spare SerpApi budget:
+
+- they run at `PRIORITY_BACKGROUND` through the SerpApi scheduler, behind
+  every interactive search;
+- a tick is skipped unless the scheduler queue is empty and the token
+  bucket holds more than its interactive reserve (``1 - budget_share`` of
+  the burst);
+- at most ``budget_share`` of the sustained rate and of the quota window
+  are used for refreshes (the quota share is split between workers).
+
+Each worker process runs its own warmer, and refreshed results also land in
+the shared cache. Before spending budget on a due search, a warmer adopts
+the shared entry if another worker has already refreshed it, so a popular
+search is fetched about once per cycle rather than once per worker.
+"""
+import os
+import time
+import asyncio
+import logging
+import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .flight_query_schema import FlightQuery
+from .rate_limiter import PRIORITY_BACKGROUND, worker_count
+from .tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('cache_warmer_refreshes_total', "Background flight search refreshes by outcome")
+metrics.describe('cache_warmer_lookups_total', "Searches for warm-set routes by whether a refreshed entry served them")
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-K sketch (Metwally et al.): at most `capacity` counters.
+
+    A new key replaces the key with the smallest count and inherits that
+    count as its overestimation `error`, so any key seen more than
+    total/capacity times is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, float] = {}
+        self.errors: Dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.counts
+
+    def add(self, key: Hashable, weight: float = 1.0) -> Optional[Hashable]:
+        """Count one occurrence of `key`; return the key it evicted, if any."""
+        if key in self.counts:
+            self.counts[key] += weight
+            return None
+        if len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0.0
+            return None
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        del self.errors[victim]
+        self.counts[key] = floor + weight
+        self.errors[key] = floor
+        return victim
+
+    def top(self, k: int) -> List[Tuple[Hashable, float, float]]:
+        """The `k` keys with the highest counts as (key, count, error), highest first."""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+    def decay(self, factor: float = 0.5) -> List[Hashable]:
+        """Scale every count by `factor` so popularity follows recent traffic; return dropped keys."""
+        dropped = []
+        for key in list(self.counts):
+            self.counts[key] *= factor
+            self.errors[key] *= factor
+            if self.counts[key] < 0.5:
+                del self.counts[key], self.errors[key]
+                dropped.append(key)
+        return dropped
+
+
+class CacheWarmer:
+    """Periodic refresher of the most requested flight searches (see module docstring)."""
+
+    def __init__(self, flights_service, top_k: Optional[int] = None, capacity: Optional[int] = None,
+                 interval: Optional[float] = None, refresh_ahead: Optional[float] = None,
+                 budget_share: Optional[float] = None, min_count: Optional[float] = None,
+                 decay_interval: Optional[float] = None):
+        """
+        Args:
+            flights_service: SerpApiFlightsService whose cache is kept warm
+            top_k: Searches kept warm (WARM_TOP_K, default 20)
+            capacity: Counters in the heavy-hitter sketch (WARM_SKETCH_SIZE, default 256)
+            interval: Seconds between refresh passes (WARM_INTERVAL, default 15)
+            refresh_ahead: Refresh entries expiring within this many seconds (WARM_REFRESH_AHEAD, default 120)
+            budget_share: Share of the SerpApi rate, burst and quota refreshes may use (WARM_BUDGET_SHARE, default 0.2)
+            min_count: Requests needed before a search is warmed (WARM_MIN_COUNT, default 2)
+            decay_interval: Seconds between halvings of the popularity counts (WARM_DECAY_INTERVAL, default 600)
+        """
+        self.flights_service = flights_service
+        self.top_k = top_k if top_k is not None else int(os.getenv("WARM_TOP_K", "20"))
+        self.sketch = SpaceSaving(capacity if capacity is not None else int(os.getenv("WARM_SKETCH_SIZE", "256")))
+        self.interval = interval if interval is not None else float(os.getenv("WARM_INTERVAL", "15"))
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else float(os.getenv("WARM_REFRESH_AHEAD", "120"))
+        self.budget_share = budget_share if budget_share is not None else float(os.getenv("WARM_BUDGET_SHARE", "0.2"))
+        self.min_count = min_count if min_count is not None else float(os.getenv("WARM_MIN_COUNT", "2"))
+        self.decay_interval = decay_interval if decay_interval is not None else float(os.getenv("WARM_DECAY_INTERVAL", "600"))
+        self._queries: Dict[Hashable, FlightQuery] = {}
+        # Keys whose current cache entry was written by a refresh
+        self._refreshed: Dict[Hashable, float] = {}
+        self._quota_window: Optional[int] = None
+        self._quota_used = 0
+        self._last_decay = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {'refreshes': 0, 'refresh_failures': 0, 'skipped_busy': 0, 'adopted': 0,
+                         'refresh_hits': 0, 'refresh_misses': 0}
+
+    def record(self, query: FlightQuery) -> None:
+        """Count a user search; call before it is served so cache freshness reflects the warmer's work."""
+        key = query.cache_key()
+        if key in self.sketch and self.sketch.counts[key] >= self.min_count:
+            expires_in = self.flights_service.cache.expires_in(key)
+            hit = key in self._refreshed and expires_in is not None and expires_in > 0
+            self.counters['refresh_hits' if hit else 'refresh_misses'] += 1
+            metrics.inc('cache_warmer_lookups_total', result='hit' if hit else 'miss')
+        evicted = self.sketch.add(key)
+        self._queries[key] = query
+        if evicted is not None:
+            self._forget(evicted)
+
+    def _forget(self, key: Hashable) -> None:
+        self._queries.pop(key, None)
+        self._refreshed.pop(key, None)
+
+    def warm_set(self) -> List[Tuple[Hashable, float, float]]:
+        """Top searches eligible for refreshing, most popular first."""
+        return [(key, count, error) for key, count, error in self.sketch.top(self.top_k) if count >= self.min_count]
+
+    def _refresh_budget(self) -> int:
+        """Refreshes allowed this pass: spare tokens, a share of the rate, and a share of the quota window."""
+        scheduler = self.flights_service.scheduler
+        if scheduler.queue_depth:
+            return 0
+        spare = scheduler.bucket.tokens - scheduler.bucket.burst * (1 - self.budget_share)
+        budget = min(int(spare), max(1, int(self.budget_share * scheduler.bucket.rate * self.interval)))
+        quota = scheduler.quota
+        if quota.limit:
+            window = int(time.time() // quota.period) if quota.period else 0
+            if window != self._quota_window:
+                self._quota_window, self._quota_used = window, 0
+            # The quota is shared by all workers; each warmer gets its part of the share
+            budget = min(budget, int(self.budget_share * quota.limit / worker_count()) - self._quota_used)
+        return max(0, budget)
+
+    async def tick(self) -> int:
+        """One refresh pass; returns the number of searches refreshed."""
+        now = time.monotonic()
+        if now - self._last_decay >= self.decay_interval:
+            self._last_decay = now
+            for key in self.sketch.decay():
+                self._forget(key)
+        due = []
+        today = datetime.date.today()
+        for key, _, _ in self.warm_set():
+            query = self._queries.get(key)
+            if query is None or query.departure_date < today:
+                continue
+            expires_in = self.flights_service.cache.expires_in(key)
+            if expires_in is None or expires_in < self.refresh_ahead:
+                due.append(query)
+        adopted = []
+        for query in due:
+            if await self.flights_service.aadopt_shared(query, self.refresh_ahead):
+                adopted.append(query)
+                self._refreshed[query.cache_key()] = time.time()
+        if adopted:
+            self.counters['adopted'] += len(adopted)
+            metrics.inc('cache_warmer_refreshes_total', len(adopted), outcome='adopted')
+            due = [query for query in due if query not in adopted]
+        if not due:
+            return 0
+        budget = self._refresh_budget()
+        if budget < len(due):
+            self.counters['skipped_busy'] += len(due) - budget
+            metrics.inc('cache_warmer_refreshes_total', len(due) - budget, outcome='skipped')
+        refreshed = 0
+        for query in due[:budget]:
+            self._quota_used += 1
+            try:
+                stored = await self.flights_service.arefresh_query(query, priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                logger.info("Refreshing %s failed: %s", query.cache_key(), e)
+                stored = False
+            outcome = 'refreshed' if stored else 'failed'
+            self.counters['refreshes' if stored else 'refresh_failures'] += 1
+            metrics.inc('cache_warmer_refreshes_total', outcome=outcome)
+            if stored:
+                self._refreshed[query.cache_key()] = time.time()
+                refreshed += 1
+        return refreshed
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.exception("Cache warmer pass failed: %s", e)
+
+    def start(self) -> None:
+        """Start the refresh loop on the running event loop (no-op if already running)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info("Cache warmer started: top %d searches every %.0fs", self.top_k, self.interval)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Warm set with popularity and freshness, plus refresh and refresh-hit counters."""
+        lookups = self.counters['refresh_hits'] + self.counters['refresh_misses']
+        warm = []
+        for key, count, error in self.warm_set():
+            expires_in = self.flights_service.cache.expires_in(key)
+            refreshed_at = self._refreshed.get(key)
+            warm.append({
+                'route': f"{key[0]}-{key[1]}",
+                'departure_date': key[2],
+                'return_date': key[3],
+                'count': round(count, 1),
+                'error': round(error, 1),
+                'expires_in_seconds': round(expires_in, 1) if expires_in is not None else None,
+                'last_refreshed': (datetime.datetime.fromtimestamp(refreshed_at).isoformat(timespec='seconds')
+                                   if refreshed_at else None),
+            })
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'tracked': len(self.sketch),
+            'warm_set': warm,
+            **self.counters,
+            'refresh_hit_rate': round(self.counters['refresh_hits'] / lookups, 4) if lookups else 0.0,
+            'budget_share': self.budget_share,
+        }
@@ -0,0 +1,133 @@
+"""
+Incremental chat events (LLM tokens, tool progress) for streaming responses.
+"""
+import json
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import AsyncCallbackHandler, BaseCallbackHandler
+from .tracing import Span, metrics, span
+
+logger = logging.getLogger(__name__)
+
+# Event stream of the chat request being processed in the current task, if it is streamed
+current_event_stream: ContextVar[Optional["ChatEventStream"]] = ContextVar("current_event_stream", default=None)
+
+
+class ChatEventStream:
+    """
+    Bounded queue of (event, data) pairs between the agent and an HTTP response.
+
+    Producers block once `maxsize` events are pending, so a slow client slows
+    the upstream LLM stream down instead of buffering without limit.
+    """
+
+    _CLOSED = object()
+
+    def __init__(self, maxsize: int = 64, heartbeat: float = 15.0):
+        """
+        Args:
+            maxsize: Maximum number of undelivered events
+            heartbeat: Seconds of silence after which a keep-alive is yielded
+        """
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.heartbeat = heartbeat
+
+    async def emit(self, event: str, data: Dict[str, Any]) -> None:
+        """Queue an event, waiting while the consumer is behind."""
+        await self._queue.put((event, data))
+
+    async def close(self) -> None:
+        """Signal the consumer that no more events will follow."""
+        await self._queue.put(self._CLOSED)
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Yield events until closed; yields ('ping', {}) after `heartbeat` seconds of silence."""
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=self.heartbeat)
+            except asyncio.TimeoutError:
+                yield 'ping', {}
+                continue
+            if item is self._CLOSED:
+                return
+            yield item
+
+
+async def emit_progress(event: str, **data: Any) -> None:
+    """Emit an event on the current request's stream; a no-op for non-streamed requests."""
+    stream = current_event_stream.get()
+    if stream is not None:
+        await stream.emit(event, data)
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Serialize one event in Server-Sent Events wire format."""
+    if event == 'ping':
+        return ": ping\n\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class EventStreamCallbackHandler(AsyncCallbackHandler):
+    """LangChain callback forwarding LLM tokens and tool lifecycle to a ChatEventStream."""
+
+    def __init__(self, stream: ChatEventStream):
+        self.stream = stream
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        # Function-call chunks arrive with empty content
+        if token:
+            await self.stream.emit('token', {'text': token})
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        await self.stream.emit('tool_start', {'tool': (serialized or {}).get('name')})
+
+    async def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        await self.stream.emit('tool_end', {'tool': kwargs.get('name')})
+
+    async def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        await self.stream.emit('tool_error', {'tool': kwargs.get('name'), 'error': str(error)})
+
+
+class LLMTracingCallbackHandler(BaseCallbackHandler):
+    """LangChain callback recording an `llm.call` span and token counts for every model call."""
+
+    # Run in the caller's task so spans land on the current request's trace
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[UUID, Span] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        model = ((kwargs.get('invocation_params') or {}).get('model_name')
+                 or (kwargs.get('invocation_params') or {}).get('model'))
+        self._spans[run_id] = span('llm.call', model=model).__enter__()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._spans[run_id] = span('llm.call').__enter__()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        s = self._spans.pop(run_id, None)
+        if s is None:
+            return
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = usage.get('prompt_tokens')
+        completion_tokens = usage.get('completion_tokens')
+        if prompt_tokens is None and response.generations and response.generations[0]:
+            # Streaming responses carry usage on the message instead
+            metadata = getattr(getattr(response.generations[0][0], 'message', None), 'usage_metadata', None) or {}
+            prompt_tokens = metadata.get('input_tokens')
+            completion_tokens = metadata.get('output_tokens')
+        if prompt_tokens is not None:
+            s.set('prompt_tokens', prompt_tokens)
+            s.set('completion_tokens', completion_tokens)
+            metrics.inc('llm_tokens_total', prompt_tokens, kind='prompt')
+            metrics.inc('llm_tokens_total', completion_tokens or 0, kind='completion')
+        s.__exit__(None, None, None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        s = self._spans.pop(run_id, None)
+        if s is not None:
+            s.__exit__(type(error), error, None)
@@ -1,51 +1,97 @@
 import os
+import re
+import time
+import asyncio
 import logging
 import datetime
-from typing import Dict, Any, Optional
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+import threading
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
 from .rag_service import RAGService
 from .serpapi_flights_service import SerpApiFlightsService
-from .flight_query_schema import FlightQuery
-
-# Configure logging
-LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
-LOG_PATH = os.path.join(LOG_DIR, 'backend.log')
-os.makedirs(LOG_DIR, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_PATH),
-        logging.StreamHandler()
-    ]
-)
+from .flight_query_schema import (FlightDetailsArgs, FlightQuery, FlightSearchArgs, FlexibleFlightSearchArgs,
+                                  LocalFlightSearchArgs)
+from .flight_fanout import FlightFanOutSearch, date_window
+from .flight_store import get_flight_store
+from .cache_warmer import CacheWarmer
+from .flight_projection import aflight_details, aproject_flights, flight_details, project_flights
+from .airport_resolver import airport_resolver
+from .flight_ranking import RankingCriteria, extract_flights, rank_flights
+from .intent_parser import FlightIntent, FollowUp, parse_flight_intent, parse_follow_up, parse_route
+from .session_store import Session, SessionStore, current_session
+from .llm_cache import LLMResponseCache
+from .cache_backend import get_shared_cache
+from .chat_events import (ChatEventStream, EventStreamCallbackHandler, LLMTracingCallbackHandler,
+                          current_event_stream, emit_progress)
+from .tracing import span
+from .logging_config import configure_logging
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+# Syntactically valid IATA codes are passed to SerpApi even when missing from the airport dataset
+IATA_CODE = re.compile(r'^[A-Za-z]{3}$')
+
+
+def map_to_airport(code):
+    """Resolve a city name, metro or airport code to an airport code; kgmids and unknown codes pass through."""
+    if not code:
+        return code
+    if code.startswith('/m/'):
+        return code
+    mapped = airport_resolver.resolve(code)
+    if mapped is None and IATA_CODE.match(code.strip()):
+        mapped = code.strip().upper()
+    if mapped and mapped != code:
+        logger.info("[map_to_airport] Mapped '%s' to airport code '%s'", code, mapped)
+    return mapped
+
+
+def resolve_airport(name: str) -> Optional[str]:
+    """Strict variant of `map_to_airport` for parsed free text: exact and prefix matches, then unknown codes."""
+    if not name:
+        return None
+    code = airport_resolver.resolve(name, fuzzy=False)
+    if code is None and IATA_CODE.match(name):
+        code = name.upper()
+    return code
+
+
+# Flight searches shared by the items of one batch (see ChatService.process_batch), by cache key
+batch_searches: ContextVar[Optional[Dict[Tuple, asyncio.Future]]] = ContextVar('batch_searches', default=None)
+
+
 class ChatService:
     def __init__(self):
         load_dotenv()
         self.api_key = os.getenv("API_KEY") 
         self.api_base = os.getenv("API_BASE") 
         self.model_name = os.getenv("MODEL_NAME")
-        logger.info(f"Initializing ChatService with model: {self.model_name}, API base: {self.api_base}")
+        logger.info("Initializing ChatService with model: %s, API base: %s", self.model_name, self.api_base)
         if not self.api_key:
             logger.error("API_KEY not found in environment variables")
             raise ValueError("API_KEY not found in environment variables")
         if not self.model_name:
             logger.error("MODEL_NAME not found in environment variables")
             raise ValueError("MODEL_NAME not found in environment variables")
+        # Imported here so importing this module stays cheap; built during warm-up
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_openai import ChatOpenAI
+        # Cache identical (and optionally near-duplicate) LLM calls; temperature is 0
+        self.llm_cache = LLMResponseCache(shared=get_shared_cache()) if os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true" else None
         # Initialize the language model
         self.llm = ChatOpenAI(
             model_name=self.model_name,
             temperature=0.0,
             max_tokens=1000,
             openai_api_key=self.api_key,
-            openai_api_base=self.api_base
+            openai_api_base=self.api_base,
+            cache=self.llm_cache,
+            callbacks=[LLMTracingCallbackHandler()]
         )
         logger.info("ChatOpenAI LLM initialized successfully.")
         
@@ -55,6 +101,8 @@ class ChatService:
             "If a user provides a city name, you must convert it to the correct IATA code before searching or responding. "
             "All flight dates (departure and return) must be in the future and never in the past. If the user provides a past date, ask them to provide a valid future date. "
             "Validate all flight parameters before searching. "
+            "Flight search results list ranked options with a result_ref; call get_flight_details only when the user asks about details not shown. "
+            "When the user is flexible about airports (e.g. 'any London airport') or dates (e.g. '±3 days'), use search_flights_flexible instead of several search_flights calls. "
             "Respond with clear, concise, and accurate flight information. "
             "If you cannot find a flight, apologize and explain why. "
         )
@@ -64,57 +112,33 @@ class ChatService:
 
         # Initialize SerpApi Flights service
         self.flights_service = SerpApiFlightsService()
+        self.fanout_search = FlightFanOutSearch(self.flights_service)
+        # Refreshes popular searches in the background; started by the app lifespan
+        self.cache_warmer = CacheWarmer(self.flights_service)
+
+        # Send compact, ranked projections of flight results to the LLM instead of raw SerpApi JSON
+        self.project_tool_output = os.getenv("TOOL_PROJECTION_ENABLED", "true").lower() == "true"
+
+        # Answer fully specified flight searches without the LLM
+        self.fast_path_enabled = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+
+        # Per-session turns, summary and last flight search
+        self.sessions = SessionStore()
+
+        def remember(query: FlightQuery):
+            self.cache_warmer.record(query)
+            session = current_session.get()
+            if session is not None:
+                self.sessions.remember_search(session, query)
 
         # Tool for LLM: search_flights
         from langchain.tools import StructuredTool
-        def search_flights_tool(departure_id: str, arrival_id: str, departure_date: str, return_date: str = None, gl: str = None, hl: str = None, currency: str = None, type: int = None):
-            # City/airport code mapping for common cities
-            city_to_airport = {
-                # London
-                "london": "LHR", "lon": "LHR", "lhr": "LHR",
-                "gatwick": "LGW", "lgw": "LGW",
-                "city": "LCY", "lcy": "LCY",
-                # New York
-                "new york": "JFK", "nyc": "JFK", "jfk": "JFK",
-                "ewr": "EWR", "newark": "EWR",
-                "lga": "LGA", "la guardia": "LGA",
-                # Paris
-                "paris": "CDG", "cdg": "CDG",
-                # Los Angeles
-                "los angeles": "LAX", "la": "LAX", "lax": "LAX",
-                # Tokyo
-                "tokyo": "HND", "hnd": "HND", "narita": "NRT", "nrt": "NRT",
-                # Dubai
-                "dubai": "DXB", "dxb": "DXB",
-                # Mumbai
-                "mumbai": "BOM", "bom": "BOM",
-                # Delhi
-                "delhi": "DEL", "del": "DEL",
-                # Singapore
-                "singapore": "SIN", "sin": "SIN",
-                # Sydney
-                "sydney": "SYD", "syd": "SYD",
-                # Toronto
-                "toronto": "YYZ", "yyz": "YYZ",
-                # San Francisco
-                "san francisco": "SFO", "sfo": "SFO",
-                # Chicago
-                "chicago": "ORD", "ord": "ORD",
-                # Miami
-                "miami": "MIA", "mia": "MIA",
-            }
-
-            def map_to_airport(code):
-                if not code:
-                    return code
-                code_lower = code.strip().lower()
-                mapped = city_to_airport.get(code_lower, code.upper())
-                if mapped != code:
-                    logger.info(f"[search_flights_tool] Mapped '{code}' to airport code '{mapped}'")
-                return mapped
-
+        def build_query(departure_id: str, arrival_id: str, departure_date: str, return_date: str = None, gl: str = None, hl: str = None, currency: str = None, type: int = None):
             departure_id_mapped = map_to_airport(departure_id)
             arrival_id_mapped = map_to_airport(arrival_id)
+            unknown = [p for p, m in ((departure_id, departure_id_mapped), (arrival_id, arrival_id_mapped)) if not m]
+            if unknown:
+                return None, {"error": f"Could not resolve airport or city: {', '.join(unknown)}. Please provide an IATA airport code."}
 
             # Determine type: if not provided, default to one-way (2); if return_date is present, set to round-trip (1)
             if type is None:
@@ -133,44 +157,146 @@ class ChatService:
                     currency=currency
                 )
             except Exception as e:
-                return {"error": f"Invalid flight search parameters: {e}"}
-            # Only pass type if not None
-            kwargs = {
-                'departure_id': query.departure_id,
-                'arrival_id': query.arrival_id,
-                'departure_date': str(query.departure_date),
-                'gl': query.gl,
-                'hl': query.hl,
-                'currency': query.currency
-            }
-            if query.return_date:
-                kwargs['return_date'] = str(query.return_date)
-            if query.type is not None:
-                kwargs['type'] = query.type
-            return self.flights_service.search_flights(**kwargs)
+                return None, {"error": f"Invalid flight search parameters: {e}"}
+            return query, None
 
+        def with_ranking(result):
+            if self.project_tool_output:
+                return project_flights(result, tool='search_flights')
+            # Rank on the tool output itself so it does not depend on the LLM echoing JSON;
+            # copy so the cached result is not mutated
+            if isinstance(result, dict) and ('best_flights' in result or 'other_flights' in result):
+                return {**result, 'most_optimal_flights': rank_flights(result, top_k=3)}
+            return result
+
+        def search_flights_tool(**tool_args):
+            query, error = build_query(**tool_args)
+            if error:
+                return error
+            remember(query)
+            return with_ranking(self.flights_service.search_query(query))
+
+        async def asearch_flights_tool(**tool_args):
+            # Used by agent.arun so the SerpApi call does not block the event loop
+            query, error = build_query(**tool_args)
+            if error:
+                return error
+            remember(query)
+            await emit_progress('progress', message=f"Searching flights {query.departure_id}\u2192{query.arrival_id} on {query.departure_date}\u2026")
+            result = await self._asearch(query)
+            flights = extract_flights(result) if isinstance(result, dict) else []
+            if flights:
+                await emit_progress('progress', message=f"Ranking {len(flights)} results\u2026")
+            if self.project_tool_output:
+                return await aproject_flights(result, tool='search_flights')
+            return with_ranking(result)
 
         self.flight_tool = StructuredTool.from_function(
             search_flights_tool,
+            coroutine=asearch_flights_tool,
             name="search_flights",
-            description="Search for flights using departure and arrival airport codes and departure date.",
-            args_schema=FlightQuery
+            description="Search for flights using departure and arrival airport codes (or city names) and departure date.",
+            args_schema=FlightSearchArgs
+        )
+
+        async def asearch_flights_flexible_tool(origin: str, destination: str, departure_date: str,
+                                                return_date: str = None, flex_days: int = 0, any_airport: bool = True,
+                                                gl: str = None, hl: str = None, currency: str = None):
+            origins = (any_airport and airport_resolver.expand(origin)) or [map_to_airport(origin)]
+            destinations = (any_airport and airport_resolver.expand(destination)) or [map_to_airport(destination)]
+            unknown = [p for p, codes in ((origin, origins), (destination, destinations)) if not codes or not all(codes)]
+            if unknown:
+                return {"error": f"Could not resolve airport or city: {', '.join(unknown)}. Please provide an IATA airport code."}
+            try:
+                center = datetime.date.fromisoformat(departure_date)
+                trip_length = (datetime.date.fromisoformat(return_date) - center).days if return_date else None
+                queries = self.fanout_search.expand(
+                    origins, destinations, date_window(center, flex_days), trip_length,
+                    gl=gl, hl=hl, currency=currency
+                )
+            except ValueError as e:
+                return {"error": f"Invalid flight search parameters: {e}"}
+            if not queries:
+                return {"error": "No valid searches for these airports and dates (dates must be in the future)."}
+            await emit_progress('progress', message=f"Searching {len(queries)} airport/date combinations "
+                                                    f"{'/'.join(origins)}\u2192{'/'.join(destinations)}\u2026")
+            result = await self.fanout_search.search(queries)
+            return await aproject_flights(result, tool='search_flights_flexible') if self.project_tool_output else result
+
+        self.flexible_flight_tool = StructuredTool.from_function(
+            coroutine=asearch_flights_flexible_tool,
+            name="search_flights_flexible",
+            description="Search flights across all airports of the origin/destination cities and/or a window of ±flex_days around the dates, returning the merged and ranked results.",
+            args_schema=FlexibleFlightSearchArgs
+        )
+
+        self.flight_details_tool = StructuredTool.from_function(
+            flight_details,
+            coroutine=aflight_details,
+            name="get_flight_details",
+            description="Full details (aircraft, legroom, amenities, layovers, booking token) of one option from an earlier flight search result.",
+            args_schema=FlightDetailsArgs
+        )
+
+        def search_local_flights_tool(origin: str, destination: str = None, date_from: str = None,
+                                      date_to: str = None, cabin: str = "economy", max_price: float = None,
+                                      min_seats: int = 1, airline: str = None):
+            origin_mapped = map_to_airport(origin)
+            destination_mapped = map_to_airport(destination) if destination else None
+            unknown = [p for p, m in ((origin, origin_mapped), (destination, destination_mapped)) if p and not m]
+            if unknown:
+                return {"error": f"Could not resolve airport or city: {', '.join(unknown)}. Please provide an IATA airport code."}
+            try:
+                flights = get_flight_store().query(origin_mapped, destination_mapped, date_from, date_to, cabin,
+                                                   max_price, min_seats, airline)
+            except ValueError as e:
+                return {"error": f"Invalid flight search parameters: {e}"}
+            if not flights:
+                return {"flights": [], "message": "No matching flights in the local schedule; use search_flights for live results."}
+            return {"source": "local_schedule", "flights": flights}
+
+        self.local_flight_tool = StructuredTool.from_function(
+            search_local_flights_tool,
+            name="search_local_flights",
+            description="Search the local flight schedule (upcoming flights only) by route, departure date range, cabin, maximum price, minimum available seats and airline. Fast and free.",
+            args_schema=LocalFlightSearchArgs
         )
 
         # Create a chat prompt template
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
-            ("human", "User: {input}\n\nToday's date: {current_date}\nUser location: {location}\nAssistant:")
+            ("human", "{history}User: {input}\n\nToday's date: {current_date}\nUser location: {location}\n{local_hint}Assistant:")
         ])
 
-        # Tool-enabled chain (OpenAI function calling)
+        # Tool-enabled chains (OpenAI function calling), built on first use
+        self._agent = None
+        # Token-streaming agent for /api/chat/stream
+        self._streaming_agent = None
+
+    def _build_agent(self, llm):
+        """Create the OpenAI function-calling agent over the flight tool."""
         from langchain.agents import initialize_agent, AgentType
-        self.agent = initialize_agent(
-            [self.flight_tool],
-            self.llm,
+        return initialize_agent(
+            [self.local_flight_tool, self.flight_tool, self.flexible_flight_tool, self.flight_details_tool],
+            llm,
             agent=AgentType.OPENAI_FUNCTIONS,
             verbose=True
         )
+
+    @property
+    def agent(self):
+        """Function-calling agent over the flight tools."""
+        if self._agent is None:
+            self._agent = self._build_agent(self.llm)
+        return self._agent
+
+    @property
+    def streaming_agent(self):
+        """Agent whose LLM calls use the streaming API so tokens reach callbacks as they arrive."""
+        if self._streaming_agent is None:
+            # Shallow copy shares the underlying OpenAI client and connection pool
+            self._streaming_agent = self._build_agent(self.llm.model_copy(update={'streaming': True}))
+        return self._streaming_agent
     
     def _get_rag_context(self, user_message: str) -> str:
         """
@@ -191,69 +317,390 @@ class ChatService:
             # Format the context into a readable string
             return self.rag_service.format_context(context)
         except Exception as e:
-            logger.warning(f"Error retrieving RAG context: {e}")
+            logger.warning("Error retrieving RAG context: %s", e)
             return "Error retrieving travel information. Please try again later."
             
 
-    async def process_message(self, user_message: str, context: Optional[Dict[str, Any]] = None) -> str:
-        logger.info(f"[process_message] Start processing user message: {user_message}")
+    @staticmethod
+    def _format_duration(minutes: Optional[int]) -> str:
+        if minutes is None:
+            return "unknown duration"
+        return f"{minutes // 60}h {minutes % 60:02d}m"
+
+    @staticmethod
+    def _local_schedule_hint(user_message: str, resolve: Callable[[str], Optional[str]]) -> str:
+        """
+        Prompt line steering the agent to search_local_flights, only when the local
+        schedule has upcoming flights on the route the message names (an extra
+        tool round-trip is wasted otherwise).
+        """
+        route = parse_route(user_message, datetime.date.today(), resolve)
+        if route is None or not get_flight_store().query(*route, limit=1):
+            return ''
+        return (f"The local flight schedule has upcoming flights from {route[0]} to {route[1]}: "
+                "call search_local_flights first and only call search_flights if none match.\n")
+
+    @staticmethod
+    def _upstream_error(result: Any) -> bool:
+        """True for a SerpApi error result, which the agent explains better than 'no flights found'."""
+        if isinstance(result, dict) and 'error' in result and not result.get('degraded'):
+            logger.info("[process_message] Flight search failed, falling back to the agent: %s", result['error'])
+            return True
+        return False
+
+    def _format_flight_reply(self, query: FlightQuery, result: Dict[str, Any],
+                             top_flights: List[Dict[str, Any]],
+                             ordering: str = "the best combination of price and duration") -> str:
+        """Templated answer for a fast-path flight search."""
+        trip = "round-trip" if query.type == 1 else "one-way"
+        when = f"{query.departure_date}" + (f", returning {query.return_date}" if query.return_date else "")
+        if result.get('degraded'):
+            return result['error']
+        if not top_flights:
+            return (f"I'm sorry, I couldn't find any {trip} flights from {query.departure_id} "
+                    f"to {query.arrival_id} on {when}. Try different dates or nearby airports.")
+        currency = (result.get('search_parameters') or {}).get('currency') or query.currency or 'USD'
+        lines = [f"Here are the best {trip} flights from {query.departure_id} to {query.arrival_id} ({when}), "
+                 f"sorted by {ordering}:"]
+        for i, flight in enumerate(top_flights, 1):
+            legs = flight.get('flights') or [{}]
+            airlines = ", ".join(dict.fromkeys(leg.get('airline', 'Unknown airline') for leg in legs))
+            numbers = ", ".join(leg['flight_number'] for leg in legs if leg.get('flight_number'))
+            departs = (legs[0].get('departure_airport') or {}).get('time', '?')
+            arrives = (legs[-1].get('arrival_airport') or {}).get('time', '?')
+            stops = len(flight.get('layovers') or ())
+            stops_text = "nonstop" if stops == 0 else f"{stops} stop{'s' if stops > 1 else ''}"
+            lines.append(
+                f"{i}. {airlines}{f' ({numbers})' if numbers else ''}: departs {departs}, arrives {arrives}, "
+                f"{self._format_duration(flight.get('total_duration'))}, {stops_text}, {flight['price']} {currency}"
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _intent_query(intent: FlightIntent) -> Optional[FlightQuery]:
+        try:
+            return FlightQuery(
+                departure_id=intent.departure_id,
+                arrival_id=intent.arrival_id,
+                departure_date=intent.departure_date,
+                return_date=intent.return_date,
+                type=intent.type
+            )
+        except Exception as e:
+            logger.info("[process_message] Fast path skipped, invalid query: %s", e)
+            return None
+
+    async def _asearch(self, query: FlightQuery) -> Dict[str, Any]:
+        """`asearch_query`, sharing one call between identical searches of the current batch."""
+        shared = batch_searches.get()
+        if shared is None:
+            return await self.flights_service.asearch_query(query)
+        key = query.cache_key()
+        future = shared.get(key)
+        if future is None:
+            future = shared[key] = asyncio.ensure_future(self.flights_service.asearch_query(query))
+        return await asyncio.shield(future)
+
+    async def _answer_flight_intent(self, intent: FlightIntent) -> Optional[str]:
+        """
+        Run a parsed flight search directly against SerpApi and rank the results.
+
+        Returns:
+            The templated reply, or None to fall back to the agent
+        """
+        query = self._intent_query(intent)
+        if query is None:
+            return None
+        logger.info("[process_message] Fast path flight search: %s", query.cache_key())
+        self.cache_warmer.record(query)
+        session = current_session.get()
+        if session is not None:
+            self.sessions.remember_search(session, query)
+        await emit_progress('progress', message=f"Searching flights {query.departure_id}\u2192{query.arrival_id} on {query.departure_date}\u2026")
+        result = await self._asearch(query)
+        if self._upstream_error(result):
+            return None
+        flights = extract_flights(result)
+        if flights:
+            await emit_progress('progress', message=f"Ranking {len(flights)} results\u2026")
+        return self._format_flight_reply(query, result, rank_flights(flights, top_k=3))
+
+    async def _answer_follow_up(self, session: Session, follow_up: FollowUp) -> Optional[str]:
+        """
+        Refine the session's last flight search without the LLM.
+
+        Re-ranking and filtering reuse the cached result set; a date shift
+        runs one new (cacheable) search.
+
+        Returns:
+            The templated reply, or None to fall back to the agent
+        """
+        query = session.last_query
+        if follow_up.date_shift:
+            shift = datetime.timedelta(days=follow_up.date_shift)
+            try:
+                query = FlightQuery(**{
+                    **query.model_dump(),
+                    'departure_date': query.departure_date + shift,
+                    'return_date': query.return_date + shift if query.return_date else None,
+                })
+            except Exception as e:
+                logger.info("[process_message] Follow-up skipped, invalid shifted query: %s", e)
+                return None
+            result = None
+        else:
+            result = self.flights_service.cache.get(session.last_result_key)
+        if result is None:
+            await emit_progress('progress', message=f"Searching flights {query.departure_id}\u2192{query.arrival_id} on {query.departure_date}\u2026")
+            result = await self._asearch(query)
+            if self._upstream_error(result):
+                return None
+        else:
+            logger.info("[process_message] Follow-up served from cached results: %s", session.last_result_key)
+        self.sessions.remember_search(session, query)
+
+        flights = extract_flights(result) if isinstance(result, dict) else []
+        if follow_up.nonstop:
+            flights = [f for f in flights if not f.get('layovers')]
+        criteria, ordering = RankingCriteria(), "the best combination of price and duration"
+        if follow_up.sort == 'price':
+            criteria, ordering = RankingCriteria(price=1, total_duration=0), "price"
+        elif follow_up.sort == 'duration':
+            criteria, ordering = RankingCriteria(price=0, total_duration=1), "duration"
+        if follow_up.departure_window:
+            criteria.departure_time = 5
+            criteria.departure_window = follow_up.departure_window
+        return self._format_flight_reply(query, result, rank_flights(flights, criteria, top_k=3), ordering)
+
+    async def process_message(self, user_message: str, context: Optional[Dict[str, Any]] = None,
+                              callbacks: Optional[List[Any]] = None, streaming: bool = False,
+                              session_id: Optional[str] = None,
+                              resolve: Callable[[str], Optional[str]] = resolve_airport) -> str:
+        """
+        Answer a chat message with the tool-enabled agent.
+
+        Args:
+            user_message: The user's message
+            context: Client-supplied context (location etc.)
+            callbacks: Optional LangChain callback handlers for this run
+            streaming: Use the token-streaming agent (for streamed responses)
+            session_id: Conversation id; its history and last search are used
+                for follow-up questions
+            resolve: Place name to airport code resolver for the fast path
+
+        Returns:
+            The assistant's reply
+        """
+        session = self.sessions.get_or_create(session_id) if session_id else None
+        token = current_session.set(session)
+        try:
+            response = await self._respond(user_message, context, callbacks, streaming, session, resolve)
+        finally:
+            current_session.reset(token)
+        if session is not None:
+            self.sessions.add_turn(session, 'user', user_message)
+            self.sessions.add_turn(session, 'assistant', response)
+        return response
+
+    async def _respond(self, user_message: str, context: Optional[Dict[str, Any]],
+                       callbacks: Optional[List[Any]], streaming: bool, session: Optional[Session],
+                       resolve: Callable[[str], Optional[str]] = resolve_airport) -> str:
+        logger.info("[process_message] Start processing user message: %s", user_message)
         try:
             today_str = datetime.date.today().isoformat()
             if context is None:
                 context = {}
             context['current_date'] = today_str
-            logger.debug(f"[process_message] Context: {context}")
+            logger.debug("[process_message] Context: %s", context)
             location = context.get('location') if context and 'location' in context else 'unknown'
-            logger.info(f"[process_message] Calling agent with prompt. Location: {location}")
-            response = await self.agent.arun(
-                self.prompt.format(
-                    input=user_message,
-                    current_date=today_str,
-                    location=location
+            if session is not None and session.last_query is not None:
+                follow_up = parse_follow_up(user_message)
+                if follow_up is not None:
+                    with span('follow_up'):
+                        reply = await self._answer_follow_up(session, follow_up)
+                    if reply is not None:
+                        return reply
+            if self.fast_path_enabled:
+                intent = parse_flight_intent(user_message, datetime.date.today(), resolve)
+                if intent is not None:
+                    with span('fast_path'):
+                        reply = await self._answer_flight_intent(intent)
+                    if reply is not None:
+                        return reply
+            logger.info("[process_message] Calling agent with prompt. Location: %s", location)
+            agent = self.streaming_agent if streaming else self.agent
+            history = session.history() if session is not None else ''
+            with span('agent.run', streaming=streaming):
+                response = await agent.arun(
+                    self.prompt.format(
+                        history=f"Conversation so far:\n{history}\n\n" if history else '',
+                        input=user_message,
+                        current_date=today_str,
+                        location=location,
+                        local_hint=self._local_schedule_hint(user_message, resolve)
+                    ),
+                    callbacks=callbacks
                 )
-            )
-            logger.info(f"[process_message] LLM response: {response}")
+            logger.info("[process_message] LLM response (%d chars)", len(response))
+            logger.debug("[process_message] LLM response: %s", response)
             # Try to parse and sort flight results if present
             import json
             try:
                 data = json.loads(response) if isinstance(response, str) else response
                 if isinstance(data, dict) and ('best_flights' in data or 'other_flights' in data):
-                    flights = []
-                    for section in ['best_flights', 'other_flights']:
-                        if section in data:
-                            for f in data[section]:
-                                # Defensive: skip if missing price or total_duration
-                                price = f.get('price')
-                                duration = f.get('total_duration')
-                                if price is not None and duration is not None:
-                                    flights.append(f)
-                    # Sort by weighted optimality: price + duration (normalize duration to hours)
+                    flights = extract_flights(data)
+                    # Sort by weighted optimality: price + duration
                     if flights:
-                        # Normalize: scale price and duration
-                        min_price = min(f['price'] for f in flights)
-                        max_price = max(f['price'] for f in flights)
-                        min_dur = min(f['total_duration'] for f in flights)
-                        max_dur = max(f['total_duration'] for f in flights)
-                        def score(f):
-                            price_score = (f['price'] - min_price) / (max_price - min_price + 1)
-                            dur_score = (f['total_duration'] - min_dur) / (max_dur - min_dur + 1)
-                            return price_score + dur_score
-                        flights.sort(key=score)
-                        data['most_optimal_flights'] = flights[:3]  # Top 3
-                        logger.info(f"[process_message] Sorted {len(flights)} flights by optimality.")
+                        await emit_progress('progress', message=f"Ranking {len(flights)} results\u2026")
+                        top_flights = rank_flights(flights, top_k=3)
+                        logger.info("[process_message] Sorted %d flights by optimality.", len(flights))
                         return json.dumps({
-                            'most_optimal_flights': flights[:3],
+                            'most_optimal_flights': top_flights,
                             'note': 'Sorted by fastest + cheapest combination',
                             'current_date': today_str
                         }, indent=2)
             except Exception as sort_e:
-                logger.warning(f"[process_message] Could not sort flights: {sort_e}")
-            logger.info(f"[process_message] LLM response: {response}")
+                logger.warning("[process_message] Could not sort flights: %s", sort_e)
             return response
         except Exception as e:
             error_msg = f"Error in process_message: {str(e)}"
             logger.error(error_msg, exc_info=True)
             return "I'm sorry, I encountered an error while processing your request. Please try again later."
 
-# Singleton instance
-chat_service = ChatService()
+    async def stream_message(self, user_message: str, context: Optional[Dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Process a message and yield (event, data) pairs as the answer is produced.
+
+        Events are 'token' (LLM output), 'tool_start'/'tool_end'/'progress'
+        (tool activity), 'ping' (keep-alive) and finally 'done' with the full
+        response. Closing the generator, e.g. when the client disconnects,
+        cancels the agent run and any in-flight upstream calls.
+        """
+        stream = ChatEventStream()
+
+        async def run():
+            current_event_stream.set(stream)
+            try:
+                response = await self.process_message(
+                    user_message, context,
+                    callbacks=[EventStreamCallbackHandler(stream)],
+                    streaming=True,
+                    session_id=session_id
+                )
+                await stream.emit('done', {'response': response, 'context': context, 'session_id': session_id})
+            except Exception as e:
+                logger.error("[stream_message] Error while streaming: %s", e, exc_info=True)
+                await stream.emit('error', {'response': "Sorry, I encountered an error processing your request."})
+            # Not reached on cancellation, when nobody is left to read the stream
+            await stream.close()
+
+        task = asyncio.create_task(run())
+        try:
+            async for event in stream:
+                yield event
+        finally:
+            if not task.done():
+                logger.info("[stream_message] Consumer went away, cancelling agent run")
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def process_batch(self, items: Sequence[Dict[str, Any]],
+                            concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer many messages concurrently, yielding each result as soon as it is ready.
+
+        A pre-pass parses every message once. It shares airport resolution
+        across the batch, looks each distinct fast-path search up in the
+        result cache once, and starts the misses. Identical flight searches
+        of different items (fast path or agent tools) share one call.
+        Items with the same session id run in order; all others run
+        concurrently, at most `concurrency` at a time.
+
+        Args:
+            items: Dicts with `message`, and optionally `context` and `session_id`
+            concurrency: Items processed at once (BATCH_MAX_CONCURRENCY, default 8)
+
+        Yields:
+            {'index', 'response', 'context', 'session_id', 'elapsed_ms'} per item
+            (with `error` instead of `response` if it failed), in completion order
+        """
+        concurrency = concurrency or int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+        semaphore = asyncio.Semaphore(concurrency)
+        # Separate from `semaphore`: items holding a slot wait on these searches
+        search_slots = asyncio.Semaphore(concurrency)
+        resolved: Dict[str, Optional[str]] = {}
+
+        def resolve(name: str) -> Optional[str]:
+            if name not in resolved:
+                resolved[name] = resolve_airport(name)
+            return resolved[name]
+
+        async def prefetch(query: FlightQuery):
+            async with search_slots:
+                return await self.flights_service.asearch_query(query)
+
+        searches: Dict[Tuple, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        with span('batch.prepass', items=len(items)):
+            today = datetime.date.today()
+            for item in items:
+                intent = parse_flight_intent(item['message'], today, resolve) if self.fast_path_enabled else None
+                query = self._intent_query(intent) if intent is not None else None
+                if query is None or query.cache_key() in searches:
+                    continue
+                cached = self.flights_service.cache.get(query.cache_key())
+                if cached is not None:
+                    searches[query.cache_key()] = loop.create_future()
+                    searches[query.cache_key()].set_result(cached)
+                else:
+                    searches[query.cache_key()] = asyncio.ensure_future(prefetch(query))
+        logger.info("[process_batch] %d messages, %d distinct fast-path searches, %d places resolved",
+                    len(items), len(searches), len(resolved))
+
+        groups: Dict[str, List[int]] = {}
+        for i, item in enumerate(items):
+            groups.setdefault(item.get('session_id') or f"#{i}", []).append(i)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def run_group(indexes: List[int]):
+            batch_searches.set(searches)
+            for i in indexes:
+                item = items[i]
+                context = dict(item.get('context') or {})
+                session_id = item.get('session_id')
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await self.process_message(item['message'], context, session_id=session_id,
+                                                              resolve=resolve)
+                        out = {'index': i, 'response': response}
+                    except Exception as e:
+                        logger.error("[process_batch] Item %d failed: %s", i, e, exc_info=True)
+                        out = {'index': i, 'error': "Sorry, I encountered an error processing your request."}
+                out.update(context=context, session_id=session_id,
+                           elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+                await results.put(out)
+
+        workers = [asyncio.ensure_future(run_group(indexes)) for indexes in groups.values()]
+        try:
+            for _ in range(len(items)):
+                yield await results.get()
+        finally:
+            pending = [t for t in [*workers, *searches.values()] if not t.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*workers, *searches.values(), return_exceptions=True)
+
+_chat_service: Optional[ChatService] = None
+_chat_service_lock = threading.Lock()
+
+
+def get_chat_service() -> ChatService:
+    """Return the shared ChatService, building it on first use (thread-safe)."""
+    global _chat_service
+    if _chat_service is None:
+        with _chat_service_lock:
+            if _chat_service is None:
+                _chat_service = ChatService()
+    return _chat_service
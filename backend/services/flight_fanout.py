@@ -0,0 +1,152 @@
+"""
+Concurrent multi-airport / flexible-date flight search on top of SerpApiFlightsService.
+"""
+import os
+import asyncio
+import logging
+import datetime
+from itertools import product
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .flight_query_schema import FlightQuery
+from .flight_ranking import RankingCriteria, extract_flights, rank_flights
+
+logger = logging.getLogger(__name__)
+
+
+def date_window(center: datetime.date, flex_days: int, today: Optional[datetime.date] = None) -> List[datetime.date]:
+    """Dates within ±`flex_days` of `center`, nearest first, never in the past."""
+    today = today or datetime.date.today()
+    offsets = sorted(range(-flex_days, flex_days + 1), key=lambda d: (abs(d), d))
+    dates = [center + datetime.timedelta(days=d) for d in offsets]
+    return [d for d in dates if d >= today]
+
+
+def itinerary_key(flight: Dict[str, Any]) -> Tuple:
+    """Identity of an itinerary across sub-searches: its legs' flight numbers and departure times."""
+    return tuple(
+        (leg.get('flight_number'), (leg.get('departure_airport') or {}).get('time'))
+        for leg in flight.get('flights') or []
+    )
+
+
+class FlightFanOutSearch:
+    """
+    Expand one request into origin x destination x date sub-queries and run them concurrently.
+
+    Sub-queries go through `asearch_query`, so they share the result cache and
+    single-flight deduplication. When the deadline passes, the remaining
+    sub-queries are cancelled and whatever finished is returned.
+    """
+
+    def __init__(self, flights_service, max_concurrency: Optional[int] = None,
+                 deadline: Optional[float] = None, max_queries: Optional[int] = None):
+        """
+        Args:
+            flights_service: SerpApiFlightsService used for each sub-query
+            max_concurrency: Sub-queries in flight at once (FANOUT_MAX_CONCURRENCY, default 6)
+            deadline: Seconds before partial results are returned (FANOUT_DEADLINE, default 20)
+            max_queries: Cap on sub-queries per request (FANOUT_MAX_QUERIES, default 24)
+        """
+        self.flights_service = flights_service
+        self.max_concurrency = max_concurrency or int(os.getenv("FANOUT_MAX_CONCURRENCY", "6"))
+        self.deadline = deadline or float(os.getenv("FANOUT_DEADLINE", "20"))
+        self.max_queries = max_queries or int(os.getenv("FANOUT_MAX_QUERIES", "24"))
+
+    def expand(self, origins: Sequence[str], destinations: Sequence[str],
+               departure_dates: Sequence[datetime.date], trip_length: Optional[int] = None,
+               gl: Optional[str] = None, hl: Optional[str] = None,
+               currency: Optional[str] = None) -> List[FlightQuery]:
+        """
+        Build the validated sub-queries, most relevant first and capped at `max_queries`.
+
+        Dates vary slowest so the requested date is searched on every route
+        before neighbouring dates are. Raises ValueError if `trip_length` is
+        not a positive number of days.
+        """
+        if trip_length is not None and trip_length < 1:
+            raise ValueError('return_date must be after departure_date')
+        queries = []
+        for day, origin, destination in product(departure_dates, origins, destinations):
+            if origin == destination:
+                continue
+            return_date = day + datetime.timedelta(days=trip_length) if trip_length else None
+            try:
+                queries.append(FlightQuery(
+                    departure_id=origin,
+                    arrival_id=destination,
+                    departure_date=day,
+                    return_date=return_date,
+                    type=1 if return_date else 2,
+                    gl=gl,
+                    hl=hl,
+                    currency=currency
+                ))
+            except Exception as e:
+                logger.info("[fanout] Skipping invalid sub-query %s->%s %s: %s", origin, destination, day, e)
+            if len(queries) >= self.max_queries:
+                break
+        return queries
+
+    async def search(self, queries: Sequence[FlightQuery],
+                     criteria: Optional[RankingCriteria] = None,
+                     top_k: int = 5, max_results: int = 20) -> Dict[str, Any]:
+        """
+        Run sub-queries concurrently, merge and dedupe itineraries, and rank them.
+
+        Args:
+            queries: Sub-queries from `expand`
+            criteria: Ranking criteria for the merged set
+            top_k: Number of itineraries in `most_optimal_flights`
+            max_results: Number of ranked itineraries returned in `flights`
+
+        Returns:
+            Dict with `flights`, `most_optimal_flights` and a `search_summary`
+            of completed/failed/timed-out sub-queries
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(query: FlightQuery):
+            async with semaphore:
+                return await self.flights_service.asearch_query(query)
+
+        tasks = {asyncio.create_task(run(q)): q for q in queries}
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning("[fanout] Deadline of %ss hit, %d sub-queries cancelled", self.deadline, len(pending))
+
+        merged: Dict[Tuple, Dict[str, Any]] = {}
+        failed = 0
+        for task in done:
+            if task.exception() is not None:
+                failed += 1
+                logger.warning("[fanout] Sub-query %s failed: %s", tasks[task].cache_key(), task.exception())
+                continue
+            result = task.result()
+            if not isinstance(result, dict) or 'error' in result:
+                failed += 1
+                continue
+            for flight in extract_flights(result):
+                key = itinerary_key(flight) or id(flight)
+                if key not in merged or flight['price'] < merged[key]['price']:
+                    merged[key] = flight
+
+        flights = list(merged.values())
+        ranked = rank_flights(flights, criteria, top_k=max_results)
+        return {
+            'search_summary': {
+                'routes': sorted({f"{q.departure_id}-{q.arrival_id}" for q in queries}),
+                'dates': sorted({str(q.departure_date) for q in queries}),
+                'sub_queries': len(queries),
+                'completed': len(done) - failed,
+                'failed': failed,
+                'timed_out': len(pending),
+                'partial': bool(pending or failed),
+                'unique_itineraries': len(flights),
+            },
+            'flights': ranked,
+            'most_optimal_flights': ranked[:top_k],
+        }
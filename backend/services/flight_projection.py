@@ -0,0 +1,206 @@
+"""
+Compact projection of flight search results before they reach the LLM.
+
+Raw SerpApi responses carry every itinerary with aircraft, legroom,
+amenities, booking tokens, airport names repeated on every leg, price
+insights and search metadata. All of it would be sent back to the model
+as function output. `project_flights` keeps what an answer needs:
+
+- the top-N itineraries, ranked (`rank_flights`), numbered as options;
+- per leg only airport codes, times, an airline reference and the flight number;
+- airport names and airline names once each, in lookup tables;
+- a short summary (number of itineraries, price range, typical prices).
+
+The full result is kept server-side under a content-derived `result_ref`
+(identical results give identical projections, so LLM response caching
+still works), locally and in the shared cache backend so that any worker
+can serve it. In later turns the `get_flight_details` tool uses it to
+reach the omitted fields. Byte and token reductions are logged and
+counted per call.
+"""
+import os
+import json
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+from .cache import TTLCache
+from .cache_backend import get_shared_cache
+from .flight_ranking import extract_flights, rank_flights
+from .session_store import estimate_tokens
+from .tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('tool_output_bytes_total', "Bytes of flight tool output before and after projection")
+metrics.describe('tool_output_tokens_total', "Estimated tokens of flight tool output before and after projection")
+
+# Full results by reference, for get_flight_details and follow-ups (L1; the shared backend is L2)
+result_store = TTLCache(
+    ttl=float(os.getenv("RESULT_REF_TTL", "1800")),
+    max_entries=int(os.getenv("RESULT_REF_MAX_ENTRIES", "512")),
+)
+
+
+def _shared_key(ref: str) -> str:
+    return f"result_ref:{ref}"
+
+
+def _project_flight(flight: Dict[str, Any], option: int, airports: Dict[str, str],
+                    airlines: List[str]) -> Dict[str, Any]:
+    def airline_ref(name: Optional[str]) -> Optional[int]:
+        if not name:
+            return None
+        if name not in airlines:
+            airlines.append(name)
+        return airlines.index(name)
+
+    legs = []
+    for leg in flight.get('flights') or []:
+        departure = leg.get('departure_airport') or {}
+        arrival = leg.get('arrival_airport') or {}
+        for airport in (departure, arrival):
+            if airport.get('id') and airport.get('name'):
+                airports.setdefault(airport['id'], airport['name'])
+        legs.append({
+            'from': departure.get('id'),
+            'departs': departure.get('time'),
+            'to': arrival.get('id'),
+            'arrives': arrival.get('time'),
+            'airline': airline_ref(leg.get('airline')),
+            'flight_number': leg.get('flight_number'),
+        })
+    projected = {
+        'option': option,
+        'price': flight.get('price'),
+        'total_duration': flight.get('total_duration'),
+        'stops': len(legs) - 1 if legs else None,
+        'legs': legs,
+    }
+    layovers = [{'airport': layover.get('id'), 'duration': layover.get('duration')}
+                for layover in flight.get('layovers') or []]
+    if layovers:
+        projected['layovers'] = layovers
+    carbon = (flight.get('carbon_emissions') or {}).get('this_flight')
+    if carbon is not None:
+        projected['co2_kg'] = round(carbon / 1000)
+    return projected
+
+
+def project_flights(result: Any, top_n: Optional[int] = None, tool: str = 'search_flights',
+                    share: bool = True) -> Any:
+    """
+    Replace a flight search result with its compact projection (see module docstring).
+
+    Accepts raw SerpApi responses and merged fan-out results (whose
+    `flights` are already ranked). Errors, degraded results and other
+    non-flight values are returned unchanged.
+
+    Args:
+        result: Tool output to project
+        top_n: Itineraries kept (PROJECTION_TOP_N, default 5)
+        tool: Tool name used in metrics and logs
+        share: Also store the ranked itineraries in the shared cache backend
+
+    Returns:
+        Dict with `result_ref`, `summary`, `options`, `airports` and `airlines`
+    """
+    if not isinstance(result, dict) or 'error' in result:
+        return result
+    ranked_input = result.get('flights') if 'search_summary' in result else None
+    if ranked_input is None and 'best_flights' not in result and 'other_flights' not in result:
+        return result
+    top_n = top_n if top_n is not None else int(os.getenv("PROJECTION_TOP_N", "5"))
+    with span('projection', tool=tool) as s:
+        raw = json.dumps(result, separators=(',', ':'), default=str)
+        ref = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+        if ranked_input is not None:
+            candidates = len(ranked_input)
+            ranked = list(ranked_input)[:top_n]
+        else:
+            candidates = len(extract_flights(result))
+            ranked = rank_flights(result, top_k=top_n)
+        result_store.set(ref, {'result': result, 'ranked': ranked})
+        shared = get_shared_cache() if share else None
+        if shared is not None:
+            # Follow-up turns may land on another worker
+            shared.set(_shared_key(ref), json.dumps(ranked, default=str), result_store.ttl)
+
+        airports: Dict[str, str] = {}
+        airlines: List[str] = []
+        options = [_project_flight(flight, i, airports, airlines) for i, flight in enumerate(ranked, 1)]
+        prices = [f['price'] for f in ranked if f.get('price') is not None]
+        summary: Dict[str, Any] = {'itineraries_found': candidates, 'options_shown': len(options)}
+        if prices:
+            summary['price_range'] = [min(prices), max(prices)]
+        currency = (result.get('search_parameters') or {}).get('currency')
+        if currency:
+            summary['currency'] = currency
+        insights = result.get('price_insights') or {}
+        for key in ('lowest_price', 'typical_price_range', 'price_level'):
+            if insights.get(key) is not None:
+                summary[key] = insights[key]
+        if 'search_summary' in result:
+            summary.update(result['search_summary'])
+        projected = {
+            'result_ref': ref,
+            'summary': summary,
+            'options': options,
+            'airports': airports,
+            'airlines': airlines,
+            'note': "Options are ranked best first; legs reference airlines by index. "
+                    "Call get_flight_details with result_ref and option for aircraft, amenities or booking details.",
+        }
+        compact = json.dumps(projected, separators=(',', ':'))
+        before, after = len(raw), len(compact)
+        tokens_before, tokens_after = estimate_tokens(raw), estimate_tokens(compact)
+        s.set('bytes_before', before)
+        s.set('bytes_after', after)
+    metrics.inc('tool_output_bytes_total', before, tool=tool, stage='raw')
+    metrics.inc('tool_output_bytes_total', after, tool=tool, stage='projected')
+    metrics.inc('tool_output_tokens_total', tokens_before, tool=tool, stage='raw')
+    metrics.inc('tool_output_tokens_total', tokens_after, tool=tool, stage='projected')
+    logger.info("Projected %s output %s: %d -> %d bytes, ~%d -> ~%d tokens (%d of %d itineraries)",
+                tool, ref, before, after, tokens_before, tokens_after, len(options), candidates)
+    return projected
+
+
+async def aproject_flights(result: Any, top_n: Optional[int] = None, tool: str = 'search_flights') -> Any:
+    """Async variant of `project_flights` that writes the shared cache without blocking the event loop."""
+    projected = project_flights(result, top_n, tool, share=False)
+    shared = get_shared_cache()
+    if projected is result or shared is None:
+        return projected
+    entry = result_store.get(projected['result_ref'])
+    if entry is not None:
+        await shared.aset(_shared_key(projected['result_ref']), json.dumps(entry['ranked'], default=str),
+                          result_store.ttl)
+    return projected
+
+
+def flight_details(result_ref: str, option: int) -> Dict[str, Any]:
+    """Full itinerary for option `option` (1-based) of a projected result."""
+    entry = result_store.get(result_ref)
+    if entry is not None:
+        return _option(result_ref, option, entry['ranked'])
+    shared = get_shared_cache()
+    return _option(result_ref, option, shared.get(_shared_key(result_ref)) if shared is not None else None)
+
+
+async def aflight_details(result_ref: str, option: int) -> Dict[str, Any]:
+    """Async variant of `flight_details` that reads the shared cache without blocking the event loop."""
+    entry = result_store.get(result_ref)
+    if entry is not None:
+        return _option(result_ref, option, entry['ranked'])
+    shared = get_shared_cache()
+    return _option(result_ref, option, await shared.aget(_shared_key(result_ref)) if shared is not None else None)
+
+
+def _option(result_ref: str, option: int, ranked: Union[List[Dict[str, Any]], str, None]) -> Dict[str, Any]:
+    if ranked is None:
+        return {"error": f"Result {result_ref} is no longer available; please search again."}
+    if isinstance(ranked, str):
+        ranked = json.loads(ranked)
+    if not 1 <= option <= len(ranked):
+        return {"error": f"Option must be between 1 and {len(ranked)}."}
+    return {'result_ref': result_ref, 'option': option, 'flight': ranked[option - 1]}
@@ -1,7 +1,46 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import Optional, Dict, Any, Tuple
 from datetime import date
 
+class FlightSearchArgs(BaseModel):
+    """Arguments of the search_flights agent tool; places are resolved to airport codes before validation."""
+    departure_id: str = Field(..., description="Departure airport IATA code, metro code, city name or kgmid")
+    arrival_id: str = Field(..., description="Arrival airport IATA code, metro code, city name or kgmid")
+    departure_date: str = Field(..., description="Departure date (YYYY-MM-DD)")
+    return_date: Optional[str] = Field(None, description="Return date (YYYY-MM-DD), required for round-trip")
+    type: Optional[int] = Field(None, description="Flight type: 1=round-trip, 2=one-way, 3=multi-city")
+    gl: Optional[str] = Field(None, description="Country code (optional)")
+    hl: Optional[str] = Field(None, description="Language code (optional)")
+    currency: Optional[str] = Field(None, description="Currency code (optional)")
+
+class FlexibleFlightSearchArgs(BaseModel):
+    """Arguments of the search_flights_flexible agent tool (multi-airport and/or ±N day search)."""
+    origin: str = Field(..., description="Origin city name, metro code (e.g. LON) or airport IATA code")
+    destination: str = Field(..., description="Destination city name, metro code (e.g. NYC) or airport IATA code")
+    departure_date: str = Field(..., description="Preferred departure date (YYYY-MM-DD)")
+    return_date: Optional[str] = Field(None, description="Preferred return date (YYYY-MM-DD) for round-trips")
+    flex_days: int = Field(0, ge=0, le=3, description="Also search this many days before and after the preferred dates")
+    any_airport: bool = Field(True, description="Search every airport serving the origin and destination cities")
+    gl: Optional[str] = Field(None, description="Country code (optional)")
+    hl: Optional[str] = Field(None, description="Language code (optional)")
+    currency: Optional[str] = Field(None, description="Currency code (optional)")
+
+class LocalFlightSearchArgs(BaseModel):
+    """Arguments of the search_local_flights agent tool (local schedule data, no SerpApi call)."""
+    origin: str = Field(..., description="Departure airport IATA code or city name")
+    destination: Optional[str] = Field(None, description="Arrival airport IATA code or city name (optional)")
+    date_from: Optional[str] = Field(None, description="First departure date (YYYY-MM-DD)")
+    date_to: Optional[str] = Field(None, description="Last departure date (YYYY-MM-DD), defaults to date_from")
+    cabin: str = Field("economy", description="Cabin: economy, business or first")
+    max_price: Optional[float] = Field(None, description="Highest acceptable fare in the cabin")
+    min_seats: int = Field(1, ge=1, description="Seats needed in the cabin")
+    airline: Optional[str] = Field(None, description="Airline name (optional)")
+
+class FlightDetailsArgs(BaseModel):
+    """Arguments of the get_flight_details agent tool."""
+    result_ref: str = Field(..., description="result_ref returned by search_flights or search_flights_flexible")
+    option: int = Field(..., ge=1, description="Option number from that result")
+
 class FlightQuery(BaseModel):
     departure_id: str = Field(..., description="Departure airport code or kgmid")
     arrival_id: str = Field(..., description="Arrival airport code or kgmid")
@@ -37,3 +76,31 @@ class FlightQuery(BaseModel):
             raise ValueError('return_date must not be set for one-way (type=2)')
         return v
 
+    def search_params(self) -> Dict[str, Any]:
+        """Keyword arguments for `SerpApiFlightsService.search_flights`."""
+        params = {
+            'departure_id': self.departure_id,
+            'arrival_id': self.arrival_id,
+            'departure_date': str(self.departure_date),
+            'gl': self.gl,
+            'hl': self.hl,
+            'currency': self.currency
+        }
+        if self.return_date:
+            params['return_date'] = str(self.return_date)
+        if self.type is not None:
+            params['type'] = self.type
+        return params
+
+    def cache_key(self) -> Tuple:
+        """Normalized, hashable identity of this search used for result caching."""
+        return (
+            self.departure_id.upper() if len(self.departure_id) == 3 else self.departure_id,
+            self.arrival_id.upper() if len(self.arrival_id) == 3 else self.arrival_id,
+            self.departure_date.isoformat(),
+            self.return_date.isoformat() if self.return_date else None,
+            self.type,
+            self.gl.lower() if self.gl else None,
+            self.hl.lower() if self.hl else None,
+            self.currency.upper() if self.currency else None,
+        )
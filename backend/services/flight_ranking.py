@@ -0,0 +1,142 @@
+"""
+Vectorized ranking of SerpApi Google Flights itineraries.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .tracing import span
+
+# Criteria columns, in the order used by the score matrix
+CRITERIA = ('price', 'total_duration', 'layovers', 'departure_time', 'carbon_emissions')
+
+
+@dataclass
+class RankingCriteria:
+    """
+    Weights for each ranking criterion (0 disables it) and related options.
+
+    Each criterion is min-max normalized over the candidate set before
+    weighting, so weights express relative importance regardless of units.
+    """
+    price: float = 1.0
+    total_duration: float = 1.0
+    layovers: float = 0.0
+    departure_time: float = 0.0
+    carbon_emissions: float = 0.0
+    # Preferred departure window in local hours, e.g. (8, 12); only used by `departure_time`
+    departure_window: Optional[Tuple[float, float]] = None
+    # Only consider itineraries that are not dominated on the weighted criteria
+    pareto_only: bool = False
+
+    def weights(self) -> np.ndarray:
+        return np.array([getattr(self, name) for name in CRITERIA], dtype=np.float64)
+
+
+def extract_flights(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Collect `best_flights` and `other_flights` entries that have a price and duration."""
+    flights = []
+    for section in ('best_flights', 'other_flights'):
+        for f in results.get(section) or []:
+            if f.get('price') is not None and f.get('total_duration') is not None:
+                flights.append(f)
+    return flights
+
+
+def _departure_hour(flight: Dict[str, Any]) -> float:
+    legs = flight.get('flights') or []
+    time_str = (legs[0].get('departure_airport') or {}).get('time') if legs else None
+    if not time_str:
+        return np.nan
+    try:
+        t = datetime.strptime(time_str, '%Y-%m-%d %H:%M')
+    except ValueError:
+        return np.nan
+    return t.hour + t.minute / 60.0
+
+
+def _feature_matrix(flights: Sequence[Dict[str, Any]], criteria: RankingCriteria) -> np.ndarray:
+    """Build an (n, len(CRITERIA)) matrix where lower is better in every column."""
+    n = len(flights)
+    matrix = np.empty((n, len(CRITERIA)), dtype=np.float64)
+    matrix[:, 0] = [f['price'] for f in flights]
+    matrix[:, 1] = [f['total_duration'] for f in flights]
+    matrix[:, 2] = [len(f.get('layovers') or ()) for f in flights]
+    if criteria.departure_time and criteria.departure_window:
+        start, end = criteria.departure_window
+        hours = np.array([_departure_hour(f) for f in flights], dtype=np.float64)
+        # Hours outside the window; unknown times count as in-window
+        matrix[:, 3] = np.nan_to_num(np.maximum(start - hours, 0) + np.maximum(hours - end, 0))
+    else:
+        matrix[:, 3] = 0.0
+    matrix[:, 4] = [(f.get('carbon_emissions') or {}).get('this_flight', np.nan) for f in flights]
+    missing = np.isnan(matrix[:, 4])
+    if missing.any():
+        matrix[missing, 4] = np.nanmean(matrix[:, 4]) if not missing.all() else 0.0
+    return matrix
+
+
+def pareto_mask(matrix: np.ndarray, chunk: int = 1024) -> np.ndarray:
+    """
+    Boolean mask of rows not dominated by any other row (lower is better).
+
+    Compares rows in chunks to bound the size of the broadcast temporaries.
+    """
+    n = len(matrix)
+    mask = np.ones(n, dtype=bool)
+    for start in range(0, n, chunk):
+        block = matrix[start:start + chunk]
+        # le[i, j]: row j is <= block row i everywhere; lt[i, j]: strictly better somewhere
+        le = (matrix[None, :, :] <= block[:, None, :]).all(axis=2)
+        lt = (matrix[None, :, :] < block[:, None, :]).any(axis=2)
+        mask[start:start + chunk] = ~(le & lt).any(axis=1)
+    return mask
+
+
+def score_flights(flights: Sequence[Dict[str, Any]], criteria: Optional[RankingCriteria] = None) -> np.ndarray:
+    """
+    Weighted sum of min-max normalized criteria per flight (lower is better).
+
+    Flights excluded by `pareto_only` get a score of +inf.
+    """
+    criteria = criteria or RankingCriteria()
+    if not flights:
+        return np.empty(0)
+    matrix = _feature_matrix(flights, criteria)
+    weights = criteria.weights()
+    lo = matrix.min(axis=0)
+    value_range = matrix.max(axis=0) - lo
+    value_range[value_range == 0] = 1.0
+    scores = ((matrix - lo) / value_range) @ weights
+    if criteria.pareto_only:
+        active = weights > 0
+        scores[~pareto_mask(matrix[:, active])] = np.inf
+    return scores
+
+
+def rank_flights(results: Union[Dict[str, Any], Sequence[Dict[str, Any]]],
+                 criteria: Optional[RankingCriteria] = None,
+                 top_k: int = 3) -> List[Dict[str, Any]]:
+    """
+    Return the `top_k` best itineraries, best first.
+
+    Args:
+        results: Raw SerpApi response (or an already extracted list of flights)
+        criteria: Weights and options; defaults to equal price and duration weights
+        top_k: Number of itineraries to return
+
+    Returns:
+        The selected flight dicts, unchanged
+    """
+    flights = extract_flights(results) if isinstance(results, dict) else list(results)
+    with span('ranking', flights=len(flights)):
+        scores = score_flights(flights, criteria)
+        candidates = np.flatnonzero(np.isfinite(scores))
+        if not len(candidates) or top_k <= 0:
+            return []
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(scores[top], kind='stable')]
+        return [flights[i] for i in top]
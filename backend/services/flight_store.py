@@ -0,0 +1,375 @@
+"""
+Columnar, indexed store for local flight schedules.
+
+Schedule dumps in the `data/flights.json` schema (one dict per leg with
+departure/arrival airport and date, airline, and per-cabin ``price`` and
+``availableSeats``) are ingested into numpy columns:
+
+- strings (airports, airlines, flight numbers, ...) are dictionary-encoded
+  into int32 codes;
+- rows are sorted by (origin, destination, departure day, departure time),
+  so a route, or a route and date range, is one contiguous slice found by
+  binary search on the ``route_key`` column;
+- an airline index maps each airline code to its rows;
+- queries filter the candidate rows with vectorized masks.
+
+The built columns are saved as ``.npy`` files next to a JSON sidecar and
+memory-mapped on later loads, so restarts and forked workers share the
+page cache instead of reparsing the JSON. The store can be rebuilt ahead
+of time with:
+
+    python -m services.flight_store build [--source PATH]
+"""
+import os
+import json
+import logging
+import datetime
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE = os.path.join(BACKEND_DIR, 'data', 'flights.json')
+DEFAULT_DIRECTORY = os.path.join(BACKEND_DIR, 'data', 'index', 'flight_store')
+
+# Bumped whenever the on-disk layout changes so older builds are rebuilt
+STORE_VERSION = 1
+
+# Dictionary-encoded string columns: column name -> (record path)
+_STRING_COLUMNS = {
+    'flight_id': ('id',),
+    'airline': ('airline',),
+    'flight_number': ('flightNumber',),
+    'origin': ('departure', 'airport'),
+    'destination': ('arrival', 'airport'),
+    'duration': ('duration',),
+    'status': ('status',),
+}
+# Airports share one dictionary so origin and destination codes are comparable
+_DICTIONARY_OF = {'origin': 'airport', 'destination': 'airport'}
+_DICTIONARIES = ('flight_id', 'airline', 'flight_number', 'airport', 'duration', 'status')
+_COLUMNS = ('route_key', 'departure_day', 'departure_time', 'arrival_time', 'price', 'seats', 'airline_order') \
+    + tuple(_STRING_COLUMNS)
+
+Date = Union[str, datetime.date]
+
+
+def _get(record: Dict[str, Any], path: Sequence[str]) -> Any:
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def _day(value: Date) -> int:
+    """Days since the epoch for an ISO date/datetime string or date object."""
+    return int(np.datetime64(str(value)[:10], 'D').astype(np.int64))
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Flight records from a ``{"flights": [...]}``/list JSON file, or one per line from .jsonl/.ndjson."""
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    yield from data.get('flights', []) if isinstance(data, dict) else data
+
+
+class FlightStore:
+    """Dictionary-encoded flight columns with route and airline indexes (see module docstring)."""
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, np.ndarray], cabins: List[str],
+                 airline_offsets: List[int], source: Optional[Dict[str, Any]] = None):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.cabins = cabins
+        self.airline_offsets = airline_offsets
+        self.source = source or {}
+        # Reverse lookups for the query filters; the other dictionaries are only decoded
+        self._airport_codes = {str(value): code for code, value in enumerate(dictionaries['airport'])}
+        self._airline_codes = {str(value).lower(): code for code, value in enumerate(dictionaries['airline'])}
+
+    def __len__(self) -> int:
+        return len(self.columns['route_key'])
+
+    @property
+    def _airports(self) -> int:
+        return max(1, len(self.dictionaries['airport']))
+
+    @classmethod
+    def build(cls, records: Iterable, source: Optional[Dict[str, Any]] = None) -> "FlightStore":
+        """
+        Encode flight records into sorted columns and build the indexes.
+
+        Args:
+            records: Dicts in the `data/flights.json` schema
+            source: Metadata describing the source data, used to detect staleness
+        """
+        encoders: Dict[str, Dict[str, int]] = {}
+        codes: Dict[str, List[int]] = {name: [] for name in _STRING_COLUMNS}
+        departures: List[str] = []
+        arrivals: List[str] = []
+        prices: List[Dict[str, Any]] = []
+        seats: List[Dict[str, Any]] = []
+        cabins: Dict[str, None] = {}
+        for record in records:
+            departure = _get(record, ('departure', 'date'))
+            if not departure or not _get(record, ('departure', 'airport')) or not _get(record, ('arrival', 'airport')):
+                continue
+            for name, path in _STRING_COLUMNS.items():
+                encoder = encoders.setdefault(_DICTIONARY_OF.get(name, name), {})
+                value = _get(record, path)
+                value = '' if value is None else str(value)
+                if name in _DICTIONARY_OF:
+                    value = value.upper()
+                codes[name].append(encoder.setdefault(value, len(encoder)))
+            departures.append(departure)
+            arrivals.append(_get(record, ('arrival', 'date')) or departure)
+            prices.append(record.get('price') or {})
+            seats.append(record.get('availableSeats') or {})
+            cabins.update(dict.fromkeys(prices[-1]))
+
+        cabin_list = list(cabins)
+        columns: Dict[str, np.ndarray] = {name: np.asarray(values, dtype=np.int32) for name, values in codes.items()}
+        columns['departure_time'] = np.asarray(departures, dtype='datetime64[m]')
+        columns['arrival_time'] = np.asarray(arrivals, dtype='datetime64[m]')
+        columns['departure_day'] = columns['departure_time'].astype('datetime64[D]').astype(np.int32)
+        columns['price'] = np.full((len(departures), len(cabin_list)), np.nan, dtype=np.float32)
+        columns['seats'] = np.zeros((len(departures), len(cabin_list)), dtype=np.int32)
+        for row, (price, seat) in enumerate(zip(prices, seats)):
+            for col, cabin in enumerate(cabin_list):
+                if price.get(cabin) is not None:
+                    columns['price'][row, col] = price[cabin]
+                if seat.get(cabin) is not None:
+                    columns['seats'][row, col] = seat[cabin]
+
+        dictionaries = {name: np.asarray(list(encoders.get(name, ())), dtype=str) for name in _DICTIONARIES}
+        airports = max(1, len(dictionaries['airport']))
+        route_key = columns['origin'].astype(np.int64) * airports + columns['destination']
+        order = np.lexsort((columns['departure_time'], columns['departure_day'], route_key))
+        columns = {name: values[order] for name, values in columns.items()}
+        columns['route_key'] = route_key[order]
+        columns['airline_order'] = np.argsort(columns['airline'], kind='stable').astype(np.int32)
+        counts = np.bincount(columns['airline'], minlength=len(dictionaries['airline']))
+        airline_offsets = [0] + np.cumsum(counts).tolist()
+        return cls(columns, dictionaries, cabin_list, airline_offsets, source)
+
+    @classmethod
+    def from_file(cls, path: str) -> "FlightStore":
+        """Build the store from a schedule dump (see `iter_records`)."""
+        return cls.build(iter_records(path), source=source_info(path))
+
+    def save(self, directory: str) -> None:
+        """Persist every column and dictionary as ``.npy`` plus a JSON sidecar, written last and atomically."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {**self.columns, **{f'dict.{name}': values for name, values in self.dictionaries.items()}}
+        for name, values in arrays.items():
+            tmp = os.path.join(directory, f'{name}.npy.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(values))
+            os.replace(tmp, os.path.join(directory, f'{name}.npy'))
+        meta = {
+            'version': STORE_VERSION,
+            'count': len(self),
+            'cabins': self.cabins,
+            'airline_offsets': self.airline_offsets,
+            'source': self.source,
+        }
+        tmp = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(directory, 'meta.json'))
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["FlightStore"]:
+        """Memory-map a persisted store, or return None if it is missing or from another version."""
+        try:
+            with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if meta.get('version') != STORE_VERSION:
+            return None
+        # Empty arrays cannot be mapped
+        mmap_mode = 'r' if meta['count'] else None
+        try:
+            columns = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                       for name in _COLUMNS}
+            dictionaries = {name: np.load(os.path.join(directory, f'dict.{name}.npy'), mmap_mode=mmap_mode)
+                            for name in _DICTIONARIES}
+        except (FileNotFoundError, ValueError):
+            return None
+        return cls(columns, dictionaries, meta['cabins'], meta['airline_offsets'], meta.get('source'))
+
+    def _route_rows(self, origin: Optional[int], destination: Optional[int]) -> slice:
+        """Contiguous row range of a route (or of every route from `origin`)."""
+        route_key = self.columns['route_key']
+        if origin is None:
+            return slice(0, len(self))
+        if destination is None:
+            low, high = origin * self._airports, (origin + 1) * self._airports
+        else:
+            low = high = origin * self._airports + destination
+            high += 1
+        return slice(int(np.searchsorted(route_key, low, 'left')), int(np.searchsorted(route_key, high, 'left')))
+
+    def query(self, origin: Optional[str] = None, destination: Optional[str] = None,
+              date_from: Optional[Date] = None, date_to: Optional[Date] = None, cabin: str = 'economy',
+              max_price: Optional[float] = None, min_seats: int = 1, airline: Optional[str] = None,
+              limit: Optional[int] = 20) -> List[Dict[str, Any]]:
+        """
+        Flights matching every given filter, cheapest first.
+
+        Args:
+            origin: Departure airport code
+            destination: Arrival airport code
+            date_from: First departure date (inclusive); flights before today are never returned
+            date_to: Last departure date (inclusive, defaults to `date_from`; open-ended if neither is given)
+            cabin: Cabin whose price and seats are filtered and reported
+            max_price: Highest fare in `cabin`
+            min_seats: Fewest available seats in `cabin`
+            airline: Airline name (case-insensitive)
+            limit: Maximum number of flights returned (None for all)
+
+        Returns:
+            Flight dicts in the source schema, with `price` and `availableSeats` for `cabin` only
+        """
+        if cabin not in self.cabins:
+            return []
+        origin_code = destination_code = airline_code = None
+        airports = self._airport_codes
+        if origin is not None:
+            origin_code = airports.get(origin.upper())
+            if origin_code is None:
+                return []
+        if destination is not None:
+            destination_code = airports.get(destination.upper())
+            if destination_code is None:
+                return []
+        if airline is not None:
+            airline_code = self._airline_codes.get(airline.lower())
+            if airline_code is None:
+                return []
+        # Departed flights are never offered, whatever range was asked for
+        first = _day(datetime.date.today())
+        last = None
+        if date_from is not None:
+            first = max(first, _day(date_from))
+            last = _day(date_to if date_to is not None else date_from)
+        elif date_to is not None:
+            last = _day(date_to)
+        if last is not None and last < first:
+            return []
+
+        if origin_code is None and airline_code is not None:
+            # No route: the airline index is the narrowest candidate set
+            rows = np.sort(self.columns['airline_order'][self.airline_offsets[airline_code]:
+                                                         self.airline_offsets[airline_code + 1]])
+        else:
+            bounds = self._route_rows(origin_code, destination_code)
+            if destination_code is not None:
+                # Within one route rows are sorted by day: narrow by binary search too
+                days = self.columns['departure_day'][bounds]
+                stop = int(np.searchsorted(days, last, 'right')) if last is not None else len(days)
+                bounds = slice(bounds.start + int(np.searchsorted(days, first, 'left')), bounds.start + stop)
+            rows = np.arange(bounds.start, bounds.stop)
+        if not len(rows):
+            return []
+
+        column = self.cabins.index(cabin)
+        price = self.columns['price'][rows, column]
+        seats = self.columns['seats'][rows, column]
+        mask = ~np.isnan(price) & (seats >= min_seats)
+        if max_price is not None:
+            mask &= price <= max_price
+        if destination_code is not None:
+            mask &= self.columns['destination'][rows] == destination_code
+        if airline_code is not None:
+            mask &= self.columns['airline'][rows] == airline_code
+        days = self.columns['departure_day'][rows]
+        mask &= days >= first
+        if last is not None:
+            mask &= days <= last
+        rows, price = rows[mask], price[mask]
+        order = np.lexsort((self.columns['departure_time'][rows], price))
+        if limit is not None:
+            order = order[:limit]
+        return [self._record(int(row), column) for row in rows[order]]
+
+    def _record(self, row: int, column: int) -> Dict[str, Any]:
+        def value(name: str) -> str:
+            return str(self.dictionaries[_DICTIONARY_OF.get(name, name)][int(self.columns[name][row])])
+
+        return {
+            'id': value('flight_id'),
+            'airline': value('airline'),
+            'flightNumber': value('flight_number'),
+            'departure': {'airport': value('origin'), 'date': str(self.columns['departure_time'][row].astype('datetime64[s]'))},
+            'arrival': {'airport': value('destination'), 'date': str(self.columns['arrival_time'][row].astype('datetime64[s]'))},
+            'duration': value('duration'),
+            'status': value('status'),
+            'cabin': self.cabins[column],
+            'price': float(self.columns['price'][row, column]),
+            'availableSeats': int(self.columns['seats'][row, column]),
+        }
+
+
+def source_info(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def open_store(source: str, directory: str) -> FlightStore:
+    """Memory-map the persisted store for `source`, rebuilding it first if missing or stale."""
+    store = FlightStore.load(directory)
+    if store is not None and store.source == source_info(source):
+        return store
+    built = FlightStore.from_file(source)
+    built.save(directory)
+    logger.info("Built flight store: %d flights from %s -> %s", len(built), source, directory)
+    # Serve from the mapped files so the columns live in the shared page cache
+    return FlightStore.load(directory) or built
+
+
+_store: Optional[FlightStore] = None
+_store_lock = threading.Lock()
+
+
+def get_flight_store() -> FlightStore:
+    """Process-wide store over FLIGHT_STORE_SOURCE, persisted under FLIGHT_STORE_DIR."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_store(os.getenv("FLIGHT_STORE_SOURCE", DEFAULT_SOURCE),
+                                    os.getenv("FLIGHT_STORE_DIR", DEFAULT_DIRECTORY))
+    return _store
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point for rebuilding the on-disk flight store."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the columnar flight store from a schedule dump")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--source', default=os.getenv("FLIGHT_STORE_SOURCE", DEFAULT_SOURCE),
+                        help="Schedule dump (.json or .jsonl)")
+    parser.add_argument('--directory', default=os.getenv("FLIGHT_STORE_DIR", DEFAULT_DIRECTORY))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    store = FlightStore.from_file(args.source)
+    store.save(args.directory)
+    logger.info("Built flight store: %d flights -> %s", len(store), args.directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Persistent geocoding cache (city -> coordinates) stored in SQLite via SQLAlchemy.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+from sqlalchemy import Column, Float, MetaData, String, Table, create_engine, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .text_utils import normalize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), '../data/geocode_cache.sqlite')
+
+metadata = MetaData()
+
+geocodes = Table(
+    'geocodes', metadata,
+    Column('key', String, primary_key=True),
+    Column('lat', Float, nullable=False),
+    Column('lon', Float, nullable=False),
+    Column('name', String, nullable=False),
+    Column('country', String, nullable=False, default=''),
+    Column('created_at', Float, nullable=False),
+)
+
+
+def geocode_key(city: str, country_code: Optional[str] = None) -> str:
+    """Normalized 'city,country_code' key, e.g. ' Zürich , ch' -> 'zurich,ch'."""
+    query = f"{city},{country_code}" if country_code else city
+    parts = [re.sub(r"\s+", " ", part).strip() for part in normalize(query).split(',')]
+    return ','.join(part for part in parts if part)
+
+
+class GeocodeCache:
+    """
+    Write-through cache of geocoding results.
+
+    City coordinates do not change, so entries never expire. Lookups are
+    served from an in-memory dict that is filled from the database on first
+    use; only successful geocodes are stored.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        """
+        Args:
+            url: SQLAlchemy database URL (GEOCODE_CACHE_URL, defaults to
+                backend/data/geocode_cache.sqlite)
+        """
+        self.url = url or os.getenv("GEOCODE_CACHE_URL") or f"sqlite:///{os.path.abspath(DEFAULT_DB_PATH)}"
+        self._engine = None
+        self._memory: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._memory is not None:
+            return self._memory
+        with self._lock:
+            if self._memory is None:
+                memory = {}
+                try:
+                    if self.url.startswith('sqlite:///'):
+                        os.makedirs(os.path.dirname(self.url[len('sqlite:///'):]) or '.', exist_ok=True)
+                    self._engine = create_engine(self.url)
+                    metadata.create_all(self._engine)
+                    with self._engine.connect() as conn:
+                        for row in conn.execute(select(geocodes)):
+                            memory[row.key] = {'lat': row.lat, 'lon': row.lon, 'name': row.name, 'country': row.country}
+                    logger.info(f"Geocode cache loaded {len(memory)} locations")
+                except Exception as e:
+                    # Fall back to a memory-only cache rather than failing weather lookups
+                    logger.error(f"Geocode cache unavailable ({self.url}): {e}")
+                    self._engine = None
+                self._memory = memory
+        return self._memory
+
+    def get(self, city: str, country_code: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached location for a city, or None."""
+        location = self._load().get(geocode_key(city, country_code))
+        if location is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return location
+
+    def set(self, city: str, country_code: Optional[str], location: Dict[str, Any]) -> None:
+        """Store a geocoding result in memory and in the database."""
+        key = geocode_key(city, country_code)
+        memory = self._load()
+        memory[key] = location
+        if self._engine is None:
+            return
+        row = {
+            'key': key,
+            'lat': location['lat'],
+            'lon': location['lon'],
+            'name': location.get('name') or city,
+            'country': location.get('country') or '',
+            'created_at': time.time(),
+        }
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(sqlite_insert(geocodes).values(**row).on_conflict_do_nothing())
+        except Exception as e:
+            logger.error(f"Failed to persist geocode for {key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters and occupancy."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._memory or {}),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
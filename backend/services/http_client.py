@@ -0,0 +1,112 @@
+"""
+Shared, connection-pooled async HTTP client for calls to upstream APIs.
+"""
+import os
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .tracing import record_upstream, span
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    """Return True if the optional `h2` package needed for HTTP/2 is installed."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class SharedHTTPClient:
+    """
+    Process-wide `httpx.AsyncClient` with keep-alive, HTTP/2 and per-host limits.
+
+    The underlying client is created lazily on first use, so services can call
+    `get()` even when the FastAPI lifespan has not run (e.g. in scripts), but
+    the app starts and closes it explicitly so connections are drained on
+    shutdown.
+    """
+
+    def __init__(self):
+        """Read pool settings from the environment."""
+        self.max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.max_per_host = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+        self.http2 = os.getenv("HTTP_ENABLE_HTTP2", "true").lower() == "true" and _http2_available()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the pooled client, creating it if needed."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(30.0, connect=5.0),
+            )
+            self._host_limits = {}
+            logger.info(
+                "Shared HTTP client started (http2=%s, max_connections=%d, per_host=%d)",
+                self.http2, self.max_connections, self.max_per_host,
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return limit
+
+    async def start(self) -> None:
+        """Eagerly create the pooled client (called on application startup)."""
+        _ = self.client
+
+    async def aclose(self) -> None:
+        """Close the pooled client and drop idle connections (called on shutdown)."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("Shared HTTP client closed")
+        self._client = None
+        self._host_limits = {}
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  timeout: Optional[float] = None) -> httpx.Response:
+        """
+        Perform a GET request through the shared pool.
+
+        Args:
+            url: Absolute URL to request
+            params: Query string parameters
+            timeout: Optional per-request timeout in seconds
+
+        Returns:
+            The `httpx.Response` (status is not checked)
+        """
+        client = self.client
+        host = urlsplit(url).netloc
+        async with self._host_limit(url):
+            with span('http.get', host=host) as s:
+                if timeout is None:
+                    response = await client.get(url, params=params)
+                else:
+                    response = await client.get(url, params=params, timeout=timeout)
+                s.set('status', response.status_code)
+        record_upstream(host, response.status_code)
+        return response
+
+
+# Singleton instance
+http_client = SharedHTTPClient()
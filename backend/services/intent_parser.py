@@ -0,0 +1,234 @@
+"""
+Rule-based intent and slot extraction for simple, fully specified flight queries.
+
+Only messages that parse completely (known origin and destination, a
+departure date, nothing left over) produce an intent; anything else is left
+to the LLM agent.
+"""
+import re
+import datetime
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+_MONTH = r"(?P<month>jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_DAY = r"(?P<day>\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s*(?P<year>\d{4}))?"
+
+DATE_PATTERNS = [
+    re.compile(r"\b(?P<iso>\d{4}-\d{2}-\d{2})\b"),
+    re.compile(rf"\b{_DAY}\s+(?:of\s+)?{_MONTH}{_YEAR}\b"),
+    re.compile(rf"\b{_MONTH}\s+{_DAY}{_YEAR}\b"),
+    re.compile(r"\b(?P<relative>today|tomorrow|day after tomorrow)\b"),
+]
+
+ONE_WAY_RE = re.compile(r"\bone[\s-]?way\b")
+ROUND_TRIP_RE = re.compile(r"\b(?:round[\s-]?trip|return(?:ing)?(?:\s+trip)?)\b")
+
+# Words that may surround the route and dates without changing the meaning
+FILLER_WORDS = frozenset("""
+a an any available book cheap cheapest direct find flight flights fly for get i leaving
+look looking me on please search show some the trip want would like ticket tickets
+depart departing departure outbound return returning back coming and until till
+""".split())
+
+ROUTE_RE = re.compile(r"^(?:from\s+)?(?P<origin>[a-z][a-z .'-]*?)\s+(?:to|->|→)\s+(?P<destination>[a-z][a-z .'-]*?)$")
+
+
+@dataclass
+class FlightIntent:
+    """Slots of a confidently parsed flight search request."""
+    departure_id: str
+    arrival_id: str
+    departure_date: datetime.date
+    return_date: Optional[datetime.date] = None
+    type: int = 2  # SerpApi trip type: 1=round-trip, 2=one-way
+
+
+def _to_date(match: re.Match, today: datetime.date) -> Optional[datetime.date]:
+    groups = match.groupdict()
+    if groups.get('iso'):
+        try:
+            return datetime.date.fromisoformat(groups['iso'])
+        except ValueError:
+            return None
+    if groups.get('relative'):
+        offset = {'today': 0, 'tomorrow': 1, 'day after tomorrow': 2}[groups['relative']]
+        return today + datetime.timedelta(days=offset)
+    month = MONTHS[groups['month'][:3]]
+    day = int(groups['day'])
+    year = int(groups['year']) if groups.get('year') else today.year
+    try:
+        value = datetime.date(year, month, day)
+    except ValueError:
+        return None
+    if not groups.get('year') and value < today:
+        # "2 Nov" means the next 2 November
+        try:
+            value = value.replace(year=year + 1)
+        except ValueError:
+            return None
+    return value
+
+
+def _extract_dates(text: str, today: datetime.date) -> Tuple[List[datetime.date], str]:
+    """Find dates in order of appearance and return them with the text minus the dates."""
+    found: List[Tuple[int, int, Optional[datetime.date]]] = []
+    for pattern in DATE_PATTERNS:
+        for m in pattern.finditer(text):
+            if any(start < m.end() and m.start() < end for start, end, _ in found):
+                continue
+            found.append((m.start(), m.end(), _to_date(m, today)))
+    found.sort()
+    remaining = text
+    for start, end, _ in reversed(found):
+        remaining = remaining[:start] + ' ' + remaining[end:]
+    return [d for _, _, d in found], remaining
+
+
+def _normalize(message: str) -> str:
+    text = re.sub(r"[?!,;]", " ", message.lower()).strip()
+    return re.sub(r"\.(?=\s|$)", " ", text)
+
+
+def _match_route(text: str, resolve: Callable[[str], Optional[str]]) -> Optional[Tuple[str, str]]:
+    """Resolved (origin, destination) when `text`, minus trip-type and filler words, is just a route."""
+    text = ONE_WAY_RE.sub(' ', text)
+    text = ROUND_TRIP_RE.sub(' ', text)
+    # Drop filler words at the edges and around the route keywords
+    words = [w for w in text.split() if w not in FILLER_WORDS]
+    route = ROUTE_RE.match(' '.join(words))
+    if not route:
+        return None
+    origin = resolve(route.group('origin').strip())
+    destination = resolve(route.group('destination').strip())
+    if not origin or not destination or origin == destination:
+        return None
+    return origin, destination
+
+
+def parse_route(message: str, today: datetime.date,
+                resolve: Callable[[str], Optional[str]]) -> Optional[Tuple[str, str]]:
+    """
+    Parse the route of messages like "London to Paris" or "cheap flights LHR to CDG on 2 Nov",
+    with or without dates.
+
+    Returns:
+        (origin, destination) IATA codes when every part of the message is understood, else None
+    """
+    dates, text = _extract_dates(_normalize(message), today)
+    if any(d is None for d in dates):
+        return None
+    return _match_route(text, resolve)
+
+
+def parse_flight_intent(message: str, today: datetime.date,
+                        resolve: Callable[[str], Optional[str]]) -> Optional[FlightIntent]:
+    """
+    Parse messages like "flights LHR to CDG 2026-11-02" or
+    "London to Paris on 2 Nov returning 9 Nov".
+
+    Args:
+        message: Raw user message
+        today: Reference date for relative and year-less dates
+        resolve: Maps a city name or airport code to an IATA code, or None
+
+    Returns:
+        A FlightIntent when every part of the message is understood, else None
+    """
+    dates, text = _extract_dates(_normalize(message), today)
+    if not dates or len(dates) > 2 or any(d is None for d in dates):
+        return None
+
+    one_way = bool(ONE_WAY_RE.search(text))
+    round_trip = bool(ROUND_TRIP_RE.search(text)) or len(dates) == 2
+    if one_way and (round_trip or len(dates) == 2):
+        return None
+    route = _match_route(text, resolve)
+    if route is None:
+        return None
+    origin, destination = route
+
+    departure_date = dates[0]
+    return_date = dates[1] if len(dates) == 2 else None
+    if return_date is not None and return_date <= departure_date:
+        return None
+    if round_trip and return_date is None:
+        # Round trip without a return date needs a follow-up question
+        return None
+    return FlightIntent(
+        departure_id=origin,
+        arrival_id=destination,
+        departure_date=departure_date,
+        return_date=return_date,
+        type=1 if return_date else 2,
+    )
+
+
+# Refinements of the previous search, e.g. "what about the day after?" or "only nonstop"
+FOLLOW_UP_FILLER = frozenset("""
+what how about and the a an any only just show me please instead then options option ones one
+flights flight those them there can i you find something anything is are with it get go fly in
+""".split())
+
+_NUMBER_WORDS = {'a': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7}
+_N = r"(?P<n>\d+|a|one|two|three|four|five|six|seven)"
+
+
+
+def _day_shift(m: re.Match) -> int:
+    days = _NUMBER_WORDS.get(m.group('n')) or int(m.group('n'))
+    return days if m.group('dir') in ('later', 'after') else -days
+
+
+FOLLOW_UP_PATTERNS = [
+    (re.compile(r"\b(?:(?:the\s+)?(?:next\s+day|day\s+after)|a\s+day\s+later)\b"), lambda m: {'date_shift': 1}),
+    (re.compile(r"\b(?:(?:the\s+)?(?:previous\s+day|day\s+before)|a\s+day\s+earlier)\b"), lambda m: {'date_shift': -1}),
+    (re.compile(rf"\b{_N}\s+days?\s+(?P<dir>later|after|earlier|before)\b"), lambda m: {'date_shift': _day_shift(m)}),
+    (re.compile(r"\b(?:cheaper|cheapest|lower\s+price|less\s+expensive)\b"), lambda m: {'sort': 'price'}),
+    (re.compile(r"\b(?:faster|fastest|quicker|quickest|shorter|shortest)\b"), lambda m: {'sort': 'duration'}),
+    (re.compile(r"\b(?:non[\s-]?stops?|direct|no\s+(?:stops|layovers))\b"), lambda m: {'nonstop': True}),
+    (re.compile(r"\bmorning\b"), lambda m: {'departure_window': (5, 12)}),
+    (re.compile(r"\bafternoon\b"), lambda m: {'departure_window': (12, 18)}),
+    (re.compile(r"\b(?:evening|night)\b"), lambda m: {'departure_window': (17, 24)}),
+]
+
+
+@dataclass
+class FollowUp:
+    """Refinement of the previous flight search."""
+    date_shift: int = 0  # days to move the departure (and return) date
+    sort: Optional[str] = None  # 'price' or 'duration'
+    nonstop: bool = False
+    departure_window: Optional[Tuple[float, float]] = None
+
+
+def parse_follow_up(message: str) -> Optional[FollowUp]:
+    """
+    Parse short refinements such as "what about the day after?",
+    "cheaper ones?" or "only nonstop in the morning".
+
+    Returns:
+        A FollowUp when every part of the message is understood, else None
+    """
+    text = re.sub(r"[?!,;.]", " ", message.lower()).strip()
+    follow_up = FollowUp()
+    matched = False
+    for pattern, slots in FOLLOW_UP_PATTERNS:
+        for m in pattern.finditer(text):
+            for name, value in slots(m).items():
+                if name == 'date_shift':
+                    follow_up.date_shift += value
+                else:
+                    setattr(follow_up, name, value)
+            matched = True
+        text = pattern.sub(' ', text)
+    if not matched:
+        return None
+    leftover = [w for w in text.split() if w not in FOLLOW_UP_FILLER and w not in FILLER_WORDS]
+    if leftover:
+        return None
+    return follow_up
@@ -0,0 +1,305 @@
+"""
+LLM response cache for ChatService: exact-match plus optional near-duplicate lookup.
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+import datetime
+import warnings
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+from .cache import TTLCache
+from .cache_backend import CacheBackend
+from .tracing import record_cache
+from .text_utils import normalize, tokenize
+from .vector_index import HashingEmbedder
+
+logger = logging.getLogger(__name__)
+
+# ChatService puts the request date in the prompt; entries expire when that day ends
+DATE_RE = re.compile(r"Today's date: (\d{4}-\d{2}-\d{2})")
+_WHITESPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+")
+
+# Words a near-duplicate may add or drop without changing the request
+IGNORABLE_WORDS = frozenset("a an the please me some any can you i".split())
+
+
+def _parse_messages(prompt: str) -> Optional[List[Tuple[str, str]]]:
+    """(type, content) pairs of a serialized chat prompt, or None for plain-text prompts."""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return None
+    if not isinstance(messages, list):
+        return None
+    pairs = []
+    for message in messages:
+        kwargs = message.get('kwargs', {}) if isinstance(message, dict) else {}
+        content = kwargs.get('content')
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, default=str)
+        pairs.append((kwargs.get('type', ''), content))
+    return pairs
+
+
+def _same_request(a: Sequence[str], b: Sequence[str]) -> bool:
+    """
+    Verify a near-duplicate candidate: same numbers, same word order, and every
+    differing word is an inflection or typo of a word on the other side.
+
+    Embeddings of word bags cannot tell "London to Paris" from "Paris to
+    London", so a similarity score alone is never trusted.
+    """
+    if _NUMBER_RE.findall(' '.join(a)) != _NUMBER_RE.findall(' '.join(b)):
+        return False
+    shared = set(a) & set(b)
+    if list(dict.fromkeys(t for t in a if t in shared)) != list(dict.fromkeys(t for t in b if t in shared)):
+        return False
+    only_a = [t for t in set(a) - shared if t not in IGNORABLE_WORDS]
+    only_b = [t for t in set(b) - shared if t not in IGNORABLE_WORDS]
+    if len(only_a) != len(only_b):
+        return False
+    for word in only_a:
+        match = max(only_b, key=lambda other: SequenceMatcher(None, word, other).ratio(), default=None)
+        if match is None or SequenceMatcher(None, word, match).ratio() < 0.8:
+            return False
+        only_b.remove(match)
+    return True
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache for chat model calls (pass as `ChatOpenAI(cache=...)`).
+
+    Exact hits are keyed on a hash of the LLM configuration string (model,
+    parameters and bound function/tool schemas) and the whitespace- and
+    case-normalized messages. Entries live for `ttl` seconds but never past
+    the end of the "Today's date" in the prompt, so date-relative answers do
+    not go stale.
+
+    The optional semantic layer handles near-duplicate first turns (only
+    system and human messages): candidates with identical system messages and
+    configuration are found by embedding similarity and then verified word by
+    word before the cached generation is reused.
+
+    With a `shared` backend, exact entries are also written to and read from
+    the cross-worker cache, so workers benefit from each other's calls.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 semantic: Optional[bool] = None, threshold: Optional[float] = None,
+                 embedder=None, shared: Optional[CacheBackend] = None):
+        """
+        Args:
+            ttl: Maximum entry lifetime in seconds (LLM_CACHE_TTL, default 3600)
+            max_entries: Cached responses before LRU eviction (LLM_CACHE_MAX_ENTRIES, default 2048)
+            semantic: Enable near-duplicate lookups (LLM_SEMANTIC_CACHE, default false)
+            threshold: Minimum cosine similarity of candidates (LLM_SEMANTIC_THRESHOLD, default 0.9)
+            embedder: Embedder for the semantic layer (defaults to HashingEmbedder)
+            shared: Optional cross-worker backend used as a second level for exact hits
+        """
+        self.ttl = ttl or float(os.getenv("LLM_CACHE_TTL", "3600"))
+        self.exact = TTLCache(ttl=self.ttl, max_entries=max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048")))
+        self.semantic = semantic if semantic is not None else os.getenv("LLM_SEMANTIC_CACHE", "false").lower() == "true"
+        self.threshold = threshold or float(os.getenv("LLM_SEMANTIC_THRESHOLD", "0.9"))
+        self.embedder = embedder or HashingEmbedder()
+        self.shared = shared
+        # group key -> OrderedDict(exact key -> (vector, tokens))
+        self._groups: Dict[str, "OrderedDict[str, Tuple[np.ndarray, List[str]]]"] = {}
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize_prompt(prompt: str) -> str:
+        return _WHITESPACE_RE.sub(' ', normalize(prompt)).strip()
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        raw = f"{llm_string}\x00{self._normalize_prompt(prompt)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _entry_ttl(self, prompt: str) -> float:
+        match = DATE_RE.search(prompt)
+        if not match:
+            return self.ttl
+        try:
+            day = datetime.date.fromisoformat(match.group(1))
+        except ValueError:
+            return self.ttl
+        end_of_day = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time())
+        return min(self.ttl, (end_of_day - datetime.datetime.now()).total_seconds())
+
+    def _semantic_parts(self, prompt: str, llm_string: str) -> Optional[Tuple[str, str]]:
+        """(group key, text to embed) for first-turn prompts, else None."""
+        messages = _parse_messages(prompt)
+        if not messages or any(kind not in ('system', 'human') for kind, _ in messages):
+            return None
+        human = [content for kind, content in messages if kind == 'human']
+        if len(human) != 1:
+            return None
+        fixed = '\x00'.join(content for kind, content in messages if kind == 'system')
+        match = DATE_RE.search(prompt)
+        group = hashlib.sha256(f"{llm_string}\x00{fixed}\x00{match.group(1) if match else ''}".encode('utf-8')).hexdigest()
+        return group, DATE_RE.sub(' ', human[0])
+
+    def _semantic_lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        parts = self._semantic_parts(prompt, llm_string)
+        if parts is None:
+            return None
+        group, text = parts
+        with self._lock:
+            entries = self._groups.get(group)
+            if not entries:
+                return None
+            cached = self._matrices.get(group)
+            if cached is None:
+                keys = list(entries)
+                cached = self._matrices[group] = (keys, np.vstack([entries[k][0] for k in keys]))
+            keys, matrix = cached
+        tokens = tokenize(text)
+        scores = matrix @ self.embedder.embed([text])[0]
+        for i in np.argsort(-scores)[:5]:
+            if scores[i] < self.threshold:
+                break
+            key = keys[i]
+            entry = entries.get(key)
+            if entry is None or not _same_request(tokens, entry[1]):
+                continue
+            value = self.exact.get(key)
+            if value is None:
+                self._forget(group, key)
+                continue
+            return value
+        return None
+
+    def _remember(self, prompt: str, llm_string: str, key: str) -> None:
+        parts = self._semantic_parts(prompt, llm_string)
+        if parts is None:
+            return
+        group, text = parts
+        vector = self.embedder.embed([text])[0]
+        with self._lock:
+            entries = self._groups.setdefault(group, OrderedDict())
+            entries[key] = (vector, tokenize(text))
+            while len(entries) > self.exact.max_entries:
+                entries.popitem(last=False)
+            self._matrices.pop(group, None)
+
+    def _forget(self, group: str, key: str) -> None:
+        with self._lock:
+            entries = self._groups.get(group)
+            if entries is not None and entries.pop(key, None) is not None:
+                self._matrices.pop(group, None)
+
+    @staticmethod
+    def _decode(serialized: Optional[str]) -> Optional[RETURN_VAL_TYPE]:
+        if serialized is None:
+            return None
+        try:
+            with warnings.catch_warnings():
+                # `loads` is flagged as beta by langchain_core
+                warnings.simplefilter('ignore')
+                return loads(serialized)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable shared LLM cache entry: {e}")
+            return None
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Return cached generations for an exact or verified near-duplicate prompt."""
+        key = self._key(prompt, llm_string)
+        value = self.exact.get(key)
+        if value is None and self.shared is not None:
+            value = self._from_shared(prompt, key, self.shared.get("llm:" + key))
+        return self._finish_lookup(prompt, llm_string, value)
+
+    def _from_shared(self, prompt: str, key: str, serialized: Optional[str]) -> Optional[RETURN_VAL_TYPE]:
+        value = self._decode(serialized)
+        if value is not None:
+            self.exact.set(key, value, ttl=max(self._entry_ttl(prompt), 1))
+        return value
+
+    def _finish_lookup(self, prompt: str, llm_string: str,
+                       value: Optional[RETURN_VAL_TYPE]) -> Optional[RETURN_VAL_TYPE]:
+        if value is not None:
+            self.hits += 1
+            record_cache('llm', True)
+            return value
+        if self.semantic:
+            value = self._semantic_lookup(prompt, llm_string)
+            if value is not None:
+                self.hits += 1
+                self.semantic_hits += 1
+                record_cache('llm_semantic', True)
+                logger.info("LLM cache near-duplicate hit")
+                return value
+        self.misses += 1
+        record_cache('llm', False)
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Store generations unless the prompt's date has already ended."""
+        entry = self._update_local(prompt, llm_string, return_val)
+        if entry is not None and self.shared is not None:
+            self.shared.set("llm:" + entry[0], dumps(return_val), entry[1])
+
+    def _update_local(self, prompt: str, llm_string: str,
+                      return_val: RETURN_VAL_TYPE) -> Optional[Tuple[str, float]]:
+        """Store in the in-process layers; returns (key, ttl), or None if the entry is not cached."""
+        ttl = self._entry_ttl(prompt)
+        if ttl <= 0:
+            return None
+        key = self._key(prompt, llm_string)
+        self.exact.set(key, return_val, ttl=ttl)
+        if self.semantic:
+            self._remember(prompt, llm_string, key)
+        return key, ttl
+
+    def clear(self, **kwargs: Any) -> None:
+        """Drop all cached responses."""
+        self.exact.clear()
+        with self._lock:
+            self._groups.clear()
+            self._matrices.clear()
+
+    # The async variants read and write the shared backend without blocking the event loop
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        value = self.exact.get(key)
+        if value is None and self.shared is not None:
+            value = self._from_shared(prompt, key, await self.shared.aget("llm:" + key))
+        return self._finish_lookup(prompt, llm_string, value)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        entry = self._update_local(prompt, llm_string, return_val)
+        if entry is not None and self.shared is not None:
+            await self.shared.aset("llm:" + entry[0], dumps(return_val), entry[1])
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.exact),
+            'max_entries': self.exact.max_entries,
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.exact.evictions,
+            'expirations': self.exact.expirations,
+        }
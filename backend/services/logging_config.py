@@ -0,0 +1,246 @@
+"""
+Non-blocking, structured logging.
+
+Records are handed to a `QueueHandler` on the calling thread and written by a
+`QueueListener` thread, so file and console I/O never run on the event loop.
+Before a record is queued its message is rendered and payloads larger than
+LOG_MAX_MESSAGE_CHARS are truncated; only one in LOG_LARGE_SAMPLE_EVERY of
+those oversized INFO/DEBUG records is kept at all. The log file is JSON lines
+and rotates at LOG_MAX_BYTES. Forked worker processes each write and rotate
+their own file (``backend.<worker>.log``), since rotating one shared file
+from several processes loses records.
+
+Log with %-style arguments (``logger.info("Searching %s", key)``) rather than
+f-strings so that nothing is formatted for disabled levels.
+"""
+import os
+import json
+import queue
+import atexit
+import logging
+import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from .tracing import get_trace_id, metrics
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'backend.log')
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+metrics.describe('log_records_dropped_total', "Log records dropped by sampling or a full log queue")
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'trace_id'}
+
+
+def truncate(text: str, limit: int) -> str:
+    """Cut `text` to `limit` characters, noting how much was dropped."""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with timestamp, level, logger, message, trace id and extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            entry['trace_id'] = trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class PayloadQueueHandler(QueueHandler):
+    """
+    `QueueHandler` that renders, truncates and samples records on the caller's side.
+
+    Rendering here (instead of in the listener thread) is what lets the
+    record carry the caller's trace id, and truncating before the record is
+    queued keeps large LLM or API payloads from piling up in memory. Oversized
+    records below WARNING are sampled; when the queue is full records are
+    dropped rather than blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int = 2000, sample_every: int = 10):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.sample_every = max(1, sample_every)
+        self.dropped = 0
+        self._oversized = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, reason: str) -> None:
+        with self._lock:
+            self.dropped += 1
+        metrics.inc('log_records_dropped_total', reason=reason)
+
+    def prepare(self, record: logging.LogRecord) -> Optional[logging.LogRecord]:
+        message = record.getMessage()
+        if self.max_chars and len(message) > self.max_chars:
+            if record.levelno < logging.WARNING:
+                with self._lock:
+                    self._oversized += 1
+                    keep = self._oversized % self.sample_every == 1 or self.sample_every == 1
+                if not keep:
+                    self._drop('sampled')
+                    return None
+            message = truncate(message, self.max_chars)
+        if record.exc_info and not record.exc_text:
+            # Tracebacks cannot be pickled or safely formatted later
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # Shallow copy so other handlers still see the original record
+        prepared = logging.LogRecord.__new__(logging.LogRecord)
+        prepared.__dict__.update(record.__dict__)
+        prepared.msg, prepared.args, prepared.exc_info = message, None, None
+        prepared.trace_id = get_trace_id()
+        return prepared
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            prepared = self.prepare(record)
+            if prepared is None:
+                return
+            self.enqueue(prepared)
+        except queue.Full:
+            self._drop('queue_full')
+        except Exception:
+            self.handleError(record)
+
+
+class _LoggingState:
+    """Handlers and listener installed by `configure_logging`."""
+
+    def __init__(self):
+        self.queue_handler: Optional[PayloadQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+        self.handlers: List[logging.Handler] = []
+        self.queue_size = 0
+        self.lock = threading.Lock()
+
+
+_state = _LoggingState()
+
+
+def configure_logging(level: Optional[str] = None, log_path: Optional[str] = None,
+                      force: bool = False) -> PayloadQueueHandler:
+    """
+    Install the queued handler on the root logger and start the writer thread.
+
+    Calling it again is a no-op unless `force` is set, so every entry point
+    (the app, the chat service, scripts) can call it.
+
+    Args:
+        level: Root log level (default LOG_LEVEL or INFO)
+        log_path: Rotating JSON log file (default LOG_PATH or logs/backend.log);
+            an empty LOG_PATH disables the file
+        force: Replace a previous configuration
+
+    Returns:
+        The queue handler attached to the root logger
+    """
+    with _state.lock:
+        if _state.queue_handler is not None and not force:
+            return _state.queue_handler
+        _shutdown_locked()
+
+        level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+        log_path = os.getenv('LOG_PATH', DEFAULT_LOG_PATH) if log_path is None else log_path
+        handlers: List[logging.Handler] = []
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+            file_handler = RotatingFileHandler(
+                log_path,
+                maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+                backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+                encoding='utf-8',
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        if os.getenv('LOG_CONSOLE', '1') != '0':
+            console = logging.StreamHandler()
+            console.setFormatter(JsonFormatter() if os.getenv('LOG_FORMAT', 'text') == 'json' else logging.Formatter(TEXT_FORMAT))
+            handlers.append(console)
+
+        _state.queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+        log_queue: queue.Queue = queue.Queue(maxsize=_state.queue_size)
+        queue_handler = PayloadQueueHandler(
+            log_queue,
+            max_chars=int(os.getenv('LOG_MAX_MESSAGE_CHARS', '2000')),
+            sample_every=int(os.getenv('LOG_LARGE_SAMPLE_EVERY', '10')),
+        )
+        root = logging.getLogger()
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _state.queue_handler = queue_handler
+        _state.handlers = handlers
+        _state.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _state.listener.start()
+        return queue_handler
+
+
+def _shutdown_locked() -> None:
+    if _state.listener is not None:
+        _state.listener.stop()
+        _state.listener = None
+    for handler in _state.handlers:
+        handler.close()
+    _state.handlers = []
+    if _state.queue_handler is not None:
+        logging.getLogger().removeHandler(_state.queue_handler)
+        _state.queue_handler = None
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    with _state.lock:
+        _shutdown_locked()
+
+
+def worker_log_path(path: str, worker: str) -> str:
+    """Per-worker variant of a log file path: logs/backend.log -> logs/backend.<worker>.log."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{worker}{ext}"
+
+
+def _restart_listener_in_child() -> None:
+    # fork() copies the queue but not the writer thread, and the queue's lock
+    # may have been held mid-put; give the child a fresh queue and writer
+    if _state.queue_handler is None:
+        return
+    _state.lock = threading.Lock()
+    # Only one process may rotate a file: move the child to its own
+    # (LOG_WORKER_ID is set by serve.py to the worker slot)
+    worker = os.getenv('LOG_WORKER_ID') or str(os.getpid())
+    for i, handler in enumerate(_state.handlers):
+        if isinstance(handler, RotatingFileHandler):
+            own = RotatingFileHandler(worker_log_path(handler.baseFilename, worker), maxBytes=handler.maxBytes,
+                                      backupCount=handler.backupCount, encoding='utf-8')
+            own.setFormatter(handler.formatter)
+            own.setLevel(handler.level)
+            handler.close()
+            _state.handlers[i] = own
+    log_queue: queue.Queue = queue.Queue(maxsize=_state.queue_size)
+    _state.queue_handler.queue = log_queue
+    _state.queue_handler._lock = threading.Lock()
+    _state.listener = QueueListener(log_queue, *_state.handlers, respect_handler_level=True)
+    _state.listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
+atexit.register(shutdown_logging)
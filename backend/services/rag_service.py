@@ -3,35 +3,115 @@ RAG (Retrieval-Augmented Generation) service for retrieving relevant travel info
 """
 import os
 import json
-import re
-from typing import Dict, List, Any, Optional
+import time
+import bisect
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Any, Optional, Set, Tuple
 from pathlib import Path
+from .text_utils import normalize, tokenize
+from .bm25_index import BM25Index
+from .vector_index import Embedder, HashingEmbedder, VectorIndex
+from .tracing import span
+
+# Item fields that get their own exact-value index (see RAGService.lookup)
+INDEXED_FIELDS = ('city', 'airport', 'airline', 'country', 'amenities')
+
+# Retrieval modes: literal phrase match with fallback, BM25-ranked, or embedding similarity
+SEARCH_MODES = ('keyword', 'bm25', 'vector')
+
+
+@dataclass
+class _DataStore:
+    """Items of one data type plus their precomputed search structures."""
+    items: List[Dict] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    postings: Dict[str, List[int]] = field(default_factory=dict)
+    vocabulary: List[str] = field(default_factory=list)
+    fields: Dict[str, Dict[str, List[int]]] = field(default_factory=dict)
+    key_positions: Dict[Hashable, int] = field(default_factory=dict)
+    text_hashes: Dict[Hashable, int] = field(default_factory=dict)
+    bm25: Optional[BM25Index] = None
+    vectors: Optional[VectorIndex] = None
+    mtime: Optional[float] = None
+    checked_at: float = 0.0
+
+
+def _collect_fields(value: Any, out: Dict[str, Set[str]], key: Optional[str] = None) -> None:
+    """Walk a nested item and gather the normalized values of INDEXED_FIELDS."""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _collect_fields(v, out, k)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_fields(v, out, key)
+    elif key in INDEXED_FIELDS and isinstance(value, str):
+        out.setdefault(key, set()).add(normalize(value))
+
+
+def _leaf_tokens(value: Any, out: List[str]) -> List[str]:
+    """Tokens of every scalar value in a nested item (keys are not indexed)."""
+    if isinstance(value, dict):
+        for v in value.values():
+            _leaf_tokens(v, out)
+    elif isinstance(value, list):
+        for v in value:
+            _leaf_tokens(v, out)
+    elif value is not None:
+        out.extend(tokenize(str(value)))
+    return out
+
 
 class RAGService:
     """Service for retrieving relevant travel information using RAG."""
-    
-    def __init__(self):
-        """Initialize the RAG service with data directory path."""
+
+    def __init__(self, reload_interval: Optional[float] = None, mode: Optional[str] = None,
+                 embedder: Optional[Embedder] = None, vector_lists: Optional[int] = None):
+        """
+        Initialize the RAG service with data directory path.
+
+        Args:
+            reload_interval: Minimum seconds between data file mtime checks
+                (defaults to the RAG_RELOAD_INTERVAL env variable, or 2 seconds)
+            mode: One of SEARCH_MODES (defaults to the RAG_MODE env variable, or 'keyword')
+            embedder: Local embedder for 'vector' mode (defaults to HashingEmbedder)
+            vector_lists: IVF partitions for new vector indexes (defaults to the
+                RAG_VECTOR_LISTS env variable, or 0 for exhaustive search)
+        """
         self.data_dir = os.path.join(os.path.dirname(__file__), '../data')
         self.data_files = {
             'flights': os.path.join(self.data_dir, 'flights.json'),
             'hotels': os.path.join(self.data_dir, 'hotels.json'),
             'vacations': os.path.join(self.data_dir, 'vacations.json'),
         }
-    
+        if reload_interval is None:
+            reload_interval = float(os.getenv("RAG_RELOAD_INTERVAL", "2"))
+        self.reload_interval = reload_interval
+        self.mode = mode or os.getenv("RAG_MODE", "keyword")
+        if self.mode not in SEARCH_MODES:
+            raise ValueError(f"Invalid RAG mode: {self.mode}")
+        self.vector_dir = os.path.join(self.data_dir, 'index')
+        self.embedder = embedder or HashingEmbedder()
+        if vector_lists is None:
+            vector_lists = int(os.getenv("RAG_VECTOR_LISTS", "0"))
+        self.vector_lists = vector_lists
+        self.vector_min_score = float(os.getenv("RAG_VECTOR_MIN_SCORE", "0.15"))
+        self._stores: Dict[str, _DataStore] = {}
+        self._lock = threading.Lock()
+
     def _load_data(self, data_type: str) -> List[Dict]:
         """
         Load data from a JSON file.
-        
+
         Args:
             data_type: Type of data to load ('flights', 'hotels', or 'vacations')
-            
+
         Returns:
             List of data items
         """
         if data_type not in self.data_files:
             raise ValueError(f"Invalid data type: {data_type}")
-            
+
         try:
             with open(self.data_files[data_type], 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -40,80 +120,288 @@ class RAGService:
             return []
         except json.JSONDecodeError:
             return []
-    
+
+    def _file_mtime(self, data_type: str) -> Optional[float]:
+        try:
+            return os.stat(self.data_files[data_type]).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _build_store(self, data_type: str, mtime: Optional[float],
+                     previous: Optional[_DataStore] = None) -> _DataStore:
+        """Load a data file and precompute searchable text and inverted indexes."""
+        store = _DataStore(items=self._load_data(data_type), mtime=mtime)
+        postings: Dict[str, Set[int]] = {}
+        for i, item in enumerate(store.items):
+            text = normalize(json.dumps(item, ensure_ascii=False))
+            store.texts.append(text)
+            key = item.get('id', i) if isinstance(item, dict) else i
+            if key in store.key_positions:
+                key = (key, i)
+            store.key_positions[key] = i
+            store.text_hashes[key] = hash(text)
+            for token in set(tokenize(text)):
+                postings.setdefault(token, set()).add(i)
+            values: Dict[str, Set[str]] = {}
+            _collect_fields(item, values)
+            for field_name, field_values in values.items():
+                index = store.fields.setdefault(field_name, {})
+                for v in field_values:
+                    index.setdefault(v, []).append(i)
+        store.postings = {token: sorted(ids) for token, ids in postings.items()}
+        store.vocabulary = sorted(store.postings)
+        if self.mode == 'bm25':
+            self._update_bm25(store, previous)
+        return store
+
+    def _update_bm25(self, store: _DataStore, previous: Optional[_DataStore]) -> None:
+        """Carry the BM25 index over from the previous load, re-indexing only changed items."""
+        if previous is None or previous.bm25 is None:
+            store.bm25 = BM25Index()
+            old_hashes: Dict[Hashable, int] = {}
+        else:
+            # Searches may still be running against the previous store
+            store.bm25 = previous.bm25.copy()
+            old_hashes = previous.text_hashes
+        for key in old_hashes.keys() - store.text_hashes.keys():
+            store.bm25.remove(key)
+        for key, text_hash in store.text_hashes.items():
+            if old_hashes.get(key) != text_hash:
+                store.bm25.add(key, _leaf_tokens(store.items[store.key_positions[key]], []))
+
+    def build_vector_index(self, data_type: str) -> VectorIndex:
+        """
+        Embed all items of a data type and persist the index under `vector_dir`.
+
+        Args:
+            data_type: Type of data to index ('flights', 'hotels', or 'vacations')
+
+        Returns:
+            The freshly built index
+        """
+        store = self._get_store(data_type)
+        keys = sorted(store.key_positions, key=store.key_positions.get)
+        texts = [' '.join(_leaf_tokens(store.items[store.key_positions[k]], [])) for k in keys]
+        index = VectorIndex.build(keys, texts, self.embedder, self.vector_lists,
+                                  source={'mtime': store.mtime, 'count': len(keys)})
+        index.save(self.vector_dir, data_type)
+        # Serve from the mapped file so the matrix lives in the shared page cache
+        store.vectors = VectorIndex.load(self.vector_dir, data_type) or index
+        return store.vectors
+
+    def _get_vector_index(self, data_type: str, store: _DataStore) -> VectorIndex:
+        """Memory-map the persisted index if it matches the loaded data, else rebuild it."""
+        if store.vectors is None:
+            index = VectorIndex.load(self.vector_dir, data_type)
+            if (index is not None and index.embedder_name == self.embedder.name
+                    and index.source == {'mtime': store.mtime, 'count': len(store.items)}):
+                store.vectors = index
+            else:
+                store.vectors = self.build_vector_index(data_type)
+        return store.vectors
+
+    def _get_store(self, data_type: str) -> _DataStore:
+        """Return the in-memory store for a data type, reloading it if the file changed."""
+        if data_type not in self.data_files:
+            raise ValueError(f"Invalid data type: {data_type}")
+        store = self._stores.get(data_type)
+        now = time.monotonic()
+        if store is not None and now - store.checked_at < self.reload_interval:
+            return store
+        with self._lock:
+            store = self._stores.get(data_type)
+            mtime = self._file_mtime(data_type)
+            if store is None or store.mtime != mtime:
+                store = self._build_store(data_type, mtime, previous=store)
+                self._stores[data_type] = store
+            store.checked_at = now
+            return store
+
+    def preload(self) -> None:
+        """Build the indexes for every data type up front (e.g. before forking workers)."""
+        for data_type in self.data_files:
+            store = self._get_store(data_type)
+            if self.mode == 'vector':
+                self._get_vector_index(data_type, store)
+
+    def _postings_for(self, store: _DataStore, token: str, match: str) -> Set[int]:
+        """
+        Item ids containing a token that equals `token` ('whole'), starts with it
+        ('prefix'), ends with it ('suffix') or contains it ('infix').
+        """
+        if match == 'whole':
+            return set(store.postings.get(token, ()))
+        ids: Set[int] = set()
+        if match == 'prefix':
+            start = bisect.bisect_left(store.vocabulary, token)
+            for vocab_token in store.vocabulary[start:]:
+                if not vocab_token.startswith(token):
+                    break
+                ids.update(store.postings[vocab_token])
+            return ids
+        for vocab_token in store.vocabulary:
+            if vocab_token.endswith(token) if match == 'suffix' else token in vocab_token:
+                ids.update(store.postings[vocab_token])
+        return ids
+
+    def lookup(self, data_type: str, field_name: str, value: str) -> List[Dict]:
+        """
+        Exact-value lookup on one of the indexed fields.
+
+        Args:
+            data_type: Type of data to search in ('flights', 'hotels', or 'vacations')
+            field_name: One of INDEXED_FIELDS, e.g. 'city' or 'airport'
+            value: Field value to match (case and accent insensitive)
+
+        Returns:
+            List of items having that value anywhere in the field
+        """
+        store = self._get_store(data_type)
+        ids = store.fields.get(field_name, {}).get(normalize(value), [])
+        return [store.items[i] for i in ids]
+
+    def search_scored(self, query: str, data_type: str, max_results: int = 3) -> List[Tuple[Dict, float]]:
+        """
+        Rank items of a data type against the query.
+
+        Uses embedding similarity in 'vector' mode and BM25 otherwise.
+
+        Args:
+            query: Search query
+            data_type: Type of data to search in ('flights', 'hotels', or 'vacations')
+            max_results: Maximum number of results to return
+
+        Returns:
+            List of (item, score) pairs, best first; empty if nothing matches
+        """
+        if not query or not query.strip():
+            return []
+
+        store = self._get_store(data_type)
+        if self.mode == 'vector':
+            index = self._get_vector_index(data_type, store)
+            query_vector = self.embedder.embed([query])[0]
+            return [
+                (store.items[store.key_positions[key]], round(score, 4))
+                for key, score in index.search(query_vector, max_results)
+                if score >= self.vector_min_score and key in store.key_positions
+            ]
+        if store.bm25 is None:
+            with self._lock:
+                if store.bm25 is None:
+                    self._update_bm25(store, None)
+        return [
+            (store.items[store.key_positions[key]], round(score, 4))
+            for key, score in store.bm25.search(tokenize(query), max_results)
+        ]
+
     def search_data(self, query: str, data_type: str, max_results: int = 3) -> List[Dict]:
         """
         Search for relevant items in a specific data type.
-        
+
+        In 'keyword' mode items containing the query as a case- and
+        accent-insensitive substring are returned, as with a full scan;
+        candidates come from the inverted token index and are then checked
+        for the whole query phrase. In 'bm25' and 'vector' modes items are ranked with
+        `search_scored` and no fallback items are returned when nothing matches.
+
         Args:
             query: Search query
             data_type: Type of data to search in ('flights', 'hotels', or 'vacations')
             max_results: Maximum number of results to return
-            
+
         Returns:
             List of matching items
         """
         if not query or not query.strip():
             return []
-            
-        items = self._load_data(data_type)
-        if not items:
+
+        if self.mode != 'keyword':
+            return [item for item, _ in self.search_scored(query, data_type, max_results)]
+
+        store = self._get_store(data_type)
+        if not store.items:
             return []
-            
-        # Simple case-insensitive search in stringified item
-        pattern = re.compile(re.escape(query), re.IGNORECASE)
-        matches = [item for item in items if pattern.search(json.dumps(item))]
-        
+
+        phrase = normalize(query.strip())
+        tokens = tokenize(phrase)
+        if tokens:
+            # The phrase may start and end inside a token, so only its inner tokens are whole
+            # words: the last one is a prefix, the first a suffix, and a single token any part
+            if len(tokens) == 1:
+                lookups = [(tokens[0], 'infix')]
+            else:
+                lookups = [(token, 'whole') for token in tokens[1:-1]]
+                lookups += [(tokens[-1], 'prefix'), (tokens[0], 'suffix')]
+            candidates: Optional[Set[int]] = None
+            # Cheapest lookups first, stopping as soon as nothing can match
+            for token, match in lookups:
+                ids = self._postings_for(store, token, match)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            candidate_ids = sorted(candidates or ())
+        else:
+            candidate_ids = range(len(store.items))
+
+        matches = []
+        for i in candidate_ids:
+            if phrase in store.texts[i]:
+                matches.append(store.items[i])
+                if len(matches) >= max_results:
+                    break
+
         # If no matches found, return first N items as fallback
         if not matches:
-            return items[:max_results]
-            
-        return matches[:max_results]
-    
+            return store.items[:max_results]
+
+        return matches
+
     def get_context(self, query: str, max_results: int = 2) -> Dict[str, Any]:
         """
         Retrieve relevant context from all data sources.
-        
+
         Args:
             query: User query
             max_results: Maximum number of results per data type
-            
+
         Returns:
             Dict containing context from different data sources
         """
         context = {}
-        
-        for data_type in self.data_files.keys():
-            matches = self.search_data(query, data_type, max_results)
-            if matches:
-                context[data_type] = matches
-        
+
+        with span('rag.get_context', mode=self.mode):
+            for data_type in self.data_files.keys():
+                matches = self.search_data(query, data_type, max_results)
+                if matches:
+                    context[data_type] = matches
+
         return context
-    
+
     def format_context(self, context: Dict[str, Any]) -> str:
         """
         Format context into a readable string.
-        
+
         Args:
             context: Context dictionary from get_context()
-            
+
         Returns:
             Formatted context string
         """
         if not context:
             return "No relevant information found."
-            
+
         formatted = []
-        
+
         for data_type, items in context.items():
             if not items:
                 continue
-                
+
             formatted.append(f"=== {data_type.upper()} ===")
-            
+
             for i, item in enumerate(items, 1):
                 formatted.append(f"{i}. {json.dumps(item, indent=2, ensure_ascii=False)}")
-            
+
             formatted.append("\n")
-        
+
         return "\n".join(formatted).strip()
@@ -0,0 +1,512 @@
+"""
+Client-side rate limiting and quota-aware scheduling of metered upstream searches.
+
+SerpApi bills every search and enforces an hourly throughput limit, so
+searches are dispatched through a `SearchScheduler`:
+
+- a token bucket bounds the sustained rate and burst, and a fixed-window
+  quota bounds the searches per period (e.g. the plan's hourly limit);
+- queued searches are ordered by priority (interactive before background
+  prefetch) and, within a priority, by a per-user virtual time, so one
+  busy user cannot starve the others;
+- identical searches that are already queued or running share one
+  upstream call, which is dropped (or cancelled if already running) once
+  every caller waiting on it has been cancelled;
+- a search that cannot be dispatched within its wait budget, or after the
+  quota is spent, raises `RateLimitedError` so the caller can answer from
+  cache or with a degraded result instead of an upstream 429.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import httpx
+
+from .cache_backend import get_shared_cache
+from .tracing import metrics
+from .upstream import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+metrics.describe('scheduler_requests_total', "Scheduled upstream searches by scheduler and outcome")
+metrics.describe('upstream_quota_remaining', "Searches left in the current quota window")
+metrics.describe('upstream_tokens_available', "Tokens currently in the rate limiter bucket")
+metrics.describe('scheduler_queue_depth', "Searches waiting for a rate limiter token")
+
+
+class RateLimitedError(Exception):
+    """The search could not be dispatched within its wait budget or quota."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"{reason}; retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self._paused_until:
+            start = max(self._updated, self._paused_until)
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until or self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def time_until(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` tokens (beyond those available now) could be taken."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            pause = max(0.0, self._paused_until - now)
+            missing = tokens - self._tokens
+            return pause + (missing / self.rate if missing > 0 else 0.0)
+
+    def refund(self) -> None:
+        """Return a token taken for a search that was never sent."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (after an upstream 429) and drain the bucket."""
+        with self._lock:
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class QuotaWindow:
+    """
+    Fixed-window quota: at most `limit` uses per `period` seconds (0 = unlimited).
+
+    With a `shared` cache backend the count lives in an atomic counter
+    there, so all worker processes draw from one quota; otherwise (or if
+    the backend cannot count) it is kept per process. Code on the event
+    loop uses the async methods, which reach the backend without blocking.
+    """
+
+    def __init__(self, limit: int, period: float, shared=None, key: str = 'quota'):
+        self.limit = limit
+        self.period = period
+        self.shared = shared
+        self.key = key
+        self._window = self._current()
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def _current(self) -> int:
+        return int(time.time() // self.period) if self.period else 0
+
+    def _roll(self) -> None:
+        window = self._current()
+        if window != self._window:
+            self._window, self.used = window, 0
+
+    def _shared_key(self) -> str:
+        return f"{self.key}:{self._window}"
+
+    def _sync_shared(self) -> None:
+        if self.shared is not None:
+            value = self.shared.get(self._shared_key())
+            if value is not None:
+                self.used = int(value)
+
+    @property
+    def remaining(self) -> float:
+        if not self.limit:
+            return float('inf')
+        with self._lock:
+            self._roll()
+            self._sync_shared()
+            return max(0, self.limit - self.used)
+
+    def reset_in(self) -> float:
+        return (self._window + 1) * self.period - time.time() if self.period else 0.0
+
+    async def aremaining(self) -> float:
+        if not self.limit:
+            return float('inf')
+        with self._lock:
+            self._roll()
+            key = self._shared_key()
+        if self.shared is not None:
+            value = await self.shared.aget(key)
+            if value is not None:
+                self.used = int(value)
+        return max(0, self.limit - self.used)
+
+    def _take_local(self) -> bool:
+        if self.limit and self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+    def take(self) -> bool:
+        with self._lock:
+            self._roll()
+            if self.limit and self.shared is not None:
+                # Expire the counter a little after its window so late readers still see it
+                total = self.shared.incr(self._shared_key(), 1, self.reset_in() + 60)
+                if total is not None:
+                    self.used = total
+                    return total <= self.limit
+            return self._take_local()
+
+    async def atake(self) -> bool:
+        with self._lock:
+            self._roll()
+            key = self._shared_key()
+        if self.limit and self.shared is not None:
+            total = await self.shared.aincr(key, 1, self.reset_in() + 60)
+            if total is not None:
+                self.used = total
+                return total <= self.limit
+        with self._lock:
+            return self._take_local()
+
+    async def arefund(self) -> None:
+        """Return a unit taken for a search that was never sent."""
+        if not self.limit:
+            return
+        with self._lock:
+            self._roll()
+            key = self._shared_key()
+        if self.shared is not None:
+            total = await self.shared.aincr(key, -1, self.reset_in() + 60)
+            if total is not None:
+                self.used = total
+                return
+        with self._lock:
+            self.used = max(0, self.used - 1)
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    vtime: float
+    seq: int
+    key: Hashable = field(compare=False)
+    fetch: Callable[[], Awaitable[Any]] = field(compare=False)
+    user: str = field(compare=False)
+    deadline: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    queued: bool = field(default=True, compare=False)
+    waiters: int = field(default=0, compare=False)
+    task: Optional[asyncio.Task] = field(default=None, compare=False)
+
+
+class SearchScheduler:
+    """Rate-limited, fair, coalescing dispatcher for upstream searches (see module docstring)."""
+
+    def __init__(self, name: str, rate: float, burst: float, quota: int = 0, quota_period: float = 3600.0,
+                 max_wait: float = 10.0, background_max_wait: float = 300.0, shared=None):
+        """
+        Args:
+            name: Label used in metrics
+            rate: Sustained searches per second
+            burst: Searches that may be sent back to back after an idle period
+            quota: Searches allowed per `quota_period` (0 for no quota)
+            quota_period: Quota window in seconds
+            max_wait: Longest an interactive search may queue before it is degraded
+            background_max_wait: Longest a background search may queue
+            shared: Cache backend holding the quota counter for all worker processes
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.quota = QuotaWindow(quota, quota_period, shared=shared, key=f"quota:{name}")
+        self.max_wait = max_wait
+        self.background_max_wait = background_max_wait
+        self._heap: List[_Job] = []
+        self._jobs: Dict[Hashable, _Job] = {}
+        self._user_vtime: Dict[str, float] = {}
+        self._vtime = 0.0
+        self._seq = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _count(self, outcome: str) -> None:
+        metrics.inc('scheduler_requests_total', scheduler=self.name, outcome=outcome)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for job in self._heap if job.queued)
+
+    def estimate_wait(self, priority: int) -> float:
+        """Seconds until a new search at `priority` would get a token."""
+        ahead = sum(1 for job in self._heap if job.queued and job.priority <= priority)
+        return self.bucket.time_until(ahead + 1)
+
+    async def submit(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], user: Optional[str] = None,
+                     priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None) -> Any:
+        """
+        Run `fetch` once a token is available and return its result.
+
+        Args:
+            key: Identity of the search; identical queued or running searches share one call
+            fetch: Zero-argument coroutine function performing the upstream call
+            user: Fairness key (e.g. the chat session id)
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND (lower runs first)
+            max_wait: Queueing budget in seconds (defaults by priority)
+
+        Raises:
+            RateLimitedError: The quota is spent or the search would wait longer than `max_wait`
+        """
+        if max_wait is None:
+            max_wait = self.max_wait if priority <= PRIORITY_INTERACTIVE else self.background_max_wait
+        job = self._jobs.get(key)
+        if job is not None:
+            self._count('coalesced')
+            self.promote(key, priority, max_wait)
+            return await self._wait(key, job.future)
+        if await self.quota.aremaining() <= 0:
+            self._count('quota_exhausted')
+            raise RateLimitedError(f"{self.name} search quota exhausted", self.quota.reset_in())
+        wait = self.estimate_wait(priority)
+        if wait > max_wait:
+            self._count('rejected')
+            raise RateLimitedError(f"{self.name} search rate limit reached", wait)
+        future = asyncio.get_running_loop().create_future()
+        job = self._push(key, fetch, user or 'anonymous', priority, time.monotonic() + max_wait, future)
+        self._count('queued')
+        self._ensure_dispatcher()
+        return await self._wait(key, future)
+
+    async def _wait(self, key: Hashable, future: asyncio.Future) -> Any:
+        """Await a search shared by several callers; the last one to be cancelled abandons it."""
+        self._jobs[key].waiters += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            job = self._jobs.get(key)
+            if job is not None and job.future is future:
+                job.waiters -= 1
+                if not job.waiters and not future.done():
+                    self._abandon(job)
+
+    def _abandon(self, job: _Job) -> None:
+        """Drop a queued search nobody waits for any more, or cancel its running upstream call."""
+        self._count('abandoned')
+        self._jobs.pop(job.key, None)
+        if job.queued:
+            job.queued = False
+            job.future.cancel()
+        elif job.task is not None:
+            job.task.cancel()
+
+    def promote(self, key: Hashable, priority: int, max_wait: Optional[float] = None) -> None:
+        """Raise the priority of a queued search that a more urgent caller now waits on."""
+        job = self._jobs.get(key)
+        if job is None or not job.queued or priority >= job.priority:
+            return
+        if max_wait is None:
+            max_wait = self.max_wait if priority <= PRIORITY_INTERACTIVE else self.background_max_wait
+        job.queued = False
+        promoted = self._push(key, job.fetch, job.user, priority, max(job.deadline, time.monotonic() + max_wait),
+                              job.future)
+        promoted.waiters = job.waiters
+
+    def _push(self, key: Hashable, fetch, user: str, priority: int, deadline: float, future) -> _Job:
+        # Weighted fair queueing: each user's searches are spaced one virtual unit apart
+        vtime = max(self._vtime, self._user_vtime.get(user, 0.0)) + 1.0
+        self._user_vtime[user] = vtime
+        self._seq += 1
+        job = _Job(priority, vtime, self._seq, key, fetch, user, deadline, future)
+        heapq.heappush(self._heap, job)
+        self._jobs[key] = job
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+        else:
+            self._wakeup.set()
+
+    def _next_job(self) -> Optional[_Job]:
+        while self._heap and not self._heap[0].queued:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def _fail(self, job: _Job, error: Exception) -> None:
+        job.queued = False
+        self._jobs.pop(job.key, None)
+        if not job.future.done():
+            job.future.set_exception(error)
+            # Mark retrieved so an unawaited failure is not logged as lost
+            job.future.exception()
+
+    async def _dispatch(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            now = time.monotonic()
+            if now > job.deadline:
+                heapq.heappop(self._heap)
+                self._count('expired')
+                self._fail(job, RateLimitedError(f"{self.name} search waited too long", self.bucket.time_until()))
+                continue
+            wait = self.bucket.time_until()
+            if wait > 0:
+                # Wake early if a higher-priority search arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(wait, job.deadline - now))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if not self.bucket.try_acquire():
+                continue
+            if not await self.quota.atake():
+                self._count('quota_exhausted')
+                for queued in [j for j in self._heap if j.queued]:
+                    self._fail(queued, RateLimitedError(f"{self.name} search quota exhausted", self.quota.reset_in()))
+                self._heap.clear()
+                return
+            heapq.heappop(self._heap)
+            job.queued = False
+            self._vtime = max(self._vtime, job.vtime)
+            # Users at or behind the virtual clock start from it anyway; forget them
+            # so one-off session ids don't accumulate
+            self._user_vtime = {user: v for user, v in self._user_vtime.items() if v > self._vtime}
+            self._count('dispatched')
+            # Referenced from the job (held in _jobs) so the task is not garbage collected
+            job.task = asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job: _Job) -> None:
+        try:
+            result = await job.fetch()
+        except CircuitOpenError as e:
+            # Failed fast without contacting the upstream: the search is not metered
+            self.bucket.refund()
+            await self.quota.arefund()
+            self._fail(job, e)
+        except Exception as e:
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+                retry_after = e.response.headers.get('retry-after')
+                self.bucket.pause(float(retry_after) if retry_after and retry_after.isdigit() else 1 / self.bucket.rate)
+                logger.warning("%s returned 429; pausing searches", self.name)
+            self._fail(job, e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            if not job.future.done():
+                # Cancelled after every caller gave up
+                job.future.cancel()
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+
+    def try_acquire(self) -> bool:
+        """Non-queueing check for synchronous callers: take a token and quota unit if both are available."""
+        if self.quota.remaining <= 0 or not self.bucket.try_acquire() or not self.quota.take():
+            self._count('rejected')
+            return False
+        self._count('dispatched')
+        return True
+
+    async def atry_acquire(self) -> bool:
+        """
+        Async `try_acquire`, used to charge extra requests of a running search
+        (upstream retries and hedges) to the same rate and quota.
+        """
+        if await self.quota.aremaining() <= 0 or not self.bucket.try_acquire():
+            self._count('rejected')
+            return False
+        if not await self.quota.atake():
+            self.bucket.refund()
+            self._count('rejected')
+            return False
+        self._count('dispatched')
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        remaining = self.quota.remaining
+        return {
+            'rate_per_second': self.bucket.rate,
+            'burst': self.bucket.burst,
+            'tokens_available': round(self.bucket.tokens, 2),
+            'quota_limit': self.quota.limit or None,
+            'quota_used': self.quota.used,
+            'quota_remaining': None if remaining == float('inf') else remaining,
+            'quota_resets_in_seconds': round(self.quota.reset_in(), 1) if self.quota.limit else None,
+            'queue_depth': self.queue_depth,
+            'in_flight_or_queued': len(self._jobs),
+        }
+
+
+_serpapi_scheduler: Optional[SearchScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def worker_count() -> int:
+    """Worker processes sharing this host's upstream budget (WEB_CONCURRENCY, set by serve.py)."""
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    except ValueError:
+        return 1
+
+
+def get_serpapi_scheduler() -> SearchScheduler:
+    """
+    Process-wide scheduler for SerpApi searches, configured from the environment.
+
+    The quota is counted in the shared cache backend, so it holds across
+    workers. The rate and burst are per process and are split evenly
+    between the `worker_count()` workers.
+    """
+    global _serpapi_scheduler
+    if _serpapi_scheduler is None:
+        with _scheduler_lock:
+            if _serpapi_scheduler is None:
+                workers = worker_count()
+                scheduler = SearchScheduler(
+                    'serpapi',
+                    rate=float(os.getenv("SERPAPI_RATE_PER_SECOND", "2")) / workers,
+                    burst=max(1.0, float(os.getenv("SERPAPI_BURST", "10")) / workers),
+                    quota=int(os.getenv("SERPAPI_QUOTA", "0")),
+                    quota_period=float(os.getenv("SERPAPI_QUOTA_PERIOD", "3600")),
+                    max_wait=float(os.getenv("SERPAPI_MAX_QUEUE_WAIT", "10")),
+                    background_max_wait=float(os.getenv("SERPAPI_BACKGROUND_MAX_QUEUE_WAIT", "300")),
+                    shared=get_shared_cache(),
+                )
+                remaining = scheduler.quota
+                metrics.gauge('upstream_quota_remaining',
+                              lambda: remaining.remaining if remaining.limit else -1, upstream='serpapi')
+                metrics.gauge('upstream_tokens_available', lambda: scheduler.bucket.tokens, upstream='serpapi')
+                metrics.gauge('scheduler_queue_depth', lambda: scheduler.queue_depth, upstream='serpapi')
+                _serpapi_scheduler = scheduler
+    return _serpapi_scheduler
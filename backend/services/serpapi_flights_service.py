@@ -1,17 +1,77 @@
 import os
+import json
+import logging
+import httpx
 import requests
 from typing import Optional, Dict, Any
+from .cache import TTLCache
+from .cache_backend import CacheBackend, get_shared_cache
+from .flight_query_schema import FlightQuery
+from .tracing import record_cache, record_upstream, span
+from .upstream import get_upstream
+from .rate_limiter import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimitedError, SearchScheduler,
+                           get_serpapi_scheduler)
+from .session_store import current_session
+
+logger = logging.getLogger(__name__)
 
 class SerpApiFlightsService:
     """
     Service for querying Google Flights data from SerpApi.
     """
     BASE_URL = "https://serpapi.com/search"
+    TIMEOUT = 30
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, shared_cache: Optional[CacheBackend] = None,
+                 scheduler: Optional[SearchScheduler] = None):
         self.api_key = api_key or os.getenv("SERPAPI_KEY")
         if not self.api_key:
             raise ValueError("SerpApi API key must be provided via argument or SERPAPI_KEY env variable.")
+        # Overridable to point at a local stand-in (see benchmarks/fake_upstreams.py)
+        self.base_url = os.getenv("SERPAPI_BASE_URL", self.BASE_URL)
+        # Results keyed on the normalized FlightQuery; shared by all chat sessions
+        self.cache = TTLCache(
+            ttl=float(os.getenv("FLIGHT_CACHE_TTL", "600")),
+            max_entries=int(os.getenv("FLIGHT_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.getenv("FLIGHT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            # Expired results are still served while SerpApi is failing
+            stale_ttl=float(os.getenv("FLIGHT_CACHE_STALE_TTL", "3600")),
+        )
+        self.upstream = get_upstream('serpapi', min_timeout=5.0, max_timeout=self.TIMEOUT)
+        # Rate, quota and fairness for metered searches (see rate_limiter)
+        self.scheduler = scheduler if scheduler is not None else get_serpapi_scheduler()
+        # Cross-worker L2 consulted on local misses (see cache_backend)
+        self.shared_cache = shared_cache if shared_cache is not None else get_shared_cache()
+
+    def _build_params(self,
+                      departure_id: str,
+                      arrival_id: str,
+                      departure_date: str,
+                      gl: Optional[str] = None,
+                      hl: Optional[str] = None,
+                      currency: Optional[str] = None,
+                      **kwargs) -> Dict[str, Any]:
+        """Build the SerpApi google_flights query string parameters."""
+        params = {
+            "engine": "google_flights",
+            "api_key": self.api_key,
+            "departure_id": departure_id,
+            "arrival_id": arrival_id,
+            "outbound_date": departure_date,
+            "output": "json"
+        }
+        if "return_date" in kwargs and kwargs["return_date"]:
+            params["return_date"] = kwargs["return_date"]
+        if "type" in kwargs and kwargs["type"]:
+            params["type"] = kwargs["type"]
+        if gl:
+            params["gl"] = gl
+        if hl:
+            params["hl"] = hl
+        if currency:
+            params["currency"] = currency
+        params.update(kwargs)
+        return params
 
     def search_flights(self,
                        departure_id: str,
@@ -37,31 +97,207 @@ class SerpApiFlightsService:
             requests.HTTPError: For HTTP errors.
             ValueError: For missing API key.
         """
-        params = {
-            "engine": "google_flights",
-            "api_key": self.api_key,
-            "departure_id": departure_id,
-            "arrival_id": arrival_id,
-            "outbound_date": departure_date,
-            "output": "json"
-        }
-        if "return_date" in kwargs and kwargs["return_date"]:
-            params["return_date"] = kwargs["return_date"]
-        if "type" in kwargs and kwargs["type"]:
-            params["type"] = kwargs["type"]
-        if gl:
-            params["gl"] = gl
-        if hl:
-            params["hl"] = hl
-        if currency:
-            params["currency"] = currency
-        params.update(kwargs)
+        params = self._build_params(departure_id, arrival_id, departure_date, gl, hl, currency, **kwargs)
 
-        response = requests.get(self.BASE_URL, params=params, timeout=30)
+        with span('http.get', host='serpapi.com') as s:
+            response = requests.get(self.base_url, params=params, timeout=self.TIMEOUT)
+            s.set('status', response.status_code)
+        record_upstream('serpapi.com', response.status_code)
         if not response.ok:
             try:
-                logger.error(f"SerpApi error response: {response.json()}")
+                logger.error("SerpApi error response: %s", response.json())
+            except Exception:
+                logger.error("SerpApi error response (non-JSON): %s", response.text)
+            response.raise_for_status()
+        return response.json()
+
+    async def asearch_flights(self,
+                              departure_id: str,
+                              arrival_id: str,
+                              departure_date: str,
+                              gl: Optional[str] = None,
+                              hl: Optional[str] = None,
+                              currency: Optional[str] = None,
+                              **kwargs) -> Dict[str, Any]:
+        """
+        Async variant of `search_flights` using the shared pooled HTTP client.
+
+        Does not block the event loop, so concurrent chat requests can have
+        overlapping SerpApi lookups on reused keep-alive connections. Requests
+        go through the `serpapi` upstream policy (adaptive timeout, retries,
+        circuit breaker); each extra attempt takes a scheduler token and quota unit.
+        Args and return value are the same as `search_flights`.
+        Raises:
+            httpx.HTTPStatusError: For HTTP errors.
+            CircuitOpenError: While the SerpApi circuit breaker is open.
+        """
+        params = self._build_params(departure_id, arrival_id, departure_date, gl, hl, currency, **kwargs)
+
+        # Retries and hedged requests are metered too: charge them to the scheduler
+        response = await self.upstream.get(self.base_url, params=params, budget=self.scheduler.atry_acquire)
+        if response.is_error:
+            try:
+                logger.error("SerpApi error response: %s", response.json())
             except Exception:
-                logger.error(f"SerpApi error response (non-JSON): {response.text}")
+                logger.error("SerpApi error response (non-JSON): %s", response.text)
             response.raise_for_status()
         return response.json()
+
+    @staticmethod
+    def _is_cacheable(result: Dict[str, Any]) -> bool:
+        return isinstance(result, dict) and "error" not in result
+
+    @staticmethod
+    def _degraded(query: FlightQuery, error: RateLimitedError) -> Dict[str, Any]:
+        """Result returned instead of an error when the search budget is spent (never cached)."""
+        return {
+            'error': (f"Live flight search is temporarily unavailable ({error.reason}); "
+                      f"please try again in about {max(1, round(error.retry_after))} seconds."),
+            'degraded': True,
+            'retry_after': round(error.retry_after, 1),
+            'search_parameters': {'departure_id': query.departure_id, 'arrival_id': query.arrival_id,
+                                  'outbound_date': str(query.departure_date)},
+        }
+
+    @staticmethod
+    def _shared_key(query: FlightQuery) -> str:
+        return "flights:" + json.dumps(query.cache_key())
+
+    def search_query(self, query: FlightQuery) -> Dict[str, Any]:
+        """
+        Search flights for a validated query, serving repeats from the result cache.
+
+        Args:
+            query: Validated FlightQuery with airport codes already mapped
+
+        Returns:
+            JSON response from SerpApi as dict (possibly cached)
+        """
+        with span('serpapi.search', route=f"{query.departure_id}-{query.arrival_id}") as s:
+            result, source = self._search_query(query)
+            s.set('cache', source)
+        return result
+
+    def _search_query(self, query: FlightQuery):
+        key = query.cache_key()
+        cached = self.cache.get(key)
+        record_cache('flights', cached is not None)
+        if cached is not None:
+            return cached, 'local'
+        if self.shared_cache is not None:
+            shared = self.shared_cache.get(self._shared_key(query))
+            if shared is not None:
+                result = json.loads(shared)
+                self.cache.set(key, result)
+                return result, 'shared'
+        if not self.scheduler.try_acquire():
+            stale = self.cache.get_stale(key)
+            if stale is not None:
+                return stale, 'stale'
+            error = RateLimitedError("search rate limit reached", self.scheduler.bucket.time_until())
+            return self._degraded(query, error), 'degraded'
+        result = self.search_flights(**query.search_params())
+        if self._is_cacheable(result):
+            self.cache.set(key, result)
+            if self.shared_cache is not None:
+                self.shared_cache.set(self._shared_key(query), json.dumps(result), self.cache.ttl)
+        return result, 'upstream'
+
+    async def asearch_query(self, query: FlightQuery, priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+        """
+        Async variant of `search_query`.
+
+        Concurrent identical misses share a single upstream request, and
+        results fetched by other workers are served from the shared cache.
+        Upstream calls wait for the SerpApi scheduler; when the rate or
+        quota budget is spent the result is a stale cache entry or a
+        degraded result (with `degraded` and `error` keys) rather than an
+        exception.
+
+        Args:
+            query: Validated FlightQuery with airport codes already mapped
+            priority: PRIORITY_INTERACTIVE for user requests, PRIORITY_BACKGROUND for prefetch
+        """
+        with span('serpapi.search', route=f"{query.departure_id}-{query.arrival_id}") as s:
+            source = ['local']
+            key = query.cache_key()
+
+            async def fetch():
+                result, source[0] = await self._afetch_shared(query, priority)
+                return result
+
+            # An interactive caller joining a queued background search promotes it
+            self.scheduler.promote(key, priority)
+            try:
+                result = await self.cache.get_or_fetch(key, fetch, should_cache=self._is_cacheable)
+            except (httpx.HTTPError, RateLimitedError) as e:
+                # Upstream down, circuit open or budget spent: an expired result beats an error
+                result = self.cache.get_stale(key)
+                if result is not None:
+                    source[0] = 'stale'
+                    logger.warning("Serving stale flight results for %s: %s", key, e)
+                elif isinstance(e, RateLimitedError):
+                    source[0] = 'degraded'
+                    result = self._degraded(query, e)
+                else:
+                    raise
+            # 'local' also covers waiting on an identical in-flight request
+            s.set('cache', source[0])
+        record_cache('flights', source[0] == 'local')
+        return result
+
+    async def aadopt_shared(self, query: FlightQuery, min_ttl: float) -> bool:
+        """
+        Copy a search from the shared cache into the local one if it stays fresh for `min_ttl` seconds.
+
+        Lets a worker pick up a result another worker just refreshed instead of
+        fetching it again.
+
+        Returns:
+            True if the local cache now holds the shared entry
+        """
+        if self.shared_cache is None:
+            return False
+        entry = await self.shared_cache.aget_with_ttl(self._shared_key(query))
+        if entry is None or entry[1] < min_ttl:
+            return False
+        self.cache.set(query.cache_key(), json.loads(entry[0]), ttl=entry[1])
+        return True
+
+    async def arefresh_query(self, query: FlightQuery, priority: int = PRIORITY_BACKGROUND) -> bool:
+        """
+        Re-fetch a search from SerpApi, bypassing the caches, and store the result in them.
+
+        Returns:
+            True if a cacheable result was stored
+        """
+        with span('serpapi.refresh', route=f"{query.departure_id}-{query.arrival_id}"):
+            result = await self._afetch_upstream(query, priority)
+        if not self._is_cacheable(result):
+            return False
+        self.cache.set(query.cache_key(), result)
+        if self.shared_cache is not None:
+            await self.shared_cache.aset(self._shared_key(query), json.dumps(result), self.cache.ttl)
+        return True
+
+    async def _afetch_upstream(self, query: FlightQuery, priority: int) -> Dict[str, Any]:
+        session = current_session.get()
+        return await self.scheduler.submit(
+            query.cache_key(),
+            lambda: self.asearch_flights(**query.search_params()),
+            user=session.session_id if session is not None else None,
+            priority=priority,
+        )
+
+    async def _afetch_shared(self, query: FlightQuery, priority: int = PRIORITY_INTERACTIVE):
+        """Local-miss path: shared cache first, then SerpApi (storing the result for other workers)."""
+        if self.shared_cache is None:
+            return await self._afetch_upstream(query, priority), 'upstream'
+        key = self._shared_key(query)
+        shared = await self.shared_cache.aget(key)
+        if shared is not None:
+            return json.loads(shared), 'shared'
+        result = await self._afetch_upstream(query, priority)
+        if self._is_cacheable(result):
+            await self.shared_cache.aset(key, json.dumps(result), self.cache.ttl)
+        return result, 'upstream'
@@ -0,0 +1,148 @@
+"""
+Server-side conversation state, keyed by session id.
+"""
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting."""
+    return max(1, len(text) // 4) if text else 0
+
+
+@dataclass
+class Turn:
+    role: str  # 'user' or 'assistant'
+    content: str
+    tokens: int
+
+
+@dataclass
+class Session:
+    """State kept for one conversation."""
+    session_id: str
+    turns: List[Turn] = field(default_factory=list)
+    # Extractive summary of turns that no longer fit the token budget
+    summary: List[str] = field(default_factory=list)
+    # Last flight search (a FlightQuery) and the cache key of its results
+    last_query: Any = None
+    last_result_key: Optional[Tuple] = None
+    updated_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def tokens(self) -> int:
+        return sum(t.tokens for t in self.turns) + sum(estimate_tokens(line) for line in self.summary)
+
+    def history(self) -> str:
+        """Render the summary and recent turns for the agent prompt."""
+        lines = []
+        if self.summary:
+            lines.append("Earlier in this conversation: " + " ".join(self.summary))
+        lines.extend(f"{'User' if t.role == 'user' else 'Assistant'}: {t.content}" for t in self.turns)
+        return "\n".join(lines)
+
+
+# Session of the message currently being processed (read by agent tools)
+current_session: ContextVar[Optional[Session]] = ContextVar('current_session', default=None)
+
+
+class SessionStore:
+    """
+    LRU store of conversation sessions with a per-session token budget.
+
+    When a session exceeds its budget, the oldest turns beyond the most
+    recent `keep_turns` are folded into a rolling extractive summary (the
+    first sentence of each turn), which is itself trimmed to a third of the
+    budget. Idle sessions expire after `ttl` seconds.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None, token_budget: Optional[int] = None,
+                 keep_turns: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            max_sessions: Sessions kept before LRU eviction (SESSION_MAX_SESSIONS, default 1000)
+            token_budget: Approximate tokens of history per session (SESSION_TOKEN_BUDGET, default 1500)
+            keep_turns: Recent turns never summarized (SESSION_KEEP_TURNS, default 4)
+            ttl: Idle seconds before a session expires (SESSION_TTL, default 3600)
+        """
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+        self.token_budget = token_budget or int(os.getenv("SESSION_TOKEN_BUDGET", "1500"))
+        self.keep_turns = keep_turns or int(os.getenv("SESSION_KEEP_TURNS", "4"))
+        self.ttl = ttl or float(os.getenv("SESSION_TTL", "3600"))
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.summarized_turns = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """Return a live session and mark it most recently used."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.monotonic() - session.updated_at > self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """Return the session for `session_id`, creating it (with a new id if none is given)."""
+        session = self.get(session_id) if session_id else None
+        if session is not None:
+            return session
+        session = Session(session_id=session_id or uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def add_turn(self, session: Session, role: str, content: str) -> None:
+        """Append a turn and summarize older turns if the session is over budget."""
+        session.turns.append(Turn(role, content, estimate_tokens(content)))
+        session.updated_at = time.monotonic()
+        if session.tokens > self.token_budget:
+            self._summarize(session)
+
+    def remember_search(self, session: Session, query: Any, result_key: Optional[Tuple] = None) -> None:
+        """Record the last flight search so follow-ups can refine it."""
+        session.last_query = query
+        session.last_result_key = result_key if result_key is not None else query.cache_key()
+
+    def _summarize(self, session: Session) -> None:
+        while len(session.turns) > self.keep_turns and session.tokens > self.token_budget:
+            turn = session.turns.pop(0)
+            first = _SENTENCE_RE.split(turn.content.strip(), maxsplit=1)[0]
+            if len(first) > 160:
+                first = first[:157] + "..."
+            session.summary.append(f"{'User' if turn.role == 'user' else 'Assistant'}: {first}")
+            self.summarized_turns += 1
+        # Keep the most recent summary lines within a third of the budget
+        while len(session.summary) > 1 and sum(estimate_tokens(s) for s in session.summary) > self.token_budget // 3:
+            session.summary.pop(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return occupancy and counters."""
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'evictions': self.evictions,
+            'summarized_turns': self.summarized_turns,
+        }
@@ -0,0 +1,71 @@
+"""
+Startup timing and readiness tracking.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Per-component startup timings and the process readiness flag.
+
+    Liveness only needs the web app to be importable; readiness waits until
+    every warm-up phase (imports, LLM client, agent, indexes) has completed.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.ready_at: Optional[float] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def record(self, name: str, seconds: float, status: str = 'ok') -> None:
+        with self._lock:
+            self.phases.append({'name': name, 'seconds': round(seconds, 4), 'status': status})
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a startup phase; failures are recorded and re-raised."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.record(name, time.perf_counter() - started, status='failed')
+            self.error = f"{name}: {e}"
+            raise
+        self.record(name, time.perf_counter() - started)
+
+    def mark_ready(self) -> None:
+        if self._ready.is_set():
+            return
+        self.ready_at = time.perf_counter()
+        self._ready.set()
+        breakdown = ", ".join(f"{p['name']}={p['seconds']:.3f}s" for p in self.phases)
+        logger.info("Ready after %.3fs (%s)", self.ready_at - self.started_at, breakdown)
+
+    def report(self) -> Dict[str, Any]:
+        """Return readiness and the timing breakdown for the readiness endpoint."""
+        with self._lock:
+            phases = list(self.phases)
+        return {
+            'ready': self.ready,
+            'error': self.error,
+            'seconds_to_ready': round(self.ready_at - self.started_at, 4) if self.ready_at else None,
+            'uptime_seconds': round(time.perf_counter() - self.started_at, 4),
+            'phases': phases,
+        }
+
+
+# Singleton instance, created when main starts importing
+startup_report = StartupReport()
@@ -0,0 +1,19 @@
+"""
+Text normalization helpers shared by the retrieval services.
+"""
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase `text` and strip accents so 'Zürich' and 'zurich' compare equal."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split `text` into normalized alphanumeric tokens."""
+    return _TOKEN_RE.findall(normalize(text))
@@ -0,0 +1,243 @@
+"""
+Lightweight request tracing and Prometheus-style metrics.
+
+Spans are plain context managers timed with `perf_counter_ns`; finishing a
+span appends it to the current request's trace (if any) and observes its
+duration in a latency histogram, which costs about a microsecond.
+"""
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+INF_LABEL = 'le="+Inf"'
+
+
+def _labels(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [bucket counts..., +Inf count, sum]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        # name -> labels -> zero-argument callback read at render time
+        self._gauges: Dict[str, Dict[LabelKey, Callable[[], float]]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name: str, callback: Callable[[], float], **labels: Any) -> None:
+        """Register a gauge whose value is read from `callback` on every render."""
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = callback
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        self.observe_key(name, _labels(labels), value)
+
+    def observe_key(self, name: str, key: LabelKey, value: float) -> None:
+        """`observe` with a prebuilt, sorted label key (hot path)."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+        for name, series in sorted(counters.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+        for name, series in sorted(gauges.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, callback in series.items():
+                lines.append(f"{name}{_format_labels(key)} {callback():g}")
+        for name, series in sorted(histograms.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, counts in series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = 'le="%g"' % bound
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative:g}")
+                cumulative += counts[len(self.buckets)]
+                lines.append(f"{name}_bucket{_format_labels(key, INF_LABEL)} {cumulative:g}")
+                lines.append(f"{name}_sum{_format_labels(key)} {counts[-1]:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {cumulative:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe('span_duration_seconds', "Duration of traced operations")
+metrics.describe('http_request_duration_seconds', "Duration of HTTP requests served")
+metrics.describe('upstream_responses_total', "Upstream HTTP responses by service and status code")
+metrics.describe('cache_lookups_total', "Cache lookups by cache and result")
+metrics.describe('llm_tokens_total', "LLM tokens by kind")
+
+
+class Trace:
+    """Spans recorded while serving one request."""
+    __slots__ = ('trace_id', 'spans', 'started_ns')
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.spans: List["Span"] = []
+        self.started_ns = time.perf_counter_ns()
+
+    def breakdown(self) -> Dict[str, float]:
+        """Total milliseconds per span name."""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration_ns / 1e6
+        return totals
+
+    def server_timing(self) -> str:
+        """`Server-Timing` header value summarizing the spans."""
+        return ", ".join(f"{name.replace('.', '-')};dur={ms:.1f}" for name, ms in self.breakdown().items())
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+
+
+class Span:
+    """
+    Timed operation; use as ``with span('serpapi.search', route=...) as s: s.set('status', 200)``.
+
+    Attributes are kept on the trace; only `status` (if set) becomes a
+    histogram label, so label cardinality stays bounded.
+    """
+    __slots__ = ('name', 'attrs', 'start_ns', 'duration_ns')
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = 0
+        self.duration_ns = 0
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append(self)
+        status = 'error' if exc_type is not None else str(self.attrs.get('status', 'ok'))
+        metrics.observe_key('span_duration_seconds', (('span', self.name), ('status', status)), self.duration_ns / 1e9)
+
+
+def span(name: str, **attrs: Any) -> Span:
+    """Start a span (use as a context manager)."""
+    return Span(name, attrs)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup by cache name and result."""
+    metrics.inc('cache_lookups_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def record_upstream(service: str, status: int) -> None:
+    """Count an upstream HTTP response by service and status code."""
+    metrics.inc('upstream_responses_total', service=service, status=status)
+
+
+def get_trace_id() -> Optional[str]:
+    trace = current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a trace per HTTP request.
+
+    Accepts an incoming ``X-Trace-Id`` header or generates one, returns it in
+    the response headers together with a ``Server-Timing`` breakdown of the
+    spans finished before the response started, and records the request
+    latency per route.
+    """
+
+    def __init__(self, app, header: str = 'x-trace-id'):
+        self.app = app
+        self.header = header.encode('latin-1')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        incoming = next((v.decode('latin-1') for k, v in scope.get('headers', ()) if k == self.header), None)
+        trace = Trace(incoming[:64] if incoming else None)
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = list(message.get('headers', ()))
+                headers.append((self.header, trace.trace_id.encode('latin-1')))
+                timing = trace.server_timing()
+                if timing:
+                    headers.append((b'server-timing', timing.encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            current_trace.reset(token)
+            elapsed = (time.perf_counter_ns() - trace.started_ns) / 1e9
+            route = scope.get('route')
+            # Route templates keep label cardinality bounded
+            path = getattr(route, 'path', None) or 'unmatched'
+            metrics.observe('http_request_duration_seconds', elapsed, path=path, status=status)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("trace %s %s %d %.1fms %s", trace.trace_id, path, status, elapsed * 1000, trace.breakdown())
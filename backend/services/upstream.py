@@ -0,0 +1,332 @@
+"""
+Resilient GETs to upstream APIs: adaptive timeouts, retries, circuit breaking and hedging.
+
+Every `Upstream` wraps the shared HTTP pool for one endpoint (SerpApi,
+OpenWeather geocoding, ...) and keeps a window of recent latencies. From it:
+
+- the per-attempt timeout is a multiple of the observed p99, clamped to
+  [min_timeout, max_timeout] (max_timeout until enough samples exist), and
+  all attempts together never take longer than max_timeout;
+- failed attempts (transport errors, timeouts, 429 and 5xx) are retried
+  with exponential backoff and full jitter, honouring ``Retry-After``;
+- consecutive failures open a circuit breaker, after which calls fail fast
+  with `CircuitOpenError` until a single probe succeeds;
+- optionally, a second (hedged) request is sent when the first has not
+  answered within the p95 latency, and the first good response wins.
+
+Callers catch `CircuitOpenError` like any other `httpx.HTTPError` and may
+fall back to stale cache entries. For metered upstreams the caller passes a
+`budget` check, which charges every retry and hedged request to its rate
+limiter; an extra attempt is skipped when the budget refuses it.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+from .http_client import http_client
+from .tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying (and counted as upstream failures by the breaker)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Takes the budget for one extra request; False means it must not be sent
+Budget = Callable[[], Awaitable[bool]]
+
+metrics.describe('upstream_retries_total', "Retried upstream requests by upstream")
+metrics.describe('upstream_hedges_total', "Hedged upstream requests by upstream and winner")
+metrics.describe('upstream_short_circuits_total', "Requests rejected by an open circuit breaker")
+metrics.describe('upstream_breaker_transitions_total', "Circuit breaker state changes by upstream and new state")
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised without contacting the upstream while its circuit breaker is open."""
+
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(f"Circuit breaker for {upstream} is open; retrying in {retry_in:.1f}s")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+class LatencyWindow:
+    """Sliding window of recent latencies with percentile lookups."""
+
+    def __init__(self, size: int = 256):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._sorted: Optional[List[float]] = None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._sorted = None
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Opens after `failure_threshold` failures in a row; after `reset_timeout`
+    seconds it lets one probe through (half-open), closing again on success
+    and re-opening on failure.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent now."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def _transition(self, state: str) -> None:
+        if state != self._state:
+            metrics.inc('upstream_breaker_transitions_total', upstream=self.name, state=state)
+            logger.warning("Circuit breaker for %s is now %s", self.name, state)
+        self._state = state
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._transition(self.CLOSED)
+
+    def release_probe(self) -> None:
+        """Give up a half-open probe that ended without a verdict (e.g. cancelled); the next call probes."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self._probing = False
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+
+class Upstream:
+    """Resilient GET client for one upstream endpoint (see module docstring)."""
+
+    def __init__(self, name: str, min_timeout: float = 1.0, max_timeout: float = 30.0,
+                 retries: Optional[int] = None, backoff_base: Optional[float] = None,
+                 backoff_max: Optional[float] = None, hedge: Optional[bool] = None,
+                 failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None,
+                 min_samples: int = 20):
+        """
+        Args:
+            name: Endpoint name used in metrics and stats
+            min_timeout: Lower bound for the adaptive per-attempt timeout (seconds)
+            max_timeout: Upper bound for one attempt and for all attempts together
+            retries: Extra attempts after a failure (UPSTREAM_RETRIES, default 2)
+            backoff_base: First backoff ceiling, doubled per retry (UPSTREAM_BACKOFF_BASE, default 0.2s)
+            backoff_max: Largest backoff (UPSTREAM_BACKOFF_MAX, default 2s)
+            hedge: Send a hedged request after the p95 latency (UPSTREAM_HEDGE, default false)
+            failure_threshold: Consecutive failures that open the breaker (UPSTREAM_BREAKER_FAILURES, default 5)
+            reset_timeout: Seconds the breaker stays open (UPSTREAM_BREAKER_RESET, default 30)
+            min_samples: Latencies needed before timeouts adapt and hedging starts
+        """
+        self.name = name
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries if retries is not None else int(os.getenv("UPSTREAM_RETRIES", "2"))
+        self.backoff_base = backoff_base if backoff_base is not None else float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.2"))
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv("UPSTREAM_BACKOFF_MAX", "2"))
+        self.hedge = hedge if hedge is not None else os.getenv("UPSTREAM_HEDGE", "false").lower() == "true"
+        self.timeout_percentile = float(os.getenv("UPSTREAM_TIMEOUT_PERCENTILE", "0.99"))
+        self.timeout_multiplier = float(os.getenv("UPSTREAM_TIMEOUT_MULTIPLIER", "3"))
+        self.min_samples = min_samples
+        self.latency = LatencyWindow()
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold if failure_threshold is not None else int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5")),
+            reset_timeout if reset_timeout is not None else float(os.getenv("UPSTREAM_BREAKER_RESET", "30")),
+        )
+
+    def timeout(self) -> float:
+        """Per-attempt timeout from the observed latency percentile."""
+        if len(self.latency) < self.min_samples:
+            return self.max_timeout
+        observed = self.latency.percentile(self.timeout_percentile) * self.timeout_multiplier
+        return min(self.max_timeout, max(self.min_timeout, observed))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off or not yet calibrated."""
+        if not self.hedge or len(self.latency) < self.min_samples:
+            return None
+        return max(0.01, self.latency.percentile(0.95))
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Full-jitter exponential backoff, or the upstream's ``Retry-After`` when given."""
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  budget: Optional[Budget] = None) -> httpx.Response:
+        """
+        GET `url`, retrying failures within the timeout budget.
+
+        Args:
+            url: Endpoint URL
+            params: Query string parameters
+            budget: Charged for each retry and hedged request; those are skipped when it returns False
+
+        Returns:
+            The first successful response, or the last failed response
+            (429/5xx) once retries are exhausted
+
+        Raises:
+            CircuitOpenError: The breaker is open
+            httpx.TimeoutException, httpx.TransportError: The last attempt failed to connect or timed out
+        """
+        deadline = time.monotonic() + self.max_timeout
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                metrics.inc('upstream_short_circuits_total', upstream=self.name)
+                raise CircuitOpenError(self.name, self.breaker.retry_in())
+            timeout = max(0.001, min(self.timeout(), deadline - time.monotonic()))
+            error: Optional[httpx.HTTPError] = None
+            response: Optional[httpx.Response] = None
+            try:
+                response = await self._send(url, params, timeout, budget)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = e
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Cancelled: says nothing about the upstream, but must not hold the probe
+                self.breaker.release_probe()
+                raise
+            if error is None and response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            delay = self.backoff(attempt, response)
+            attempt += 1
+            if (attempt > self.retries or time.monotonic() + delay + self.min_timeout > deadline
+                    or (budget is not None and not await budget())):
+                if error is not None:
+                    raise error
+                return response
+            metrics.inc('upstream_retries_total', upstream=self.name)
+            logger.info("Retrying %s in %.2fs after %s", self.name, delay,
+                        type(error).__name__ if error is not None else response.status_code)
+            await asyncio.sleep(delay)
+
+    async def _timed(self, url: str, params: Optional[Dict[str, Any]], timeout: float) -> httpx.Response:
+        started = time.perf_counter()
+        response = await http_client.get(url, params=params, timeout=timeout)
+        if response.status_code not in RETRY_STATUSES:
+            self.latency.add(time.perf_counter() - started)
+        return response
+
+    async def _send(self, url: str, params: Optional[Dict[str, Any]], timeout: float,
+                    budget: Optional[Budget] = None) -> httpx.Response:
+        """One attempt, hedged with a second request if the first is slower than p95."""
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return await self._timed(url, params, timeout)
+        primary = asyncio.ensure_future(self._timed(url, params, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        if budget is not None and not await budget():
+            return await primary
+        hedged = asyncio.ensure_future(self._timed(url, params, timeout - delay))
+        pending = {primary, hedged}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRY_STATUSES:
+                        metrics.inc('upstream_hedges_total', upstream=self.name,
+                                    winner='hedge' if task is hedged else 'primary')
+                        return task.result()
+            metrics.inc('upstream_hedges_total', upstream=self.name, winner='none')
+            return primary.result()
+        finally:
+            for task in (primary, hedged):
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state, latency percentiles and current timeout for the stats endpoint."""
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            'breaker': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'samples': len(self.latency),
+            'p50_ms': ms(self.latency.percentile(0.5)),
+            'p95_ms': ms(self.latency.percentile(0.95)),
+            'p99_ms': ms(self.latency.percentile(0.99)),
+            'timeout_ms': ms(self.timeout()),
+            'hedge_delay_ms': ms(self.hedge_delay()),
+        }
+
+
+_upstreams: Dict[str, Upstream] = {}
+_registry_lock = threading.Lock()
+
+
+def get_upstream(name: str, **options: Any) -> Upstream:
+    """Return the process-wide `Upstream` for `name`, creating it with `options` on first use."""
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _registry_lock:
+            upstream = _upstreams.get(name)
+            if upstream is None:
+                upstream = _upstreams[name] = Upstream(name, **options)
+    return upstream
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every upstream created so far."""
+    return {name: upstream.stats() for name, upstream in sorted(_upstreams.items())}
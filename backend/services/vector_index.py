@@ -0,0 +1,260 @@
+"""
+Offline vector retrieval: pluggable local embedders and a memory-mapped embedding index.
+
+The index can be rebuilt ahead of time with:
+
+    python -m services.vector_index build [--lists N]
+"""
+import os
+import json
+import time
+import zlib
+import logging
+from typing import Dict, Hashable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from .text_utils import normalize
+
+logger = logging.getLogger(__name__)
+
+
+class Embedder(Protocol):
+    """Interface for local embedders used by VectorIndex."""
+    name: str
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Return an L2-normalized float32 matrix of shape (len(texts), dim)."""
+        ...
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedder hashing words and character n-grams into a fixed space.
+
+    Uses crc32 rather than `hash()` so vectors are stable across processes and
+    a persisted index stays valid after a restart.
+    """
+
+    def __init__(self, dim: int = 512, ngram_range: Tuple[int, int] = (3, 4)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.name = f"hashing-{dim}-{ngram_range[0]}-{ngram_range[1]}"
+
+    def _features(self, text: str) -> List[str]:
+        words = normalize(text).split()
+        features = list(words)
+        low, high = self.ngram_range
+        for word in words:
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode('utf-8'))
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means returning `n_lists` unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids /= norms
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """
+    Row-per-item float32 embedding matrix with optional IVF partitioning.
+
+    With IVF enabled, rows are stored grouped by partition so each probed
+    partition is one contiguous slice of the (memory-mapped) matrix.
+    """
+
+    def __init__(self, keys: List[Hashable], matrix: np.ndarray, embedder_name: str,
+                 centroids: Optional[np.ndarray] = None, offsets: Optional[List[int]] = None,
+                 source: Optional[Dict] = None):
+        self.keys = keys
+        self.matrix = matrix
+        self.embedder_name = embedder_name
+        self.centroids = centroids
+        self.offsets = offsets
+        self.source = source or {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, keys: List[Hashable], texts: Sequence[str], embedder: Embedder,
+              n_lists: int = 0, source: Optional[Dict] = None) -> "VectorIndex":
+        """
+        Embed `texts` and build an index over them.
+
+        Args:
+            keys: Item identifiers, one per text
+            texts: Searchable text of each item
+            embedder: Embedder producing the vectors
+            n_lists: Number of IVF partitions (0 disables IVF)
+            source: Metadata describing the source data, used to detect staleness
+        """
+        matrix = embedder.embed(texts) if texts else np.zeros((0, embedder.dim), dtype=np.float32)
+        centroids = offsets = None
+        if n_lists and len(keys) > n_lists:
+            centroids = _kmeans(matrix, n_lists)
+            assignments = np.argmax(matrix @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind='stable')
+            matrix = matrix[order]
+            keys = [keys[i] for i in order]
+            counts = np.bincount(assignments, minlength=n_lists)
+            offsets = [0] + np.cumsum(counts).tolist()
+        return cls(list(keys), matrix, embedder.name, centroids, offsets, source)
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = 4) -> List[Tuple[Hashable, float]]:
+        """
+        Return the `k` rows with highest cosine similarity to `query`.
+
+        Args:
+            query: L2-normalized query vector
+            k: Number of results
+            nprobe: IVF partitions to scan (ignored without IVF)
+
+        Returns:
+            List of (key, score) pairs, best first
+        """
+        if not len(self.keys) or k <= 0:
+            return []
+        if self.centroids is None:
+            rows = np.arange(len(self.keys))
+            scores = self.matrix @ query
+        else:
+            probe = np.argsort(self.centroids @ query)[::-1][:nprobe]
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe])
+            if not len(rows):
+                return []
+            scores = np.concatenate([self.matrix[self.offsets[c]:self.offsets[c + 1]] @ query for c in probe])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.keys[rows[i]], float(scores[i])) for i in top]
+
+    def save(self, directory: str, name: str) -> None:
+        """
+        Persist the matrix as a raw float32 file plus a JSON sidecar, atomically.
+
+        Data files are versioned and the sidecar naming them is replaced
+        last, so a process loading concurrently sees either the old or the
+        new index, never a mix. Files of the previous version are kept for
+        readers that already opened its sidecar; older ones are removed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, name)
+        previous = self._read_meta(base)
+        version = f"v{time.time_ns():x}"
+        files: Dict[str, str] = {}
+        if len(self.keys):
+            files['matrix'] = f"{name}.{version}.f32"
+            tmp = os.path.join(directory, files['matrix'] + '.tmp')
+            mm = np.memmap(tmp, dtype=np.float32, mode='w+', shape=self.matrix.shape)
+            mm[:] = self.matrix
+            mm.flush()
+            del mm
+            os.replace(tmp, os.path.join(directory, files['matrix']))
+        if self.centroids is not None:
+            files['centroids'] = f"{name}.{version}.centroids.npy"
+            np.save(os.path.join(directory, files['centroids']), self.centroids)
+        meta = {
+            'embedder': self.embedder_name,
+            'dim': int(self.matrix.shape[1]),
+            'count': len(self.keys),
+            'keys': self.keys,
+            'offsets': self.offsets,
+            'source': self.source,
+            'files': files,
+        }
+        with open(base + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(base + '.json.tmp', base + '.json')
+
+        keep = set(files.values()) | set(((previous or {}).get('files') or {}).values())
+        for entry in os.listdir(directory):
+            stale = entry.startswith(f"{name}.v") and entry.endswith(('.f32', '.centroids.npy'))
+            legacy = entry in (f"{name}.f32", f"{name}.centroids.npy")
+            if (stale or legacy) and entry not in keep:
+                try:
+                    os.remove(os.path.join(directory, entry))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _read_meta(base: str) -> Optional[Dict]:
+        try:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> Optional["VectorIndex"]:
+        """Memory-map a persisted index, or return None if it does not exist or its files do not match."""
+        base = os.path.join(directory, name)
+        meta = cls._read_meta(base)
+        if meta is None:
+            return None
+        # Indexes saved before data files were versioned
+        files = meta.get('files') or {'matrix': f"{name}.f32", 'centroids': f"{name}.centroids.npy"}
+        shape = (meta['count'], meta['dim'])
+        try:
+            if meta['count']:
+                path = os.path.join(directory, files['matrix'])
+                expected = meta['count'] * meta['dim'] * np.dtype(np.float32).itemsize
+                if os.path.getsize(path) != expected:
+                    logger.warning("Vector index %s does not match its sidecar; ignoring it", path)
+                    return None
+                matrix = np.memmap(path, dtype=np.float32, mode='r', shape=shape)
+            else:
+                matrix = np.zeros(shape, dtype=np.float32)
+            centroids = None
+            if meta.get('offsets') is not None:
+                centroids = np.load(os.path.join(directory, files['centroids']))
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning("Could not load vector index %s: %s", base, e)
+            return None
+        keys = [tuple(k) if isinstance(k, list) else k for k in meta['keys']]
+        return cls(keys, matrix, meta['embedder'], centroids, meta.get('offsets'), meta.get('source'))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point for rebuilding the on-disk vector indexes."""
+    import argparse
+    from .rag_service import RAGService
+
+    parser = argparse.ArgumentParser(description="Rebuild the RAG vector indexes from backend/data/*.json")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--lists', type=int, default=None, help="IVF partitions (0 disables IVF)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    rag = RAGService(mode='vector', vector_lists=args.lists)
+    for data_type in rag.data_files:
+        index = rag.build_vector_index(data_type)
+        logger.info("Built %s vector index: %d items -> %s", data_type, len(index), rag.vector_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 import os
+import asyncio
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+import httpx
 import requests
 from dotenv import load_dotenv
+from .upstream import get_upstream
+from .cache import TTLCache
+from .geocode_cache import GeocodeCache, geocode_key
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -17,8 +20,20 @@ class WeatherService:
     def __init__(self):
         """Initialize the weather service with API key and base URLs."""
         self.api_key = os.getenv("OPENWEATHER_API_KEY")
-        self.base_url = "https://api.openweathermap.org/data/3.0/onecall"
-        self.geo_url = "http://api.openweathermap.org/geo/1.0/direct"
+        api_root = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip('/')
+        self.base_url = f"{api_root}/data/3.0/onecall"
+        self.geo_url = f"{api_root}/geo/1.0/direct"
+        # City coordinates never change; persist them across restarts
+        self.geocode_cache = GeocodeCache()
+        # Current conditions keyed on coordinates rounded to ~1km
+        self.weather_cache = TTLCache(
+            ttl=float(os.getenv("WEATHER_CACHE_TTL", "300")),
+            max_entries=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "512")),
+            stale_ttl=float(os.getenv("WEATHER_CACHE_STALE_TTL", "1800")),
+        )
+        self.geo_upstream = get_upstream('openweather.geocode', min_timeout=1.0, max_timeout=10.0)
+        self.onecall_upstream = get_upstream('openweather.onecall', min_timeout=1.0, max_timeout=10.0)
+        self.batch_concurrency = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "8"))
         
         if not self.api_key:
             logger.warning("OPENWEATHER_API_KEY not found in environment variables")
@@ -34,31 +49,71 @@ class WeatherService:
         Returns:
             Dict containing 'lat' and 'lon' or None if not found
         """
+        cached = self.geocode_cache.get(city, country_code)
+        if cached is not None:
+            return cached
         try:
-            params = {
-                'q': f"{city},{country_code}" if country_code else city,
-                'limit': 1,
-                'appid': self.api_key
-            }
-            
-            response = requests.get(self.geo_url, params=params, timeout=10)
+            response = requests.get(self.geo_url, params=self._geo_params(city, country_code), timeout=10)
             response.raise_for_status()
-            data = response.json()
-            
-            if not data or not isinstance(data, list) or len(data) == 0:
-                logger.error(f"Location not found: {city}")
-                return None
-                
-            return {
-                'lat': data[0].get('lat'),
-                'lon': data[0].get('lon'),
-                'name': data[0].get('name', city),
-                'country': data[0].get('country', '')
-            }
-            
+            return self._parse_location(response.json(), city, country_code)
         except Exception as e:
             logger.error(f"Error in geocoding: {str(e)}")
             return None
+
+    async def _aget_coordinates(self, city: str, country_code: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """Async version of `_get_coordinates` (shared HTTP pool, with retries and circuit breaking)."""
+        cached = self.geocode_cache.get(city, country_code)
+        if cached is not None:
+            return cached
+        try:
+            response = await self.geo_upstream.get(self.geo_url, params=self._geo_params(city, country_code))
+            response.raise_for_status()
+            return self._parse_location(response.json(), city, country_code)
+        except Exception as e:
+            logger.error(f"Error in geocoding: {str(e)}")
+            return None
+
+    def _geo_params(self, city: str, country_code: Optional[str]) -> Dict[str, Any]:
+        return {
+            'q': f"{city},{country_code}" if country_code else city,
+            'limit': 1,
+            'appid': self.api_key
+        }
+
+    def _parse_location(self, data: Any, city: str, country_code: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Extract the location from a geocoding response and cache it."""
+        if not data or not isinstance(data, list) or len(data) == 0:
+            logger.error(f"Location not found: {city}")
+            return None
+
+        location = {
+            'lat': data[0].get('lat'),
+            'lon': data[0].get('lon'),
+            'name': data[0].get('name', city),
+            'country': data[0].get('country', '')
+        }
+        if location['lat'] is not None and location['lon'] is not None:
+            self.geocode_cache.set(city, country_code, location)
+        return location
+
+    def _onecall_params(self, location: Dict[str, Any]) -> Dict[str, Any]:
+        """Build query parameters for One Call API 3.0."""
+        return {
+            'lat': location['lat'],
+            'lon': location['lon'],
+            'appid': self.api_key,
+            'units': 'metric',  # Get temperature in Celsius
+            'lang': 'en',       # Get weather description in English
+            'exclude': 'minutely,hourly,daily,alerts'  # We only want current weather
+        }
+
+    @staticmethod
+    def _weather_key(location: Dict[str, Any]) -> Tuple[float, float]:
+        return (round(location['lat'], 2), round(location['lon'], 2))
+
+    @staticmethod
+    def _location_name(location: Dict[str, Any]) -> str:
+        return f"{location['name']}, {location['country']}" if location.get('country') else location['name']
             
     def get_weather_by_city(self, city: str, country_code: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -86,23 +141,17 @@ class WeatherService:
                     'error': f'Could not find coordinates for {city}'
                 }
             
-            # Build query parameters for One Call API 3.0
-            params = {
-                'lat': location['lat'],
-                'lon': location['lon'],
-                'appid': self.api_key,
-                'units': 'metric',  # Get temperature in Celsius
-                'lang': 'en',       # Get weather description in English
-                'exclude': 'minutely,hourly,daily,alerts'  # We only want current weather
-            }
-            
-            # Make API request to One Call API
-            response = requests.get(self.base_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            key = self._weather_key(location)
+            data = self.weather_cache.get(key)
+            if data is None:
+                # Make API request to One Call API
+                response = requests.get(self.base_url, params=self._onecall_params(location), timeout=10)
+                response.raise_for_status()
+                data = response.json()
+                self.weather_cache.set(key, data)
             
             # Format the location name
-            location_name = f"{location['name']}, {location['country']}" if location.get('country') else location['name']
+            location_name = self._location_name(location)
             
             # Extract and format weather data
             weather_data = self._format_weather_data(data, location_name)
@@ -127,6 +176,101 @@ class WeatherService:
                 'error': error_msg
             }
     
+    async def aget_weather_by_city(self, city: str, country_code: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Async version of `get_weather_by_city`.
+
+        Geocoding is served from the persistent geocode cache and current
+        conditions from a short-TTL cache keyed on rounded coordinates, so a
+        repeated city usually costs no upstream request at all.
+
+        Args:
+            city: Name of the city
+            country_code: Optional country code (e.g., 'US' for United States)
+
+        Returns:
+            Dict containing weather data or error information
+        """
+        if not self.api_key:
+            return {
+                'status': 'error',
+                'error': 'OpenWeatherMap API key not configured'
+            }
+
+        try:
+            location = await self._aget_coordinates(city, country_code)
+            if not location:
+                return {
+                    'status': 'error',
+                    'error': f'Could not find coordinates for {city}'
+                }
+
+            async def fetch():
+                response = await self.onecall_upstream.get(self.base_url, params=self._onecall_params(location))
+                response.raise_for_status()
+                return response.json()
+
+            key = self._weather_key(location)
+            try:
+                data = await self.weather_cache.get_or_fetch(key, fetch)
+            except httpx.HTTPError as e:
+                # Slightly old conditions are better than none while OpenWeather is failing
+                data = self.weather_cache.get_stale(key)
+                if data is None:
+                    raise
+                logger.warning("Serving stale weather for %s: %s", key, e)
+            location_name = self._location_name(location)
+            return {
+                'status': 'success',
+                'location': location_name,
+                'data': self._format_weather_data(data, location_name)
+            }
+
+        except httpx.HTTPError as e:
+            error_msg = f"Error fetching weather data: {str(e)}"
+            logger.error(error_msg)
+            return {
+                'status': 'error',
+                'error': error_msg
+            }
+        except (KeyError, IndexError, ValueError) as e:
+            error_msg = f"Unexpected response format from weather API: {str(e)}"
+            logger.error(error_msg)
+            return {
+                'status': 'error',
+                'error': error_msg
+            }
+
+    async def aget_weather_batch(self, cities: Sequence[Union[str, Tuple[str, Optional[str]]]],
+                                 max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Fetch current weather for many destinations concurrently.
+
+        Duplicate cities are looked up once and at most `max_concurrency`
+        lookups run at a time.
+
+        Args:
+            cities: City names or (city, country_code) pairs
+            max_concurrency: Concurrent lookups (WEATHER_BATCH_CONCURRENCY, default 8)
+
+        Returns:
+            One result dict per input, in input order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.batch_concurrency)
+        pairs = [(c, None) if isinstance(c, str) else (c[0], c[1]) for c in cities]
+
+        async def lookup(city: str, country_code: Optional[str]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.aget_weather_by_city(city, country_code)
+
+        unique = {}
+        for city, country_code in pairs:
+            key = geocode_key(city, country_code)
+            if key not in unique:
+                unique[key] = asyncio.ensure_future(lookup(city, country_code))
+        await asyncio.gather(*unique.values())
+        return [unique[geocode_key(city, country_code)].result() for city, country_code in pairs]
+
     def _format_weather_data(self, data: Dict[str, Any], location: str) -> Dict[str, Any]:
         """
         Format raw weather data from One Call API 3.0 into a more usable structure.
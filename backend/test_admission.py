@@ -0,0 +1,131 @@
+import asyncio
+import json
+import httpx
+import pytest
+from starlette.responses import JSONResponse
+from services.admission import (AdmissionController, AdmissionMiddleware, AdmissionRejected,
+                                PRIORITY_CRITICAL, PRIORITY_PREMIUM, PRIORITY_STANDARD)
+
+
+def test_queue_orders_by_priority_sheds_and_times_out():
+    controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=0.2)
+    order = []
+
+    async def request(name, priority):
+        await controller.acquire(priority)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        controller.release(0.01)
+
+    async def scenario():
+        assert await controller.acquire(PRIORITY_STANDARD)
+        waiting = [asyncio.create_task(request('standard', PRIORITY_STANDARD)),
+                   asyncio.create_task(request('standard-2', PRIORITY_STANDARD))]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as shed:
+            await controller.acquire(PRIORITY_STANDARD)
+        assert shed.value.reason == 'chat queue_full'
+        # A premium request displaces the newest standard waiter instead of being shed
+        waiting.append(asyncio.create_task(request('premium', PRIORITY_PREMIUM)))
+        await asyncio.sleep(0)
+        assert not await controller.acquire(PRIORITY_CRITICAL)
+        assert controller.queue_depth == 2
+        controller.release(0.05)
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        assert order == ['premium', 'standard']
+        assert isinstance(results[1], AdmissionRejected) and results[1].reason == 'chat displaced'
+
+        # Nobody releases the slot: the waiter hits its queue deadline
+        assert await controller.acquire(PRIORITY_STANDARD)
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await controller.acquire(PRIORITY_STANDARD)
+        assert timed_out.value.reason == 'chat timeout' and timed_out.value.retry_after >= 1
+
+    asyncio.run(scenario())
+    stats = controller.stats()
+    assert stats['in_flight'] == 1 and stats['queue_depth'] == 0
+    assert stats['shed'] == 3 and stats['displaced'] == 1 and stats['timed_out'] == 1
+
+
+def test_overloaded_request_does_not_displace_a_waiter():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.5)
+
+    async def scenario():
+        assert await controller.acquire(PRIORITY_STANDARD)
+        waiting = asyncio.create_task(controller.acquire(PRIORITY_STANDARD))
+        await asyncio.sleep(0)
+        controller._service_time = 10.0  # every request now takes far longer than the queue timeout
+        with pytest.raises(AdmissionRejected) as shed:
+            await controller.acquire(PRIORITY_PREMIUM)
+        assert shed.value.reason == 'chat overloaded'
+        assert controller.queue_depth == 1 and not waiting.done()
+        controller.release()
+        assert await waiting
+
+    asyncio.run(scenario())
+    assert controller.stats()['displaced'] == 0
+
+
+def test_middleware_returns_503_with_retry_after_and_serves_premium_and_health():
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope['path'] == '/api/chat':
+            await release.wait()
+        await JSONResponse({'path': scope['path']})(scope, receive, send)
+
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+    middleware = AdmissionMiddleware(app, controller=controller, premium_keys=['gold'])
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url='http://test') as client:
+            first = asyncio.create_task(client.post('/api/chat'))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(client.post('/api/chat'))
+            await asyncio.sleep(0.01)
+            shed = await client.post('/api/chat')
+            assert shed.status_code == 503 and int(shed.headers['retry-after']) >= 1
+            assert shed.json()['retry_after'] == int(shed.headers['retry-after'])
+            premium = asyncio.create_task(client.post('/api/chat', headers={'Authorization': 'Bearer gold'}))
+            health = await client.get('/api/health')
+            assert health.status_code == 200
+            release.set()
+            responses = await asyncio.gather(first, queued, premium)
+            # The premium request displaced the queued standard one
+            assert [r.status_code for r in responses] == [200, 503, 200]
+
+    asyncio.run(scenario())
+    assert controller.in_flight == 0 and controller.queue_depth == 0
+
+
+def test_batches_take_one_slot_per_concurrent_item():
+    release = asyncio.Event()
+    bodies = []
+
+    async def app(scope, receive, send):
+        message = await receive()
+        bodies.append(json.loads(message['body']))
+        await release.wait()
+        await JSONResponse({'ok': True})(scope, receive, send)
+
+    controller = AdmissionController(max_in_flight=4, max_queue=1, queue_timeout=5)
+    middleware = AdmissionMiddleware(app, controller=controller,
+                                     weights={'/api/chat/batch': lambda body: json.loads(body)['concurrency']})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url='http://test') as client:
+            batch = asyncio.create_task(client.post('/api/chat/batch', json={'messages': [], 'concurrency': 3}))
+            await asyncio.sleep(0.01)
+            assert controller.in_flight == 3
+            chat = asyncio.create_task(client.post('/api/chat', json={'message': 'hi'}))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(client.post('/api/chat/batch', json={'messages': [], 'concurrency': 2}))
+            await asyncio.sleep(0.01)
+            assert controller.in_flight == 4 and controller.queue_depth == 1
+            assert (await client.post('/api/chat', json={'message': 'hi'})).status_code == 503
+            release.set()
+            assert [r.status_code for r in await asyncio.gather(batch, chat, queued)] == [200, 200, 200]
+
+    asyncio.run(scenario())
+    assert bodies[0] == {'messages': [], 'concurrency': 3} and len(bodies) == 3
+    assert controller.in_flight == 0 and controller.queue_depth == 0
@@ -0,0 +1,37 @@
+from services.airport_resolver import AirportResolver
+from services.chat_service import map_to_airport, resolve_airport
+
+resolver = AirportResolver().load()
+
+
+def test_exact_codes_names_and_aliases():
+    assert resolver.resolve('lhr') == 'LHR'
+    assert resolver.resolve('LON') == 'LHR'  # metro code -> primary airport
+    assert resolver.resolve('Paris') == 'CDG'
+    assert resolver.resolve('heathrow') == 'LHR'
+    assert resolver.resolve('São Paulo') == 'GRU'
+    assert resolver.resolve('Barcelona') == 'BCN'
+
+
+def test_prefix_and_fuzzy_matches():
+    assert resolver.resolve('barcel') == 'BCN'
+    assert resolver.resolve('Amsterdm') == 'AMS'
+    assert resolver.resolve('Singapure') == 'SIN'
+    assert resolver.resolve('Amsterdm', fuzzy=False) is None
+    assert resolver.resolve('Xanadu') is None
+
+
+def test_metro_expansion():
+    assert set(resolver.expand('LON')) == {'LHR', 'LGW', 'STN', 'LTN', 'LCY', 'SEN'}
+    assert set(resolver.expand('new york')) == {'JFK', 'EWR', 'LGA'}
+    assert resolver.expand('JFK') == ['JFK']
+    assert resolver.expand('heathrow') == ['LHR']
+    assert resolver.expand('newark') == ['EWR'] and resolver.expand('Oakland') == ['OAK']
+    assert resolver.expand('Lisbon') == ['LIS']
+
+
+def test_codes_missing_from_the_dataset_pass_through():
+    assert resolver.resolve('ABZ') is None
+    assert map_to_airport('abz') == 'ABZ' and resolve_airport('inv') == 'INV'
+    assert map_to_airport('heathrow') == 'LHR'
+    assert map_to_airport('Xanadu') is None and resolve_airport('xanadu') is None
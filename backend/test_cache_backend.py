@@ -0,0 +1,63 @@
+import asyncio
+import datetime
+import time
+import httpx
+from services.cache_backend import SQLiteBackend
+from services.flight_query_schema import FlightQuery
+from services.http_client import http_client
+from services.serpapi_flights_service import SerpApiFlightsService
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    """Separate instances (as in separate workers) see each other's writes until expiry."""
+    path = str(tmp_path / 'cache.sqlite')
+    a, b = SQLiteBackend(path), SQLiteBackend(path)
+    a.set('k', 'v', ttl=0.05)
+    assert b.get('k') == 'v'
+    time.sleep(0.06)
+    assert b.get('k') is None
+    assert b.stats()['hits'] == 1
+
+
+def test_flight_results_are_reused_across_workers(tmp_path, monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(200, json={'best_flights': [{'price': 100, 'total_duration': 60}]})
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    shared = str(tmp_path / 'cache.sqlite')
+    worker_a = SerpApiFlightsService(api_key='test', shared_cache=SQLiteBackend(shared))
+    worker_b = SerpApiFlightsService(api_key='test', shared_cache=SQLiteBackend(shared))
+    query = FlightQuery(departure_id='LHR', arrival_id='CDG', type=2,
+                        departure_date=datetime.date.today() + datetime.timedelta(days=30))
+
+    first = asyncio.run(worker_a.asearch_query(query))
+    second = asyncio.run(worker_b.asearch_query(query))
+    assert first == second and len(calls) == 1
+
+
+def test_sqlite_async_methods_do_not_block_the_event_loop(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.sqlite'))
+    get = backend.get
+    backend.get = lambda key: time.sleep(0.1) or get(key)  # e.g. waiting on another worker's write lock
+
+    async def scenario():
+        ticks = []
+
+        async def ticker():
+            while True:
+                await asyncio.sleep(0.01)
+                ticks.append(1)
+
+        running = asyncio.ensure_future(ticker())
+        await backend.aset('k', 'v', 60)
+        assert await backend.aincr('n', 2, 60) == 2
+        assert await backend.aget('k') == 'v'
+        value, ttl = await backend.aget_with_ttl('k')
+        assert value == 'v' and 59 < ttl <= 60
+        running.cancel()
+        return len(ticks)
+
+    assert asyncio.run(scenario()) >= 5
@@ -0,0 +1,88 @@
+import asyncio
+import datetime
+import httpx
+from services.cache_backend import MemoryBackend
+from services.cache_warmer import CacheWarmer, SpaceSaving
+from services.flight_query_schema import FlightQuery
+from services.http_client import http_client
+from services.rate_limiter import SearchScheduler
+from services.serpapi_flights_service import SerpApiFlightsService
+
+
+def test_space_saving_keeps_heavy_hitters():
+    sketch = SpaceSaving(capacity=4)
+    for i in range(200):
+        sketch.add('hot')
+        sketch.add(f'cold-{i}')
+        if i % 2:
+            sketch.add('warm')
+    top = sketch.top(2)
+    assert [key for key, _, _ in top] == ['hot', 'warm']
+    assert top[0][1] - top[0][2] <= 200 <= top[0][1]
+    sketch.decay(0.5)
+    assert sketch.counts['hot'] == top[0][1] / 2
+
+
+def test_popular_searches_are_refreshed_within_budget(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params['arrival_id'])
+        return httpx.Response(200, json={'best_flights': [{'price': 100, 'total_duration': 60}]})
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    scheduler = SearchScheduler('test', rate=100, burst=10)
+    service = SerpApiFlightsService(api_key='test', shared_cache=MemoryBackend(), scheduler=scheduler)
+    warmer = CacheWarmer(service, top_k=2, min_count=2, refresh_ahead=60, budget_share=0.2)
+    day = datetime.date.today() + datetime.timedelta(days=30)
+    hot, warm, cold = (FlightQuery(departure_id='LHR', arrival_id=code, type=2, departure_date=day)
+                       for code in ('JFK', 'CDG', 'AMS'))
+    for query in (hot, hot, hot, warm, warm, cold):
+        warmer.record(query)
+
+    async def scenario():
+        assert await warmer.tick() == 2
+        assert sorted(calls) == ['CDG', 'JFK']
+        assert await warmer.tick() == 0  # still fresh
+        warmer.record(hot)
+        # About to expire, but interactive traffic has used the spare tokens
+        service.cache.set(hot.cache_key(), {'best_flights': []}, ttl=10)
+        service.shared_cache.clear()
+        while scheduler.bucket.tokens >= 9:
+            scheduler.bucket.try_acquire()
+        assert await warmer.tick() == 0
+
+    asyncio.run(scenario())
+    stats = warmer.stats()
+    assert [entry['route'] for entry in stats['warm_set']] == ['LHR-JFK', 'LHR-CDG']
+    assert stats['refreshes'] == 2 and stats['refresh_hits'] == 1 and stats['skipped_busy'] == 1
+
+
+def test_worker_adopts_a_search_another_worker_refreshed(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params['arrival_id'])
+        return httpx.Response(200, json={'best_flights': [{'price': 100, 'total_duration': 60}]})
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    shared = MemoryBackend()
+    # Two worker processes: own scheduler, local cache and warmer, one shared backend
+    workers = [CacheWarmer(SerpApiFlightsService(api_key='test', shared_cache=shared,
+                                                 scheduler=SearchScheduler('test', rate=100, burst=10)),
+                           top_k=2, min_count=2, refresh_ahead=60)
+               for _ in range(2)]
+    query = FlightQuery(departure_id='LHR', arrival_id='JFK', type=2,
+                        departure_date=datetime.date.today() + datetime.timedelta(days=30))
+    for warmer in workers:
+        warmer.record(query)
+        warmer.record(query)
+
+    async def scenario():
+        assert await workers[0].tick() == 1
+        assert await workers[1].tick() == 0
+
+    asyncio.run(scenario())
+    assert calls == ['JFK']
+    assert workers[1].flights_service.cache.get(query.cache_key()) == {'best_flights': [{'price': 100, 'total_duration': 60}]}
+    assert workers[1].stats()['adopted'] == 1
@@ -0,0 +1,64 @@
+import asyncio
+import datetime
+import httpx
+from services.cache_backend import MemoryBackend
+from services.http_client import http_client
+from services.rate_limiter import SearchScheduler
+
+
+def test_batch_coalesces_searches_and_streams_in_completion_order(monkeypatch):
+    monkeypatch.setenv('API_KEY', 'test')
+    monkeypatch.setenv('MODEL_NAME', 'gpt-4o')
+    monkeypatch.setenv('SERPAPI_KEY', 'test')
+    from services.chat_service import ChatService
+
+    calls = []
+
+    async def handler(request):
+        destination = request.url.params['arrival_id']
+        calls.append(destination)
+        if destination == 'JFK':
+            await asyncio.sleep(0.2)
+        flight = {'price': 100, 'total_duration': 60,
+                  'flights': [{'airline': 'Test Air', 'departure_airport': {'time': '2030-01-01 08:00'},
+                               'arrival_airport': {'time': '2030-01-01 09:00'}}]}
+        return httpx.Response(200, json={'best_flights': [flight]})
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    service = ChatService()
+    service.flights_service.shared_cache = MemoryBackend()
+    service.flights_service.scheduler = SearchScheduler('test', rate=100, burst=10)
+    day = (datetime.date.today() + datetime.timedelta(days=30)).isoformat()
+    items = [
+        {'message': f"Flights from LHR to JFK on {day}"},
+        {'message': f"Flights from LHR to CDG on {day}"},
+        {'message': f"Flights from London Heathrow to CDG on {day}", 'session_id': 's1'},
+        {'message': f"flights LHR to JFK {day}"},
+    ]
+
+    async def scenario():
+        return [result async for result in service.process_batch(items, concurrency=4)]
+
+    results = asyncio.run(scenario())
+    assert sorted(calls) == ['CDG', 'JFK']
+    assert sorted(r['index'] for r in results) == [0, 1, 2, 3]
+    # The slow route's items arrive last
+    assert {r['index'] for r in results[2:]} == {0, 3}
+    assert all('Test Air' in r['response'] for r in results)
+    assert next(r for r in results if r['index'] == 2)['session_id'] == 's1'
+
+
+def test_upstream_errors_fall_back_to_the_agent(monkeypatch):
+    monkeypatch.setenv('API_KEY', 'test')
+    monkeypatch.setenv('MODEL_NAME', 'gpt-4o')
+    monkeypatch.setenv('SERPAPI_KEY', 'test')
+    from services.chat_service import ChatService
+    from services.intent_parser import FlightIntent
+
+    handler = lambda request: httpx.Response(200, json={'error': "Google Flights hasn't returned any results"})
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    service = ChatService()
+    service.flights_service.shared_cache = MemoryBackend()
+    service.flights_service.scheduler = SearchScheduler('test', rate=100, burst=10)
+    day = datetime.date.today() + datetime.timedelta(days=30)
+    assert asyncio.run(service._answer_flight_intent(FlightIntent('LHR', 'ZRH', day))) is None
@@ -0,0 +1,32 @@
+import json
+from fastapi.testclient import TestClient
+from benchmarks.fake_upstreams import FaultProfile, create_app
+from services.flight_ranking import extract_flights
+
+
+def _client(**profiles):
+    none = FaultProfile()
+    return TestClient(create_app(profiles.get('serpapi', none), none, profiles.get('llm', none), seed=1))
+
+
+def test_fake_serpapi_is_deterministic_and_injects_errors():
+    client = _client()
+    params = {'engine': 'google_flights', 'departure_id': 'LHR', 'arrival_id': 'CDG', 'outbound_date': '2030-01-10'}
+    first = client.get('/search', params=params).json()
+    assert first['best_flights'] == client.get('/search', params=params).json()['best_flights']
+    assert len(extract_flights(first)) == 15
+    failing = _client(serpapi=FaultProfile(error_rate=1.0))
+    assert failing.get('/search', params=params).status_code in (429, 500, 503)
+
+
+def test_fake_llm_calls_the_flight_tool_then_answers():
+    client = _client()
+    functions = [{'name': 'search_flights', 'parameters': {}}]
+    question = {'role': 'user', 'content': "User: any flights LHR to JFK on 2030-02-01?\n\nToday's date: 2030-01-01"}
+    reply = client.post('/v1/chat/completions', json={'messages': [question], 'functions': functions}).json()
+    call = reply['choices'][0]['message']['function_call']
+    assert json.loads(call['arguments'])['departure_date'] == '2030-02-01'
+
+    result = {'role': 'function', 'name': 'search_flights', 'content': '{"price": 120}, {"price": 95}'}
+    reply = client.post('/v1/chat/completions', json={'messages': [question, result], 'functions': functions}).json()
+    assert '$95' in reply['choices'][0]['message']['content']
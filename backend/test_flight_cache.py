@@ -0,0 +1,107 @@
+import asyncio
+import time
+from services.cache import TTLCache
+
+
+def test_ttl_and_lru_eviction():
+    """Entries expire after the TTL and the least recently used entry is evicted first."""
+    cache = TTLCache(ttl=0.05, max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now least recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.stats()['evictions'] == 1
+
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_max_bytes_bound():
+    """The summed value size never exceeds max_bytes."""
+    cache = TTLCache(ttl=60, max_entries=100, max_bytes=30)
+    cache.set('a', 'x' * 10)
+    cache.set('b', 'y' * 10)
+    assert cache.stats()['bytes'] <= 30
+    assert len(cache) == 2
+    cache.set('c', 'z' * 10)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] <= 30
+
+
+def test_single_flight_shares_one_fetch():
+    """Concurrent misses on the same key share one upstream call."""
+    cache = TTLCache(ttl=60)
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {'best_flights': []}
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_fetch('LHR-CDG', fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert all(r == {'best_flights': []} for r in results)
+    assert cache.stats()['coalesced'] == 4
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    """A follower outlives the cancelled caller that started the fetch and refetches."""
+    cache = TTLCache(ttl=60)
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {'best_flights': [calls]}
+
+    async def main():
+        leader = asyncio.create_task(cache.get_or_fetch('LHR-CDG', fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_fetch('LHR-CDG', fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result = await follower
+        assert leader.cancelled()
+        return result
+
+    assert asyncio.run(main()) == {'best_flights': [2]}
+    assert calls == 2
+    assert cache.stats()['inflight'] == 0
+
+
+def test_cancelled_follower_leaves_the_fetch_running():
+    """A cancelled follower stops waiting, even when the leader is cancelled in the same step."""
+    cache = TTLCache(ttl=60)
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return 'ok'
+
+    async def main():
+        leader = asyncio.create_task(cache.get_or_fetch('k', fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_fetch('k', fetch))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        assert await leader == 'ok'
+        assert follower.cancelled()
+
+        cache.clear()
+        leader = asyncio.create_task(cache.get_or_fetch('k', fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_fetch('k', fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        follower.cancel()
+        await asyncio.gather(leader, follower, return_exceptions=True)
+        assert leader.cancelled() and follower.cancelled()
+
+    asyncio.run(main())
+    assert cache.stats()['inflight'] == 0
@@ -0,0 +1,64 @@
+import asyncio
+import datetime
+import pytest
+from services.flight_fanout import FlightFanOutSearch, date_window
+
+TODAY = datetime.date(2026, 10, 18)
+
+
+def _flight(price, number, departs='2026-11-02 09:00'):
+    return {
+        'price': price,
+        'total_duration': 120,
+        'layovers': [],
+        'flights': [{'flight_number': number, 'departure_airport': {'id': 'LHR', 'time': departs}}],
+    }
+
+
+class FakeFlightsService:
+    def __init__(self, results, slow=()):
+        self.results = results
+        self.slow = set(slow)
+        self.calls = []
+
+    async def asearch_query(self, query):
+        self.calls.append(query.departure_id)
+        if query.departure_id in self.slow:
+            await asyncio.sleep(10)
+        return self.results[query.departure_id]
+
+
+def test_date_window_is_nearest_first_and_skips_past():
+    center = datetime.date(2026, 10, 19)
+    assert date_window(center, 2, today=TODAY) == [
+        center, center - datetime.timedelta(days=1), center + datetime.timedelta(days=1),
+        center + datetime.timedelta(days=2),
+    ]
+
+
+def test_expand_rejects_a_return_before_departure():
+    fanout = FlightFanOutSearch(FakeFlightsService({}))
+    day = datetime.date(2026, 11, 2)
+    assert [q.return_date for q in fanout.expand(['LHR'], ['JFK'], [day], 7)] == [datetime.date(2026, 11, 9)]
+    for trip_length in (0, -3):
+        with pytest.raises(ValueError):
+            fanout.expand(['LHR'], ['JFK'], [day], trip_length)
+
+
+def test_merges_dedupes_and_returns_partial_results_at_deadline():
+    service = FakeFlightsService({
+        'LHR': {'best_flights': [_flight(300, 'BA 1'), _flight(200, 'VS 3')]},
+        'LGW': {'other_flights': [_flight(250, 'BA 1'), _flight(500, 'U2 9')]},
+        'STN': {'error': 'upstream failed'},
+        'LCY': {'best_flights': [_flight(50, 'XX 1')]},
+    }, slow={'LCY'})
+    fanout = FlightFanOutSearch(service, deadline=0.2)
+    queries = fanout.expand(['LHR', 'LGW', 'STN', 'LCY'], ['JFK'], [datetime.date.today() + datetime.timedelta(days=15)])
+    result = asyncio.run(fanout.search(queries, top_k=2))
+
+    summary = result['search_summary']
+    assert (summary['completed'], summary['failed'], summary['timed_out']) == (2, 1, 1)
+    assert summary['partial'] and summary['unique_itineraries'] == 3
+    # BA 1 is kept once, at the cheaper of its two prices
+    assert sorted(f['price'] for f in result['flights']) == [200, 250, 500]
+    assert len(result['most_optimal_flights']) == 2
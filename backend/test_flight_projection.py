@@ -0,0 +1,64 @@
+import asyncio
+import json
+import services.flight_projection as flight_projection
+from benchmarks.fake_upstreams import make_flight_results
+from services.cache_backend import SQLiteBackend
+from services.flight_projection import aflight_details, aproject_flights, flight_details, project_flights, result_store
+from services.flight_ranking import rank_flights
+
+
+def test_projection_keeps_ranked_top_n_and_dedupes_strings():
+    result = make_flight_results({'departure_id': 'LHR', 'arrival_id': 'JFK', 'outbound_date': '2030-05-01',
+                                  'currency': 'USD'})
+    projected = project_flights(result, top_n=4)
+    ranked = rank_flights(result, top_k=4)
+
+    assert [option['price'] for option in projected['options']] == [f['price'] for f in ranked]
+    assert projected['summary']['itineraries_found'] == 15 and projected['summary']['currency'] == 'USD'
+    for option in projected['options']:
+        for leg in option['legs']:
+            assert leg['from'] in projected['airports'] and leg['to'] in projected['airports']
+            assert isinstance(leg['airline'], int) and projected['airlines'][leg['airline']]
+    assert len(set(projected['airlines'])) == len(projected['airlines'])
+    assert len(json.dumps(projected)) * 4 < len(json.dumps(result))
+    # Identical results get identical references
+    assert project_flights(result, top_n=4)['result_ref'] == projected['result_ref']
+
+
+def test_full_itinerary_is_available_by_reference():
+    result = make_flight_results({'departure_id': 'CDG', 'arrival_id': 'FCO', 'outbound_date': '2030-05-02'})
+    projected = project_flights(result, top_n=3)
+    details = flight_details(projected['result_ref'], 1)
+    assert details['flight']['booking_token'] == rank_flights(result, top_k=1)[0]['booking_token']
+    assert 'error' in flight_details(projected['result_ref'], 4)
+    assert 'error' in flight_details('unknown', 1)
+
+
+def test_errors_and_other_values_pass_through():
+    error = {'error': 'Live flight search is temporarily unavailable', 'degraded': True}
+    assert project_flights(error) is error
+    assert project_flights({'flights': []}) == {'flights': []}
+
+
+def test_details_are_served_by_another_worker(tmp_path, monkeypatch):
+    shared = SQLiteBackend(path=str(tmp_path / 'shared.sqlite'))
+    monkeypatch.setattr(flight_projection, 'get_shared_cache', lambda: shared)
+    result = make_flight_results({'departure_id': 'LHR', 'arrival_id': 'AMS', 'outbound_date': '2030-05-03'})
+    projected = project_flights(result, top_n=2)
+    result_store.clear()  # as seen from a worker that did not run the search
+    details = flight_details(projected['result_ref'], 2)
+    assert details['flight']['booking_token'] == rank_flights(result, top_k=2)[1]['booking_token']
+
+
+def test_async_projection_shares_details_without_blocking(tmp_path, monkeypatch):
+    shared = SQLiteBackend(path=str(tmp_path / 'shared.sqlite'))
+    monkeypatch.setattr(flight_projection, 'get_shared_cache', lambda: shared)
+    result = make_flight_results({'departure_id': 'LHR', 'arrival_id': 'AMS', 'outbound_date': '2030-05-04'})
+
+    async def scenario():
+        projected = await aproject_flights(result, top_n=2)
+        result_store.clear()
+        return await aflight_details(projected['result_ref'], 1)
+
+    details = asyncio.run(scenario())
+    assert details['flight']['booking_token'] == rank_flights(result, top_k=2)[0]['booking_token']
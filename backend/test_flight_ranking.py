@@ -0,0 +1,41 @@
+import numpy as np
+from services.flight_ranking import RankingCriteria, pareto_mask, rank_flights
+
+
+def _flight(price, duration, layovers=0, departs='2026-11-02 09:00', co2=None):
+    flight = {
+        'price': price,
+        'total_duration': duration,
+        'layovers': [{}] * layovers,
+        'flights': [{'departure_airport': {'id': 'LHR', 'time': departs}}],
+    }
+    if co2 is not None:
+        flight['carbon_emissions'] = {'this_flight': co2}
+    return flight
+
+
+RESULTS = {
+    'best_flights': [_flight(300, 80), _flight(120, 200, layovers=2, departs='2026-11-02 22:00')],
+    'other_flights': [_flight(150, 90, co2=90000), _flight(400, 300), {'price': None, 'total_duration': 10}],
+}
+
+
+def test_default_ranking_balances_price_and_duration():
+    """The default weights favour the cheap-and-fast itinerary and skip incomplete ones."""
+    top = rank_flights(RESULTS, top_k=2)
+    assert [f['price'] for f in top] == [150, 120]
+
+
+def test_weighted_criteria():
+    """Price-only weighting and a departure window change the order."""
+    assert rank_flights(RESULTS, RankingCriteria(price=1, total_duration=0), top_k=1)[0]['price'] == 120
+    morning = RankingCriteria(price=1, total_duration=0, departure_time=5, departure_window=(6, 12))
+    assert rank_flights(RESULTS, morning, top_k=1)[0]['price'] == 150
+
+
+def test_pareto_front():
+    """Dominated itineraries are excluded when pareto_only is set."""
+    matrix = np.array([[1, 1], [2, 2], [0, 3]], dtype=float)
+    assert pareto_mask(matrix).tolist() == [True, False, True]
+    ranked = rank_flights(RESULTS, RankingCriteria(pareto_only=True), top_k=10)
+    assert 400 not in [f['price'] for f in ranked]
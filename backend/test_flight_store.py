@@ -0,0 +1,69 @@
+import datetime
+import json
+import os
+import numpy as np
+from services.flight_store import FlightStore, open_store
+
+
+def _leg(id, origin, destination, departs, airline='Airline X', economy=100, seats=10):
+    return {
+        'id': id, 'airline': airline, 'flightNumber': f'AX{id}',
+        'departure': {'airport': origin, 'date': f'{departs}T08:00:00'},
+        'arrival': {'airport': destination, 'date': f'{departs}T10:00:00'},
+        'duration': '2h 00m', 'status': 'On Time',
+        'price': {'economy': economy, 'business': economy * 3},
+        'availableSeats': {'economy': seats, 'business': 2},
+    }
+
+
+def _on(offset):
+    """ISO date `offset` days from today; the store never returns flights that have departed."""
+    return (datetime.date.today() + datetime.timedelta(days=offset)).isoformat()
+
+
+LEGS = [
+    _leg('1', 'LHR', 'CDG', _on(30), economy=120),
+    _leg('2', 'LHR', 'CDG', _on(32), economy=90, seats=0),
+    _leg('3', 'LHR', 'CDG', _on(34), airline='Airline Y', economy=80),
+    _leg('4', 'LHR', 'JFK', _on(31), airline='Airline Y', economy=400),
+    _leg('5', 'CDG', 'LHR', _on(30), economy=110),
+]
+
+
+def test_query_filters_by_route_dates_cabin_price_seats_and_airline():
+    store = FlightStore.build(LEGS)
+    ids = lambda flights: [f['id'] for f in flights]
+    # Cheapest first; leg 2 has no economy seats left
+    assert ids(store.query('lhr', 'CDG', _on(30), _on(34))) == ['3', '1']
+    assert ids(store.query('LHR', 'CDG', _on(30), _on(33), min_seats=0)) == ['2', '1']
+    assert ids(store.query('LHR', 'CDG', _on(34))) == ['3']
+    assert ids(store.query('LHR', max_price=150)) == ['3', '1']
+    assert ids(store.query('LHR', cabin='business', max_price=300)) == ['3', '2']
+    assert ids(store.query(airline='airline y')) == ['3', '4']
+    assert ids(store.query(destination='LHR')) == ['5']
+    assert store.query('LHR', 'SIN') == [] and store.query('LHR', cabin='first') == []
+    flight = store.query('CDG', 'LHR', _on(30))[0]
+    assert flight['departure'] == {'airport': 'CDG', 'date': _on(30) + 'T08:00:00'}
+    assert (flight['price'], flight['availableSeats'], flight['cabin']) == (110.0, 10, 'economy')
+
+
+def test_persisted_store_is_memory_mapped_and_rebuilt_when_source_changes(tmp_path):
+    source = tmp_path / 'schedule.jsonl'
+    source.write_text('\n'.join(json.dumps(leg) for leg in LEGS[:3]))
+    directory = str(tmp_path / 'store')
+    store = open_store(str(source), directory)
+    assert isinstance(store.columns['price'], np.memmap)
+    assert [f['id'] for f in store.query('LHR', 'CDG', min_seats=0)] == ['3', '2', '1']
+
+    assert FlightStore.load(directory).source == store.source
+    source.write_text('\n'.join(json.dumps(leg) for leg in LEGS))
+    os.utime(source, (0, 0))
+    assert len(open_store(str(source), directory)) == len(LEGS)
+
+
+def test_query_never_returns_departed_flights():
+    store = FlightStore.build(LEGS + [_leg('6', 'LHR', 'CDG', _on(-3), economy=50)])
+    assert [f['id'] for f in store.query('LHR', 'CDG')] == ['3', '1']
+    assert [f['id'] for f in store.query('LHR')] == ['3', '1', '4']
+    assert store.query('LHR', 'CDG', _on(-3)) == []
+    assert [f['id'] for f in store.query('LHR', 'CDG', _on(-5), _on(30))] == ['1']
@@ -0,0 +1,49 @@
+import datetime
+from services.intent_parser import parse_flight_intent, parse_route
+
+TODAY = datetime.date(2026, 10, 18)
+AIRPORTS = {'london': 'LHR', 'paris': 'CDG', 'lhr': 'LHR', 'cdg': 'CDG', 'new york': 'JFK'}
+
+
+def parse(message):
+    return parse_flight_intent(message, TODAY, lambda name: AIRPORTS.get(name))
+
+
+def test_parses_codes_and_iso_date():
+    intent = parse("flights LHR to CDG 2026-11-02")
+    assert (intent.departure_id, intent.arrival_id) == ('LHR', 'CDG')
+    assert intent.departure_date == datetime.date(2026, 11, 2)
+    assert intent.type == 2 and intent.return_date is None
+
+
+def test_parses_city_names_and_round_trip():
+    intent = parse("Find me a flight from London to New York on 2 Nov returning Nov 9th")
+    assert (intent.departure_id, intent.arrival_id) == ('LHR', 'JFK')
+    assert intent.return_date == datetime.date(2026, 11, 9)
+    assert intent.type == 1
+    # Year-less dates in the past roll over to next year
+    assert parse("london to paris 3 march").departure_date == datetime.date(2027, 3, 3)
+
+
+def test_ambiguous_messages_fall_back():
+    assert parse("what about the day after?") is None
+    assert parse("London to Paris") is None  # no date
+    assert parse("London to Rome tomorrow") is None  # unknown city
+    assert parse("cheap hotels near London to Paris 2026-11-02 with a pool") is None
+    assert parse("round trip London to Paris 2026-11-02") is None  # missing return date
+
+
+def test_parses_route_with_or_without_dates():
+    route = lambda message: parse_route(message, TODAY, lambda name: AIRPORTS.get(name))
+    assert route("London to Paris") == ('LHR', 'CDG')
+    assert route("cheap flights from LHR to CDG on 2 Nov") == ('LHR', 'CDG')
+    assert route("hotels in Paris") is None and route("London to Atlantis") is None
+
+
+def test_follow_up_refinements():
+    from services.intent_parser import parse_follow_up
+    assert parse_follow_up("what about the day after?").date_shift == 1
+    assert parse_follow_up("two days earlier please").date_shift == -2
+    follow_up = parse_follow_up("only cheaper nonstop ones in the morning")
+    assert (follow_up.sort, follow_up.nonstop, follow_up.departure_window) == ('price', True, (5, 12))
+    assert parse_follow_up("how about Paris instead?") is None
@@ -0,0 +1,40 @@
+import datetime
+from langchain_core.load import dumps
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration
+from langchain_core.messages import AIMessage
+from services.llm_cache import LLMResponseCache
+
+TODAY = datetime.date.today().isoformat()
+LLM = "model=gpt-4o,functions=[search_flights]"
+
+
+def _prompt(text, today=TODAY):
+    return dumps([SystemMessage("You are a travel assistant."),
+                  HumanMessage(f"User: {text}\n\nToday's date: {today}\nUser location: unknown")])
+
+
+def _answer(text):
+    return [ChatGeneration(message=AIMessage(text))]
+
+
+def test_exact_hits_are_normalized_and_tied_to_date():
+    cache = LLMResponseCache(ttl=3600)
+    cache.update(_prompt("Cheapest flight London to Paris"), LLM, _answer("BA 304"))
+    assert cache.lookup(_prompt("cheapest  flight london to paris"), LLM)[0].text == "BA 304"
+    assert cache.lookup(_prompt("Cheapest flight London to Paris"), "model=gpt-4o-mini") is None
+    # Yesterday's prompts are not stored at all
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    cache.update(_prompt("hello", yesterday), LLM, _answer("hi"))
+    assert cache.lookup(_prompt("hello", yesterday), LLM) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_semantic_near_duplicates_are_verified():
+    cache = LLMResponseCache(semantic=True, threshold=0.5)
+    cache.update(_prompt("cheapest flight London to Paris"), LLM, _answer("BA 304"))
+    assert cache.lookup(_prompt("the cheapest flights from London to Paris please"), LLM) is None  # "from" is new
+    assert cache.lookup(_prompt("cheapest flights Londn to Paris"), LLM)[0].text == "BA 304"
+    assert cache.lookup(_prompt("cheapest flight Paris to London"), LLM) is None
+    assert cache.lookup(_prompt("cheapest flight London to Rome"), LLM) is None
+    assert cache.stats()['semantic_hits'] == 1
@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+from services.logging_config import configure_logging, shutdown_logging
+from services.tracing import Trace, current_trace
+
+
+def test_queued_json_logging_truncates_and_samples(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOG_MAX_MESSAGE_CHARS', '50')
+    monkeypatch.setenv('LOG_LARGE_SAMPLE_EVERY', '2')
+    path = tmp_path / 'app.log'
+    handler = configure_logging(level='INFO', log_path=str(path), force=True)
+    logger = logging.getLogger('test.logging')
+    token = current_trace.set(Trace('trace-1'))
+    try:
+        logger.debug("skipped %s", object())
+        logger.info("hello %s", 'world')
+        for _ in range(4):
+            logger.info("payload %s", 'x' * 500)
+        logger.error("big failure %s", 'y' * 500)
+    finally:
+        current_trace.reset(token)
+        shutdown_logging()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert records[0]['msg'] == 'hello world' and records[0]['trace_id'] == 'trace-1'
+    payloads = [r for r in records if r['msg'].startswith('payload')]
+    assert len(payloads) == 2 and handler.dropped == 2
+    assert payloads[0]['msg'].endswith('[truncated 458 chars]')
+    assert records[-1]['level'] == 'ERROR' and len(records[-1]['msg']) < 100
+
+
+def test_forked_worker_rotates_its_own_file(tmp_path, monkeypatch):
+    monkeypatch.delenv('LOG_WORKER_ID', raising=False)
+    path = tmp_path / 'app.log'
+    configure_logging(level='INFO', log_path=str(path), force=True)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logging.getLogger('test.worker').info("from worker")
+            shutdown_logging()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    logging.getLogger('test.worker').info("from parent")
+    shutdown_logging()
+
+    assert [json.loads(line)['msg'] for line in path.read_text().splitlines()] == ['from parent']
+    worker_log = tmp_path / f'app.{pid}.log'
+    assert [json.loads(line)['msg'] for line in worker_log.read_text().splitlines()] == ['from worker']
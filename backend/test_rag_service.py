@@ -0,0 +1,117 @@
+import json
+import os
+import numpy as np
+from services.rag_service import RAGService
+
+
+def _make_service(tmp_path, hotels):
+    service = RAGService(reload_interval=0)
+    path = tmp_path / 'hotels.json'
+    path.write_text(json.dumps({'hotels': hotels}), encoding='utf-8')
+    service.data_files = {'hotels': str(path)}
+    return service, path
+
+
+def test_search_uses_index_and_phrase():
+    """Whole-word and trailing-prefix queries match; other items are not returned."""
+    service = RAGService()
+    london = service.search_data('London Heath', 'flights', max_results=10)
+    assert london and all('London Heathrow' in json.dumps(f) for f in london)
+    assert [h['id'] for h in service.lookup('hotels', 'city', 'london')] == ['HOT001']
+
+
+def test_keyword_search_matches_substrings_like_a_full_scan():
+    """Phrases starting or ending inside a word match exactly the items a scan of the raw JSON finds."""
+    service = RAGService()
+    flights = service._load_data('flights')
+    for query in ('X100', 'ew York JFK', '08:00', 'London Heath', 'ondon', 'Airline', 'zzz'):
+        scanned = [f for f in flights if query.lower() in json.dumps(f).lower()][:3] or flights[:3]
+        assert service.search_data(query, 'flights') == scanned, query
+    assert [f['id'] for f in service.search_data('ew York JFK', 'flights')] == ['FL002', 'FL004']
+
+
+def test_hot_reload_on_mtime_change(tmp_path):
+    """Edits to a data file are picked up without recreating the service."""
+    service, path = _make_service(tmp_path, [{'id': 'H1', 'address': {'city': 'Rome'}}])
+    assert service.search_data('Rome', 'hotels')[0]['id'] == 'H1'
+
+    path.write_text(json.dumps({'hotels': [{'id': 'H2', 'address': {'city': 'Oslo'}}]}), encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+    assert service.search_data('Oslo', 'hotels')[0]['id'] == 'H2'
+    assert service.lookup('hotels', 'city', 'Rome') == []
+
+
+def test_bm25_ranks_and_returns_nothing_on_no_match(tmp_path):
+    """BM25 mode ranks by relevance, updates incrementally and has no blind fallback."""
+    service, path = _make_service(tmp_path, [
+        {'id': 'H1', 'name': 'Harbour Inn', 'address': {'city': 'Sydney'}},
+        {'id': 'H2', 'name': 'Thames View', 'address': {'city': 'London'}, 'amenities': ['Spa']},
+    ])
+    service.mode = 'bm25'
+    results = service.search_scored('cheap hotel in London next week', 'hotels')
+    assert [item['id'] for item, _ in results] == ['H2']
+    assert results[0][1] > 0
+    assert service.search_data('Reykjavik', 'hotels') == []
+
+    path.write_text(json.dumps({'hotels': [
+        {'id': 'H1', 'name': 'Harbour Inn', 'address': {'city': 'London'}},
+    ]}), encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+    assert [item['id'] for item, _ in service.search_scored('London', 'hotels')] == ['H1']
+
+
+
+def test_bm25_reload_leaves_previous_index_intact(tmp_path):
+    """A reload updates a copy of the BM25 index, not the one older stores still search."""
+    service, path = _make_service(tmp_path, [{'id': 'H1', 'address': {'city': 'Rome'}}])
+    service.mode = 'bm25'
+    old = service._get_store('hotels')
+    path.write_text(json.dumps({'hotels': [{'id': 'H2', 'address': {'city': 'Oslo'}}]}), encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+    new = service._get_store('hotels')
+    assert new.bm25 is not old.bm25
+    assert 'H1' in old.bm25 and 'H2' not in old.bm25
+    assert 'H2' in new.bm25 and 'H1' not in new.bm25
+
+def test_vector_index_persists_and_memory_maps(tmp_path):
+    """Vector mode builds the index once, then later instances only map the file."""
+    hotels = [
+        {'id': 'H1', 'name': 'Harbour Inn', 'address': {'city': 'Sydney'}},
+        {'id': 'H2', 'name': 'Thames View', 'address': {'city': 'London'}},
+    ]
+    service, _ = _make_service(tmp_path, hotels)
+    service.mode = 'vector'
+    service.vector_dir = str(tmp_path / 'index')
+    assert service.search_scored('londn', 'hotels')[0][0]['id'] == 'H2'
+
+    reloaded = RAGService(reload_interval=0, mode='vector')
+    reloaded.vector_dir = service.vector_dir
+    reloaded.data_files = service.data_files
+    assert reloaded.search_data('Sydney harbour', 'hotels', max_results=1)[0]['id'] == 'H1'
+    assert isinstance(reloaded._stores['hotels'].vectors.matrix, np.memmap)
+
+
+def test_vector_index_save_switches_sidecar_last(tmp_path):
+    """A reader never maps a matrix with another version's shape, and stale versions are removed."""
+    from services.vector_index import VectorIndex
+    directory = str(tmp_path)
+    small = VectorIndex(['a'], np.ones((1, 4), dtype=np.float32), 'test')
+    small.save(directory, 'hotels')
+    first = sorted(os.listdir(directory))
+    VectorIndex(['a', 'b', 'c'], np.ones((3, 4), dtype=np.float32), 'test').save(directory, 'hotels')
+    VectorIndex(['a', 'b'], np.ones((2, 4), dtype=np.float32), 'test').save(directory, 'hotels')
+    loaded = VectorIndex.load(directory, 'hotels')
+    assert loaded.keys == ['a', 'b'] and loaded.matrix.shape == (2, 4)
+    # Only the current and previous matrices remain
+    assert len([f for f in os.listdir(directory) if f.endswith('.f32')]) == 2
+    assert not set(first) & set(os.listdir(directory)) - {'hotels.json'}
+
+    # A matrix that does not match its sidecar is rejected instead of mis-mapped
+    with open(os.path.join(directory, 'hotels.json')) as f:
+        matrix = json.load(f)['files']['matrix']
+    with open(os.path.join(directory, matrix), 'ab') as f:
+        f.write(b'\0' * 16)
+    assert VectorIndex.load(directory, 'hotels') is None
@@ -0,0 +1,217 @@
+import asyncio
+import datetime
+import httpx
+from services.cache_backend import MemoryBackend, SQLiteBackend
+from services.flight_query_schema import FlightQuery
+from services.http_client import http_client
+from services.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimitedError, SearchScheduler
+from services.serpapi_flights_service import SerpApiFlightsService
+from services.upstream import CircuitOpenError, Upstream
+
+
+def test_interactive_first_and_users_interleaved():
+    scheduler = SearchScheduler('test', rate=50, burst=1)
+    order = []
+
+    def fetch(name):
+        async def run():
+            order.append(name)
+            return name
+        return run
+
+    async def scenario():
+        scheduler.bucket.try_acquire()  # drain the burst so everything queues
+        jobs = [scheduler.submit('bg', fetch('bg'), user='prefetch', priority=PRIORITY_BACKGROUND)]
+        jobs += [scheduler.submit(f'a{i}', fetch(f'a{i}'), user='alice') for i in range(3)]
+        jobs += [scheduler.submit('b0', fetch('b0'), user='bob')]
+        return await asyncio.gather(*jobs)
+
+    assert asyncio.run(scenario()) == ['bg', 'a0', 'a1', 'a2', 'b0']
+    # Bob is served before Alice's backlog, background work last
+    assert order == ['a0', 'b0', 'a1', 'a2', 'bg']
+
+
+def test_identical_searches_share_one_call_and_promote():
+    scheduler = SearchScheduler('test', rate=50, burst=1)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return 'result'
+
+    async def scenario():
+        scheduler.bucket.try_acquire()
+        background = asyncio.ensure_future(scheduler.submit('k', fetch, priority=PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        assert scheduler._jobs['k'].priority == PRIORITY_BACKGROUND
+        interactive = scheduler.submit('k', fetch, priority=PRIORITY_INTERACTIVE)
+        return await asyncio.gather(background, interactive)
+
+    assert asyncio.run(scenario()) == ['result', 'result']
+    assert len(calls) == 1
+
+
+def test_exhausted_quota_degrades_instead_of_erroring(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(200, json={'best_flights': [{'price': 100, 'total_duration': 60}]})
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    scheduler = SearchScheduler('test', rate=100, burst=10, quota=1, quota_period=3600)
+    service = SerpApiFlightsService(api_key='test', shared_cache=MemoryBackend(), scheduler=scheduler)
+    day = datetime.date.today() + datetime.timedelta(days=30)
+    first = FlightQuery(departure_id='LHR', arrival_id='CDG', type=2, departure_date=day)
+    second = FlightQuery(departure_id='LHR', arrival_id='AMS', type=2, departure_date=day)
+
+    async def scenario():
+        fresh = await service.asearch_query(first)
+        assert await service.asearch_query(first) == fresh  # cached, no quota used
+        degraded = await service.asearch_query(second)
+        assert degraded['degraded'] and 'try again' in degraded['error']
+        assert degraded['retry_after'] > 0
+        # Degraded results are not cached: the next call tries again
+        assert service.cache.get(second.cache_key()) is None
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+    assert scheduler.stats()['quota_remaining'] == 0
+
+
+def test_quota_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'shared.sqlite')
+    # One scheduler per worker process, each with its own connection to the shared counter
+    workers = [SearchScheduler('test', rate=100, burst=10, quota=5, shared=SQLiteBackend(path=path))
+               for _ in range(2)]
+    taken = [workers[i % 2].try_acquire() for i in range(8)]
+    assert taken == [True] * 5 + [False] * 3
+    assert workers[0].quota.remaining == 0 and workers[1].stats()['quota_used'] >= 5
+
+
+class _AsyncOnlyBackend(MemoryBackend):
+    """Fails if the shared quota counter is reached through the blocking methods."""
+
+    def get(self, key):
+        raise AssertionError("blocking shared cache read on the event loop")
+
+    def incr(self, key, amount, ttl):
+        raise AssertionError("blocking shared cache update on the event loop")
+
+    async def aget(self, key):
+        return MemoryBackend.get(self, key)
+
+    async def aincr(self, key, amount, ttl):
+        return MemoryBackend.incr(self, key, amount, ttl)
+
+
+def test_scheduler_uses_the_async_quota_counter():
+    scheduler = SearchScheduler('test', rate=100, burst=10, quota=2, shared=_AsyncOnlyBackend())
+
+    async def fetch():
+        return 'ok'
+
+    async def scenario():
+        assert [await scheduler.submit(i, fetch) for i in range(2)] == ['ok', 'ok']
+        try:
+            await scheduler.submit(2, fetch)
+        except RateLimitedError as e:
+            return e.reason
+
+    assert asyncio.run(scenario()) == 'test search quota exhausted'
+
+
+def test_user_fairness_state_is_pruned():
+    scheduler = SearchScheduler('test', rate=1000, burst=100)
+
+    async def fetch():
+        return 'ok'
+
+    async def scenario():
+        for i in range(50):
+            assert await scheduler.submit(('route', i), fetch, user=f'session-{i}') == 'ok'
+
+    asyncio.run(scenario())
+    assert len(scheduler._user_vtime) <= 1
+
+
+def test_cancelled_callers_cancel_the_upstream_call():
+    scheduler = SearchScheduler('test', rate=50, burst=1)
+    state = {'started': 0, 'cancelled': 0, 'done': 0}
+
+    async def fetch():
+        state['started'] += 1
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            state['cancelled'] += 1
+            raise
+        state['done'] += 1
+        return 'result'
+
+    async def scenario():
+        # Two callers share the running search: it survives until the last one gives up
+        first = asyncio.ensure_future(scheduler.submit('k', fetch))
+        second = asyncio.ensure_future(scheduler.submit('k', fetch))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert state == {'started': 1, 'cancelled': 0, 'done': 0}
+        second.cancel()
+        await asyncio.sleep(0.01)
+        assert state == {'started': 1, 'cancelled': 1, 'done': 0}
+        assert not scheduler._jobs
+
+        # A queued search whose caller is cancelled is never sent
+        scheduler.bucket.pause(0.02)
+        queued = asyncio.ensure_future(scheduler.submit('q', fetch))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.sleep(0.05)
+        assert state['started'] == 1 and not scheduler._jobs and not scheduler.queue_depth
+
+    asyncio.run(scenario())
+
+
+def test_open_breaker_does_not_spend_quota(monkeypatch):
+    calls = []
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: calls.append(1) or httpx.Response(200, json={}))))
+    scheduler = SearchScheduler('test', rate=100, burst=5, quota=5, quota_period=3600)
+    service = SerpApiFlightsService(api_key='test', shared_cache=MemoryBackend(), scheduler=scheduler)
+    service.upstream = Upstream('test', retries=0, failure_threshold=1, reset_timeout=60)
+    service.upstream.breaker.record_failure()
+    day = datetime.date.today() + datetime.timedelta(days=30)
+
+    async def scenario():
+        for arrival in ('CDG', 'AMS', 'FRA'):
+            query = FlightQuery(departure_id='LHR', arrival_id=arrival, type=2, departure_date=day)
+            try:
+                await service.asearch_query(query)
+            except CircuitOpenError:
+                pass
+
+    asyncio.run(scenario())
+    assert not calls
+    assert scheduler.stats()['quota_remaining'] == 5 and scheduler.bucket.tokens >= 4.9
+
+
+def test_upstream_retries_spend_quota(monkeypatch):
+    calls = []
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: calls.append(1) or httpx.Response(503, json={}))))
+    scheduler = SearchScheduler('test', rate=100, burst=5, quota=2, quota_period=3600)
+    service = SerpApiFlightsService(api_key='test', shared_cache=MemoryBackend(), scheduler=scheduler)
+    service.upstream = Upstream('test.metered', retries=5, backoff_base=0, failure_threshold=100)
+    query = FlightQuery(departure_id='LHR', arrival_id='CDG', type=2,
+                        departure_date=datetime.date.today() + datetime.timedelta(days=30))
+
+    async def scenario():
+        try:
+            await service.asearch_query(query)
+        except httpx.HTTPStatusError:
+            pass
+
+    asyncio.run(scenario())
+    # The first attempt and one retry fit in the quota; further retries are not sent
+    assert len(calls) == 2 and scheduler.stats()['quota_remaining'] == 0
@@ -0,0 +1,22 @@
+from services.session_store import SessionStore
+
+
+def test_lru_eviction_across_sessions():
+    store = SessionStore(max_sessions=2)
+    a = store.get_or_create('a')
+    store.get_or_create('b')
+    assert store.get('a') is a  # touch a, so b is least recently used
+    store.get_or_create('c')
+    assert store.get('b') is None and store.get('a') is a and store.evictions == 1
+    assert store.get_or_create().session_id not in ('a', 'b', 'c')
+
+
+def test_token_budget_summarizes_older_turns():
+    store = SessionStore(token_budget=100, keep_turns=2)
+    session = store.get_or_create('s')
+    for i in range(6):
+        store.add_turn(session, 'user', f"Question {i} about flights. " + "detail " * 30)
+    assert len(session.turns) == 2
+    assert session.summary and session.summary[-1] == "User: Question 3 about flights."
+    history = session.history()
+    assert history.startswith("Earlier in this conversation:") and "Question 5" in history
@@ -0,0 +1,46 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.language_models import FakeListChatModel
+from services.chat_events import LLMTracingCallbackHandler
+from services.tracing import MetricsRegistry, Trace, TracingMiddleware, current_trace, metrics, span
+
+
+def test_histogram_rendering():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.observe('latency_seconds', 0.05, route='/a')
+    registry.observe('latency_seconds', 0.5, route='/a')
+    registry.inc('hits_total', cache='flights')
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{route="/a"} 2' in text
+    assert 'hits_total{cache="flights"} 1' in text
+
+
+def test_middleware_propagates_trace_id_and_timings():
+    app = FastAPI()
+
+    @app.get('/work')
+    async def work():
+        with span('step', status=200):
+            pass
+        return {'trace': current_trace.get().trace_id}
+
+    client = TestClient(TracingMiddleware(app))
+    response = client.get('/work', headers={'X-Trace-Id': 'abc'})
+    assert response.json() == {'trace': 'abc'}
+    assert response.headers['x-trace-id'] == 'abc'
+    assert response.headers['server-timing'].startswith('step;dur=')
+    assert client.get('/work').headers['x-trace-id'] != 'abc'
+
+
+def test_llm_calls_become_spans():
+    trace = Trace()
+    token = current_trace.set(trace)
+    try:
+        llm = FakeListChatModel(responses=['hello'], callbacks=[LLMTracingCallbackHandler()])
+        assert llm.invoke('hi').content == 'hello'
+    finally:
+        current_trace.reset(token)
+    assert [s.name for s in trace.spans] == ['llm.call']
+    assert 'span="llm.call"' in metrics.render()
@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import time
+import httpx
+import pytest
+from services.cache_backend import MemoryBackend
+from services.flight_query_schema import FlightQuery
+from services.http_client import http_client
+from services.serpapi_flights_service import SerpApiFlightsService
+from services.upstream import CircuitOpenError, Upstream
+
+
+def _mock(monkeypatch, handler):
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def test_retries_transient_failures(monkeypatch):
+    statuses = [503, 429, 200]
+    _mock(monkeypatch, lambda request: httpx.Response(statuses.pop(0), json={}))
+    upstream = Upstream('test.retry', retries=2, backoff_base=0)
+    assert asyncio.run(upstream.get('https://example.test/a')).status_code == 200
+    assert statuses == [] and upstream.breaker.failures == 0
+
+
+def test_open_breaker_fails_fast_and_stale_results_are_served(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(200, json={'best_flights': [{'price': 100, 'total_duration': 60}]}) if len(calls) == 1 \
+            else httpx.Response(500, json={'error': 'down'})
+
+    _mock(monkeypatch, handler)
+    service = SerpApiFlightsService(api_key='test', shared_cache=MemoryBackend())
+    service.upstream = Upstream('test.serpapi', retries=0, failure_threshold=1, reset_timeout=60)
+    query = FlightQuery(departure_id='LHR', arrival_id='CDG', type=2,
+                        departure_date=datetime.date.today() + datetime.timedelta(days=30))
+
+    async def scenario():
+        fresh = await service.asearch_query(query)
+        service.cache.set(query.cache_key(), fresh, ttl=0)  # expire it, keeping it as stale
+        service.shared_cache = None
+        assert await service.asearch_query(query) == fresh  # upstream 500, served stale
+        assert service.upstream.breaker.state == 'open'
+        assert await service.asearch_query(query) == fresh  # breaker open, no request sent
+        service.cache.clear()
+        with pytest.raises(CircuitOpenError):
+            await service.asearch_query(query)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_hedged_request_cuts_tail_latency(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url)
+        if len(calls) == 1:
+            await asyncio.sleep(1.0)
+        return httpx.Response(200, json={'call': len(calls)})
+
+    _mock(monkeypatch, handler)
+    upstream = Upstream('test.hedge', hedge=True, max_timeout=5)
+    for _ in range(upstream.min_samples):
+        upstream.latency.add(0.02)
+    started = time.perf_counter()
+    response = asyncio.run(upstream.get('https://example.test/slow'))
+    assert response.json() == {'call': 2} and time.perf_counter() - started < 0.5
+
+
+def test_cancelled_probe_does_not_keep_breaker_open(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={})
+
+    _mock(monkeypatch, handler)
+    upstream = Upstream('test.probe', retries=0, failure_threshold=1, reset_timeout=0.01)
+    upstream.breaker.record_failure()
+
+    async def scenario():
+        await asyncio.sleep(0.02)
+        assert upstream.breaker.state == 'half_open'
+        probe = asyncio.create_task(upstream.get('https://example.test/a'))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        # The next call probes again and closes the breaker
+        assert (await upstream.get('https://example.test/a')).status_code == 200
+
+    asyncio.run(scenario())
+    assert upstream.breaker.state == 'closed'
+
+
+def test_retries_and_hedges_are_charged_to_the_budget(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url)
+        if request.url.path == '/slow':
+            await asyncio.sleep(0.2)
+        return httpx.Response(503 if request.url.path == '/down' else 200, json={})
+
+    _mock(monkeypatch, handler)
+    charges = []
+
+    async def budget():
+        charges.append(1)
+        return len(charges) <= 1
+
+    upstream = Upstream('test.budget', retries=3, backoff_base=0)
+    # One retry is paid for, the next is refused: the last failed response is returned
+    assert asyncio.run(upstream.get('https://example.test/down', budget=budget)).status_code == 503
+    assert len(calls) == 2 and len(charges) == 2
+
+    calls.clear()
+    hedging = Upstream('test.budget.hedge', hedge=True, max_timeout=5)
+    for _ in range(hedging.min_samples):
+        hedging.latency.add(0.02)
+    assert asyncio.run(hedging.get('https://example.test/slow', budget=budget)).status_code == 200
+    assert len(calls) == 1 and len(charges) == 3
@@ -0,0 +1,43 @@
+import asyncio
+import httpx
+from services.http_client import http_client
+from services.weather_service import WeatherService
+from services.geocode_cache import GeocodeCache, geocode_key
+
+CITIES = {'london,gb': (51.5073, -0.1277, 'London', 'GB'), 'paris': (48.8566, 2.3522, 'Paris', 'FR')}
+
+
+def _service(tmp_path, monkeypatch, calls):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "test")
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path.endswith('/direct'):
+            lat, lon, name, country = CITIES[request.url.params['q'].lower()]
+            return httpx.Response(200, json=[{'lat': lat, 'lon': lon, 'name': name, 'country': country}])
+        return httpx.Response(200, json={'timezone': 'UTC', 'current': {'temp': 12.5, 'weather': [{'main': 'Rain'}]}})
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    service = WeatherService()
+    service.geocode_cache = GeocodeCache(f"sqlite:///{tmp_path / 'geo.sqlite'}")
+    return service
+
+
+def test_geocode_key_normalization():
+    assert geocode_key(' Zürich ', 'CH') == geocode_key('zurich,ch') == 'zurich,ch'
+
+
+def test_batch_dedupes_and_caches(tmp_path, monkeypatch):
+    calls = []
+    service = _service(tmp_path, monkeypatch, calls)
+    results = asyncio.run(service.aget_weather_batch([('London', 'GB'), 'Paris', ('london', 'gb')]))
+    assert [r['location'] for r in results] == ['London, GB', 'Paris, FR', 'London, GB']
+    assert results[0]['data']['temperature'] == 12.5
+    assert len(calls) == 4  # one geocode and one One Call per unique city
+
+    # Weather is served from the TTL cache, coordinates from the persisted geocode cache
+    asyncio.run(service.aget_weather_by_city('Paris'))
+    assert len(calls) == 4
+    restarted = _service(tmp_path, monkeypatch, calls)
+    asyncio.run(restarted.aget_weather_by_city('London', 'GB'))
+    assert calls[4:] == ['/data/3.0/onecall']